@@ -22,6 +22,7 @@
     ],
     'data': [
         'security/ir.model.access.csv',
+        'data/ir_cron.xml',
     ],
     'post_init_hook': 'post_init_hook',
     'installable': True,
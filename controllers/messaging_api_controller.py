@@ -2,30 +2,329 @@
 
 import json
 import base64
+import hmac
+from psycopg2.errors import SerializationFailure
 from odoo import http
+from odoo.fields import Datetime
 from odoo.http import request, Response
 import logging
 
+from odoo.osv import expression
+from odoo.tools import config
+
+from ..tools import history
+from ..tools import metrics as api_metrics
+from ..tools import read_path
+from ..tools.admission import LongPollAdmission, TokenBucketLimiter
+from ..tools.metrics import registry as metrics
+from ..tools.partner_cache import partner_stubs
+
 _logger = logging.getLogger(__name__)
 
+# Payload keys each serializer can emit, and the named profiles clients may
+# request instead of an explicit ``fields`` list.
+FIELD_PROFILES = {
+    'thread': {
+        'minimal': ('id', 'name', 'type'),
+        'list': (
+            'id', 'name', 'type', 'participant_count', 'large_group',
+            'last_message', 'last_message_date', 'unread_count',
+        ),
+        'full': (
+            'id', 'name', 'type', 'participants', 'participant_count', 'large_group',
+            'last_message', 'last_message_date', 'unread_count',
+        ),
+    },
+    'message': {
+        'minimal': ('id', 'author_id', 'body', 'created_date'),
+        'list': ('id', 'author_id', 'author_name', 'body', 'message_type', 'is_read', 'created_date', 'attachments'),
+        'full': (
+            'id', 'author_id', 'author_partner_id', 'author_user_id', 'author_name', 'body',
+            'message_type', 'is_read', 'created_date', 'attachments', 'reactions',
+        ),
+    },
+    'partner': {
+        'minimal': ('partner_id', 'name'),
+        'list': ('id', 'name', 'partner_id', 'user_id'),
+        'full': ('id', 'name', 'partner_id', 'user_id', 'email', 'phone', 'mobile'),
+    },
+}
+
+# Key that is always returned so clients can reconcile sparse payloads.
+FIELD_PROFILE_KEYS = {
+    'thread': 'id',
+    'message': 'id',
+    'partner': 'partner_id',
+}
+
+# Token bucket (burst, tokens per second) per user for the chatty endpoints.
+RATE_LIMITS = {
+    'typing': (10, 1.0),
+    'presence': (5, 0.2),
+    'read': (30, 5.0),
+    'reaction': (20, 2.0),
+    'count': (10, 1.0),
+}
+
+rate_limiter = TokenBucketLimiter(RATE_LIMITS)
+
+POLL_MAX_THREADS = 100
+THREADS_PAGE_SIZE = 50
+THREADS_MAX_PAGE_SIZE = 200
+# Inbox order: latest activity first, threads without messages last.
+THREAD_ORDER = 'last_message_date desc nulls last, id desc'
+PARTICIPANTS_PAGE_SIZE = 100
+
+SMS_BULK_MAX_NUMBERS = 10000
+SMS_INBOUND_MAX_BATCH = 5000
+SMS_RECEIPT_MAX_BATCH = 10000
+
+PUSH_PLATFORMS = ('android', 'ios', 'web')
+
+PRESENCE_ONLINE_MINUTES = 5
+
+BOOTSTRAP_THREADS = 20
+BOOTSTRAP_MESSAGES = 20
+BOOTSTRAP_MAX_MESSAGES = 50
+
+# Partner payload keys served from the shared partner stub cache.
+PARTNER_STUB_KEYS = {'id', 'user_id', 'name', 'partner_id'}
+
+MESSAGE_AUTHOR_FIELDS = {
+    'author_id': 'id',
+    'author_partner_id': 'partner_id',
+    'author_user_id': 'user_id',
+    'author_name': 'name',
+}
+
 
 class MessagingAPIController(http.Controller):
 
-    def _serialize_partner(self, partner, include_contact=False):
+    def _resolve_fields(self, kind, fields=None, profile=None, default='full'):
+        """Return the set of payload keys requested for a serializer kind."""
+        profiles = FIELD_PROFILES[kind]
+        if fields:
+            if isinstance(fields, str):
+                fields = fields.split(',')
+            selected = {str(f).strip() for f in fields} & set(profiles['full'])
+        else:
+            profile = profile or default
+            if profile not in profiles:
+                raise ValueError(f"Unknown profile '{profile}' for {kind}")
+            selected = set(profiles[profile])
+        selected.add(FIELD_PROFILE_KEYS[kind])
+        return selected
+
+    def _check_rate_limit(self, group):
+        """Return an error payload when the user exhausted the bucket of a group."""
+        retry_after = rate_limiter.allow(request.env.uid, group)
+        if retry_after:
+            return {'error': 'Rate limit exceeded', 'retry_after': retry_after}
+        return None
+
+    def _replayed_record(self, model, scope, key):
+        """Claim an idempotency key; return the record an earlier request created with it, if any."""
+        res_id = request.env['messaging.idempotency.key'].sudo()._claim(scope, str(key))
+        return request.env[model].browse(res_id).exists()
+
+    def _read_watermarks(self):
+        """Return the caller's buffered read watermarks {thread_id: message_id}, read once per request."""
+        if not hasattr(request, '_messaging_read_watermarks'):
+            request._messaging_read_watermarks = request.env['messaging.read.receipt'].sudo()._watermarks(
+                request.env.user.partner_id.id
+            )
+        return request._messaging_read_watermarks
+
+    def _is_read(self, msg, user_partner_id):
+        """Return the read state the caller sees: stored, or covered by their buffered watermark."""
+        if msg.is_read:
+            return True
+        return msg.author_id.id != user_partner_id and msg.id <= self._read_watermarks().get(msg.thread_id.id, 0)
+
+    def _is_unread(self, msg, user_partner_id):
+        return msg.author_id.id != user_partner_id and not self._is_read(msg, user_partner_id)
+
+    def _long_poll_admission(self, client_id=None):
+        """Return the admission guard for a long poll of the current user."""
+        params = request.env['ir.config_parameter'].sudo()
+        default_global = max(1, config['workers'] // 2) if config['workers'] else 16
+        return LongPollAdmission(
+            request.env.cr,
+            request.env.uid,
+            client_id or request.httprequest.headers.get('X-Messaging-Client-Id'),
+            max_per_user=int(params.get_param('messaging_api.longpoll_max_per_user', 3)),
+            max_global=int(params.get_param('messaging_api.longpoll_max_global', default_global)),
+        )
+
+    def _refresh_poll_snapshot(self):
+        """End the poll's transaction so the next check sees what other workers committed."""
+        request.env.cr.commit()
+        request.env.invalidate_all()
+
+    def _poll_messages_response(self, multi, cursors, by_thread, count):
+        """Build the poll_messages payload for new messages grouped by thread."""
+        if not multi:
+            result = by_thread.get(next(iter(cursors)), [])
+            return {
+                'has_new': True,
+                'messages': result,
+                'count': len(result)
+            }
+        return {
+            'has_new': True,
+            'threads': [
+                {'thread_id': tid, 'messages': messages, 'count': len(messages)}
+                for tid, messages in by_thread.items()
+            ],
+            'count': count
+        }
+
+    def _threads_with_new_messages(self, cursors):
+        """Return the thread ids of ``cursors`` ({thread_id: last_message_id}) with newer messages."""
+        thread_ids = list(cursors)
+        request.env.cr.execute("""
+            SELECT DISTINCT m.thread_id
+              FROM messaging_message m
+              JOIN unnest(%s::int[], %s::int[]) AS c(thread_id, last_id)
+                ON m.thread_id = c.thread_id AND m.id > c.last_id
+        """, (thread_ids, [cursors[tid] for tid in thread_ids]))
+        return [row[0] for row in request.env.cr.fetchall()]
+
+    def _warm_partner_stubs(self, partner_ids):
+        """Load the stubs of a whole page of partners at once."""
+        partner_stubs.get_many(request.env, partner_ids)
+
+    def _serialize_partner(self, partner, include_contact=False, fields=None):
         """Return payload info using linked user id when available."""
-        user = partner.user_ids[:1]
-        data = {
-            'id': user.id if user else partner.id,
-            'name': partner.name,
-            'partner_id': partner.id,
-            'user_id': user.id if user else None,
+        if fields is None:
+            fields = set(FIELD_PROFILES['partner']['full' if include_contact else 'list'])
+
+        data = {}
+        if fields & PARTNER_STUB_KEYS:
+            stub = partner_stubs.get(request.env, partner.id) or {
+                'id': partner.id, 'user_id': None, 'name': partner.name, 'partner_id': partner.id,
+            }
+            for key in ('id', 'user_id', 'name', 'partner_id'):
+                if key in fields:
+                    data[key] = stub[key]
+        for contact_field in ('email', 'phone', 'mobile'):
+            if contact_field in fields:
+                data[contact_field] = partner[contact_field]
+        return data
+
+    def _serialize_attachment(self, attachment, base_url):
+        """Return the attachment stub embedded in message payloads."""
+        return {
+            'id': attachment.id,
+            'name': attachment.name,
+            'mimetype': attachment.mimetype,
+            'file_size': attachment.file_size,
+            'url': f"{base_url}/api/messaging/attachment/{attachment.id}",
+            'access_token': attachment.access_token
         }
-        if include_contact:
-            data.update({
-                'email': partner.email,
-                'phone': partner.phone,
-                'mobile': partner.mobile,
-            })
+
+    def _serialize_message(self, msg, user_partner_id, base_url, fields=None):
+        """Return the message payload, computing only the requested keys."""
+        if fields is None:
+            fields = set(FIELD_PROFILES['message']['full'])
+
+        data = {'id': msg.id}
+        author_fields = {
+            MESSAGE_AUTHOR_FIELDS[key] for key in fields if key in MESSAGE_AUTHOR_FIELDS
+        }
+        if author_fields:
+            author_info = self._serialize_partner(msg.author_id, fields=author_fields)
+            for key, partner_key in MESSAGE_AUTHOR_FIELDS.items():
+                if key in fields:
+                    data[key] = author_info[partner_key]
+        if 'body' in fields:
+            data['body'] = msg.body
+        if 'message_type' in fields:
+            data['message_type'] = msg.message_type
+        if 'is_read' in fields:
+            data['is_read'] = self._is_read(msg, user_partner_id)
+        if 'created_date' in fields:
+            data['created_date'] = msg.create_date.strftime('%Y-%m-%d %H:%M:%S')
+        if 'attachments' in fields:
+            data['attachments'] = [self._serialize_attachment(a, base_url) for a in msg.attachment_ids]
+        if 'reactions' in fields:
+            data['reactions'] = self._serialize_reactions(msg.mail_message_id, user_partner_id)
+        return data
+
+    def _browse_message(self, message_id):
+        """Return the message with ``message_id`` from the hot table or the archive, or None."""
+        message = request.env['messaging.message'].browse(message_id)
+        if message.exists():
+            return message
+        archived = request.env['messaging.message.archive'].browse(message_id)
+        return archived if archived.exists() else None
+
+    def _search_messages_with_archive(self, thread_id, limit, offset):
+        """Return a newest-first page of messages, continuing into the archive past the hot window."""
+        domain = [('thread_id', '=', thread_id)]
+        Message = request.env['messaging.message']
+        messages = Message.search(domain, order='create_date desc', limit=limit, offset=offset)
+        if len(messages) >= limit:
+            return messages
+
+        # Archived messages are all older than the hot ones, so the archive
+        # page starts where the hot rows run out.
+        hot_count = offset + len(messages) if messages else Message.search_count(domain)
+        archived = request.env['messaging.message.archive'].search(
+            domain, order='create_date desc', limit=limit - len(messages), offset=max(0, offset - hot_count)
+        )
+        return list(messages) + list(archived)
+
+    def _serialize_threads(self, threads, user_partner_id, fields, participant_fields=None):
+        """Return the summary payloads of a page of threads, with page-wide queries for the counters."""
+        if 'participants' in fields:
+            self._warm_partner_stubs(threads.filtered(lambda t: not t.large_group).partner_ids.ids)
+        unread_counts = {}
+        if 'unread_count' in fields and threads:
+            unread_counts = read_path.unread_counts(request.env.cr, user_partner_id, threads.ids)
+        return [
+            self._serialize_thread(
+                thread, user_partner_id, fields, participant_fields, unread_count=unread_counts.get(thread.id, 0),
+            )
+            for thread in threads
+        ]
+
+    def _serialize_thread(self, thread, user_partner_id, fields, participant_fields=None, unread_count=None):
+        """Return the thread summary payload, computing only the requested keys.
+
+        ``unread_count`` is the thread's count when the caller already read it
+        for the whole page; otherwise it is queried for this thread.
+        """
+        data = {'id': thread.id}
+        if 'name' in fields:
+            data['name'] = thread.name
+        if 'type' in fields:
+            data['type'] = thread.thread_type
+        if 'participants' in fields:
+            # Large groups only report a count; members are paged through /participants.
+            data['participants'] = [] if thread.large_group else [
+                self._serialize_partner(p, fields=participant_fields) for p in thread.partner_ids
+            ]
+        if 'participant_count' in fields:
+            data['participant_count'] = thread.participant_count
+        if 'large_group' in fields:
+            data['large_group'] = thread.large_group
+        if 'last_message' in fields or 'last_message_date' in fields:
+            last_message = request.env['messaging.message'].search(
+                [('thread_id', '=', thread.id)], order='create_date desc, id desc', limit=1
+            )
+            if not last_message and thread.last_message_date:
+                last_message = request.env['messaging.message.archive'].search(
+                    [('thread_id', '=', thread.id)], limit=1
+                )
+            if 'last_message' in fields:
+                data['last_message'] = last_message.body if last_message else ''
+            if 'last_message_date' in fields:
+                data['last_message_date'] = last_message.create_date.strftime('%Y-%m-%d %H:%M:%S') if last_message else ''
+        if 'unread_count' in fields:
+            if unread_count is None:
+                unread_count = read_path.unread_counts(request.env.cr, user_partner_id, thread.ids).get(thread.id, 0)
+            data['unread_count'] = unread_count
         return data
 
     def _normalize_partner_ids(self, identifiers):
@@ -70,81 +369,278 @@ class MessagingAPIController(http.Controller):
         if not mail_message:
             return []
 
+        return self._summarize_reactions(
+            [(reaction.content, reaction.partner_id.id) for reaction in mail_message.sudo().reaction_ids],
+            user_partner_id,
+        )
+
+    def _summarize_reactions(self, reactions, user_partner_id):
+        """Aggregate (content, partner_id) pairs into per-emoji counts."""
         summary = {}
-        for reaction in mail_message.sudo().reaction_ids:
-            info = summary.setdefault(reaction.content, {
-                'content': reaction.content,
+        for content, partner_id in reactions:
+            info = summary.setdefault(content, {
+                'content': content,
                 'count': 0,
                 'user_reacted': False,
             })
             info['count'] += 1
-            if reaction.partner_id and reaction.partner_id.id == user_partner_id:
+            if partner_id and partner_id == user_partner_id:
                 info['user_reacted'] = True
 
         return list(summary.values())
 
+    # =====================
+    # SQL read path
+    # =====================
+
+    def _read_path_enabled(self):
+        """Return True when read endpoints use the lean SQL projections."""
+        return request.env['ir.config_parameter'].sudo().get_param('messaging_api.read_path') == 'sql'
+
+    def _serialize_message_rows(self, cr, rows, user_partner_id, base_url, fields):
+        """Serialize message rows from the SQL read path like _serialize_message does records."""
+        attachments = reactions = {}
+        if 'attachments' in fields and rows:
+            attachment_field = request.env['messaging.message']._fields['attachment_ids']
+            attachments = read_path.message_attachments(cr, [row['id'] for row in rows], (
+                attachment_field.relation, attachment_field.column1, attachment_field.column2,
+            ))
+        mail_message_ids = [row['mail_message_id'] for row in rows if row['mail_message_id']]
+        if 'reactions' in fields and mail_message_ids:
+            reactions = read_path.message_reactions(cr, mail_message_ids)
+
+        author_fields = {
+            MESSAGE_AUTHOR_FIELDS[key] for key in fields if key in MESSAGE_AUTHOR_FIELDS
+        }
+        authors = {}
+        if author_fields:
+            self._warm_partner_stubs([row['author_id'] for row in rows])
+            # Browsed together so any ORM read is prefetched for the whole page.
+            authors = {p.id: p for p in request.env['res.partner'].browse({row['author_id'] for row in rows})}
+
+        result = []
+        for row in rows:
+            data = {'id': row['id']}
+            if author_fields:
+                author_info = self._serialize_partner(authors[row['author_id']], fields=author_fields)
+                for key, partner_key in MESSAGE_AUTHOR_FIELDS.items():
+                    if key in fields:
+                        data[key] = author_info[partner_key]
+            if 'body' in fields:
+                data['body'] = row['body']
+            if 'message_type' in fields:
+                data['message_type'] = row['message_type']
+            if 'is_read' in fields:
+                data['is_read'] = bool(row['is_read'])
+            if 'created_date' in fields:
+                data['created_date'] = row['create_date'].strftime('%Y-%m-%d %H:%M:%S')
+            if 'attachments' in fields:
+                data['attachments'] = [
+                    dict(attachment, url=f"{base_url}/api/messaging/attachment/{attachment['id']}")
+                    for attachment in attachments.get(row['id'], [])
+                ]
+            if 'reactions' in fields:
+                data['reactions'] = self._summarize_reactions(
+                    reactions.get(row['mail_message_id'], []), user_partner_id
+                )
+            result.append(data)
+        return result
+
+    def _get_threads_sql(self, user_partner_id, filters, limit, after, thread_fields, partner_fields):
+        """Return (payloads, cursor keys) of a page of threads; one extra key tells whether more follow."""
+        with read_path.read_cursor(request.env) as cr:
+            result, keys, _participants = self._thread_page_rows(
+                cr, user_partner_id, filters, limit, after, thread_fields, partner_fields
+            )
+        return result, keys
+
+    def _thread_page_rows(self, cr, user_partner_id, filters, limit, after, thread_fields, partner_fields,
+                          load_participants=False):
+        """Return (payloads, cursor keys, {thread_id: [partner_id]}) of a page of threads read on ``cr``.
+
+        Participant ids are read when the payloads list participants or
+        ``load_participants`` is set.
+        """
+        rows = read_path.thread_rows(
+            cr, user_partner_id, thread_fields, limit=limit + 1 if limit else None, after=after, **filters
+        )
+        keys = [(row['cursor_date'], row['id']) for row in rows]
+        rows = rows[:limit] if limit else rows
+        participants = {}
+        small_groups = [row['id'] for row in rows if not row['large_group']]
+        if ('participants' in thread_fields or load_participants) and small_groups:
+            participants = read_path.thread_participants(cr, small_groups)
+
+        partners = {}
+        if 'participants' in thread_fields and participants:
+            partner_ids = {pid for pids in participants.values() for pid in pids}
+            self._warm_partner_stubs(partner_ids)
+            partners = {p.id: p for p in request.env['res.partner'].browse(partner_ids)}
+
+        result = []
+        for row in rows:
+            data = {'id': row['id']}
+            if 'name' in thread_fields:
+                data['name'] = row['name']
+            if 'type' in thread_fields:
+                data['type'] = row['thread_type']
+            if 'participants' in thread_fields:
+                data['participants'] = [
+                    self._serialize_partner(partners[pid], fields=partner_fields)
+                    for pid in participants.get(row['id'], [])
+                ]
+            if 'participant_count' in thread_fields:
+                data['participant_count'] = row['participant_count']
+            if 'large_group' in thread_fields:
+                data['large_group'] = row['large_group']
+            if 'last_message' in thread_fields:
+                data['last_message'] = row['last_message'] or ''
+            if 'last_message_date' in thread_fields:
+                last_date = row['last_message_date']
+                data['last_message_date'] = last_date.strftime('%Y-%m-%d %H:%M:%S') if last_date else ''
+            if 'unread_count' in thread_fields:
+                data['unread_count'] = row['unread_count']
+            result.append(data)
+        return result, keys, participants
+
+    def _encode_thread_cursor(self, last_message_date, thread_id):
+        date = last_message_date.strftime('%Y-%m-%d %H:%M:%S.%f') if last_message_date else ''
+        return base64.urlsafe_b64encode(f"v1|{date}|{thread_id}".encode()).decode()
+
+    def _decode_thread_cursor(self, cursor):
+        """Return (last_message_date string or None, thread id) of a thread list cursor."""
+        try:
+            version, date, thread_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+            if version != 'v1':
+                raise ValueError
+            if date:
+                Datetime.to_datetime(date[:19])
+            return date or None, int(thread_id)
+        except (ValueError, TypeError, AttributeError, UnicodeDecodeError):
+            raise ValueError('Invalid cursor')
+
+    def _thread_cursor_domain(self, after):
+        """Domain of the threads that follow ``after`` in THREAD_ORDER."""
+        date, thread_id = after
+        if date is None:
+            return [('last_message_date', '=', False), ('id', '<', thread_id)]
+        return [
+            '|', '|',
+            ('last_message_date', '<', date),
+            '&', ('last_message_date', '=', date), ('id', '<', thread_id),
+            ('last_message_date', '=', False),
+        ]
+
     # =====================
     # Message APIs (Text Chat)
     # =====================
 
     @http.route('/api/messaging/threads', type='json', auth='user', methods=['POST'], csrf=False)
-    def get_threads(self, thread_type=None, **kwargs):
+    def get_threads(self, thread_type=None, fields=None, profile=None,
+                    participant_fields=None, participant_profile=None,
+                    limit=None, cursor=None, search=None, unread_only=False, **kwargs):
         """
-        Get all messaging threads for the current user
+        Get messaging threads for the current user, latest activity first
 
         Parameters:
         - thread_type: Optional filter by type (sms, chat, group)
+        - fields: Optional list of thread keys to return
+        - profile: Optional named profile (minimal, list, full; default full)
+        - participant_fields: Optional list of participant keys to return
+        - participant_profile: Optional participant profile (minimal, list, full; default list)
+        - limit: Optional page size (max 200); without limit or cursor every thread is returned
+        - cursor: Optional next_cursor of the previous page
+        - search: Optional text to look for in thread names
+        - unread_only: Optional, only threads with unread messages
 
         Returns:
         - threads: List of threads
+        - next_cursor: Cursor of the next page, null on the last one (paginated requests only)
         """
         try:
             user_partner_id = request.env.user.partner_id.id
-            domain = [('partner_ids', 'in', [user_partner_id])]
-
-            if thread_type:
-                domain.append(('thread_type', '=', thread_type))
-
-            threads = request.env['messaging.thread'].search(domain)
-
-            result = []
-            for thread in threads:
-                last_message = thread.message_ids[:1] if thread.message_ids else False
-                unread_count = len(thread.message_ids.filtered(lambda m: not m.is_read and m.author_id.id != user_partner_id))
-
-                result.append({
-                    'id': thread.id,
-                    'name': thread.name,
-                    'type': thread.thread_type,
-                    'participants': [self._serialize_partner(p) for p in thread.partner_ids],
-                    'last_message': last_message.body if last_message else '',
-                    'last_message_date': last_message.create_date.strftime('%Y-%m-%d %H:%M:%S') if last_message else '',
-                    'unread_count': unread_count
-                })
-
-            return {'threads': result}
+            thread_fields = self._resolve_fields('thread', fields, profile)
+            partner_fields = self._resolve_fields(
+                'partner', participant_fields, participant_profile, default='list'
+            )
+            after = self._decode_thread_cursor(cursor) if cursor else None
+            if limit or after:
+                limit = min(max(1, int(limit or THREADS_PAGE_SIZE)), THREADS_MAX_PAGE_SIZE)
+            else:
+                limit = None
+
+            if self._read_path_enabled():
+                result, keys = self._get_threads_sql(user_partner_id, {
+                    'thread_type': thread_type,
+                    'search': search,
+                    'unread_only': bool(unread_only),
+                }, limit, after, thread_fields, partner_fields)
+            else:
+                domain = [('partner_ids', 'in', [user_partner_id])]
+
+                if thread_type:
+                    domain.append(('thread_type', '=', thread_type))
+                if search:
+                    domain.append(('name', 'ilike', search))
+                if unread_only:
+                    unread = [('is_read', '=', False), ('author_id', '!=', user_partner_id)]
+                    for read_thread_id, watermark in self._read_watermarks().items():
+                        unread += ['|', ('thread_id', '!=', read_thread_id), ('id', '>', watermark)]
+                    domain.append(('message_ids', 'any', unread))
+                if after:
+                    domain = expression.AND([domain, self._thread_cursor_domain(after)])
+
+                threads = request.env['messaging.thread'].search(
+                    domain, order=THREAD_ORDER, limit=limit + 1 if limit else None
+                )
+                keys = [(thread.last_message_date, thread.id) for thread in threads]
+                threads = threads[:limit] if limit else threads
+                result = self._serialize_threads(threads, user_partner_id, thread_fields, partner_fields)
+
+            response = {'threads': result}
+            if limit:
+                response['next_cursor'] = (
+                    self._encode_thread_cursor(*keys[limit - 1]) if len(keys) > limit else None
+                )
+            return response
 
         except Exception as e:
             _logger.error(f"Error fetching threads: {str(e)}")
             return {'error': str(e)}
 
     @http.route('/api/messaging/thread/create', type='json', auth='user', methods=['POST'], csrf=False)
-    def create_thread(self, name=None, partner_ids=None, thread_type='chat', **kwargs):
+    def create_thread(self, name=None, partner_ids=None, thread_type='chat', idempotency_key=None, **kwargs):
         """
-        Create a new messaging thread
+        Create a new messaging thread, or return the existing direct chat
+
+        A chat between the same one or two participants is a direct chat: the
+        existing one is returned instead of creating a duplicate.
 
         Parameters:
         - name: Thread name
         - partner_ids: List of user or partner IDs to add as participants
         - thread_type: Type of thread (sms, chat, group)
+        - idempotency_key: Optional client key; a retry with the same key returns the original thread
 
         Returns:
         - thread_id: ID of created thread
+        - replayed: True when the thread was created by an earlier request with the same key
+        - existing: True when an existing direct chat was returned
         """
         try:
             if not name:
                 return {'error': 'name is required'}
 
+            if idempotency_key:
+                previous = self._replayed_record('messaging.thread', 'thread', idempotency_key)
+                if previous:
+                    return {
+                        'success': True,
+                        'thread_id': previous.id,
+                        'name': previous.name,
+                        'replayed': True,
+                    }
+
             user_partner_id = request.env.user.partner_id.id
 
             # Include current user in participants
@@ -156,11 +652,27 @@ class MessagingAPIController(http.Controller):
             if not normalized_partner_ids:
                 normalized_partner_ids = [user_partner_id]
 
+            if thread_type == 'chat':
+                existing = request.env['messaging.thread']._find_direct_chat(normalized_partner_ids)
+                if existing:
+                    if idempotency_key:
+                        request.env['messaging.idempotency.key'].sudo()._remember(
+                            'thread', str(idempotency_key), existing.id
+                        )
+                    return {
+                        'success': True,
+                        'thread_id': existing.id,
+                        'name': existing.name,
+                        'existing': True,
+                    }
+
             thread = request.env['messaging.thread'].create({
                 'name': name,
                 'thread_type': thread_type,
                 'partner_ids': [(6, 0, normalized_partner_ids)]
             })
+            if idempotency_key:
+                request.env['messaging.idempotency.key'].sudo()._remember('thread', str(idempotency_key), thread.id)
 
             return {
                 'success': True,
@@ -168,12 +680,16 @@ class MessagingAPIController(http.Controller):
                 'name': thread.name
             }
 
+        except SerializationFailure:
+            # A concurrent request holds the same idempotency key; Odoo retries
+            # this one, which then replays the committed result.
+            raise
         except Exception as e:
             _logger.error(f"Error creating thread: {str(e)}")
             return {'error': str(e)}
 
     @http.route('/api/messaging/messages', type='json', auth='user', methods=['POST'], csrf=False)
-    def get_messages(self, thread_id=None, limit=50, offset=0, **kwargs):
+    def get_messages(self, thread_id=None, limit=50, offset=0, fields=None, profile=None, **kwargs):
         """
         Get messages from a thread
 
@@ -181,6 +697,8 @@ class MessagingAPIController(http.Controller):
         - thread_id: ID of the thread
         - limit: Number of messages to fetch (default 50)
         - offset: Offset for pagination (default 0)
+        - fields: Optional list of message keys to return
+        - profile: Optional named profile (minimal, list, full; default full)
 
         Returns:
         - messages: List of messages
@@ -192,6 +710,7 @@ class MessagingAPIController(http.Controller):
             thread_id = int(thread_id)
             limit = int(limit) if limit else 50
             offset = int(offset) if offset else 0
+            message_fields = self._resolve_fields('message', fields, profile)
 
             user_partner_id = request.env.user.partner_id.id
             _logger.info(
@@ -202,45 +721,38 @@ class MessagingAPIController(http.Controller):
                 user_partner_id,
             )
 
+            base_url = request.env['ir.config_parameter'].sudo().get_param('web.base.url')
+
+            if self._read_path_enabled():
+                with read_path.read_cursor(request.env) as cr:
+                    exists, thread_name = read_path.member_thread(cr, thread_id, user_partner_id)
+                    if not exists:
+                        return {'error': 'Thread not found'}
+                    if thread_name is None:
+                        return {'error': 'Access denied'}
+                    rows = read_path.message_rows(cr, thread_id, user_partner_id, limit, offset)
+                    result = self._serialize_message_rows(cr, rows, user_partner_id, base_url, message_fields)
+                return {
+                    'messages': result,
+                    'thread_id': thread_id,
+                    'thread_name': thread_name
+                }
+
             thread = request.env['messaging.thread'].browse(thread_id)
             if not thread.exists():
                 return {'error': 'Thread not found'}
 
             # Check if user is participant
-            if user_partner_id not in thread.partner_ids.ids:
+            if not thread._is_member(user_partner_id):
                 return {'error': 'Access denied'}
 
-            messages = request.env['messaging.message'].search([
-                ('thread_id', '=', thread_id)
-            ], order='create_date desc', limit=limit, offset=offset)
+            messages = self._search_messages_with_archive(thread_id, limit, offset)
+            self._warm_partner_stubs([msg.author_id.id for msg in messages])
 
-            base_url = request.env['ir.config_parameter'].sudo().get_param('web.base.url')
-
-            result = []
-            for msg in messages:
-                author_info = self._serialize_partner(msg.author_id)
-                attachments = [{
-                    'id': a.id,
-                    'name': a.name,
-                    'mimetype': a.mimetype,
-                    'file_size': a.file_size,
-                    'url': f"{base_url}/api/messaging/attachment/{a.id}",
-                    'access_token': a.access_token
-                } for a in msg.attachment_ids]
-
-                result.append({
-                    'id': msg.id,
-                    'author_id': author_info['id'],
-                    'author_partner_id': author_info['partner_id'],
-                    'author_user_id': author_info['user_id'],
-                    'author_name': author_info['name'],
-                    'body': msg.body,
-                    'message_type': msg.message_type,
-                    'is_read': msg.is_read,
-                    'created_date': msg.create_date.strftime('%Y-%m-%d %H:%M:%S'),
-                    'attachments': attachments,
-                    'reactions': self._serialize_reactions(msg.mail_message_id, user_partner_id),
-                })
+            result = [
+                self._serialize_message(msg, user_partner_id, base_url, message_fields)
+                for msg in messages
+            ]
 
             response = {
                 'messages': result,
@@ -259,7 +771,7 @@ class MessagingAPIController(http.Controller):
             return {'error': str(e)}
 
     @http.route('/api/messaging/message/send', type='json', auth='user', methods=['POST'], csrf=False)
-    def send_message(self, thread_id=None, body=None, attachment_ids=None, **kwargs):
+    def send_message(self, thread_id=None, body=None, attachment_ids=None, client_msg_id=None, **kwargs):
         """
         Send a message to a thread
 
@@ -267,10 +779,12 @@ class MessagingAPIController(http.Controller):
         - thread_id: ID of the thread
         - body: Message body
         - attachment_ids: Optional list of attachment IDs
+        - client_msg_id: Optional client-generated id; a retry with the same id returns the original message
 
         Returns:
         - success: Boolean
         - message_id: ID of created message
+        - replayed: True when the message was created by an earlier request with the same client_msg_id
         """
         try:
             if not thread_id or not body:
@@ -278,9 +792,9 @@ class MessagingAPIController(http.Controller):
 
             thread_id = int(thread_id)
             _logger.info(
-                "MessagingAPI: send_message request thread_id=%s body=%s attachments=%s",
+                "MessagingAPI: send_message request thread_id=%s body_length=%s attachments=%s",
                 thread_id,
-                body,
+                len(body),
                 attachment_ids,
             )
 
@@ -291,9 +805,19 @@ class MessagingAPIController(http.Controller):
 
             # Check if user is participant
             user_partner_id = request.env.user.partner_id.id
-            if user_partner_id not in thread.partner_ids.ids:
+            if not thread._is_member(user_partner_id):
                 return {'error': 'Access denied'}
 
+            if client_msg_id:
+                previous = self._replayed_record('messaging.message', 'message', client_msg_id)
+                if previous:
+                    return {
+                        'success': True,
+                        'message_id': previous.id,
+                        'created_date': previous.create_date.strftime('%Y-%m-%d %H:%M:%S'),
+                        'replayed': True,
+                    }
+
             message_vals = {
                 'thread_id': thread_id,
                 'author_id': user_partner_id,
@@ -305,6 +829,8 @@ class MessagingAPIController(http.Controller):
                 message_vals['attachment_ids'] = [(6, 0, attachment_ids)]
 
             message = request.env['messaging.message'].create(message_vals)
+            if client_msg_id:
+                request.env['messaging.idempotency.key'].sudo()._remember('message', str(client_msg_id), message.id)
 
             response = {
                 'success': True,
@@ -319,6 +845,10 @@ class MessagingAPIController(http.Controller):
             )
             return response
 
+        except SerializationFailure:
+            # A concurrent request holds the same idempotency key; Odoo retries
+            # this one, which then replays the committed result.
+            raise
         except Exception as e:
             _logger.error(f"Error sending message: {str(e)}")
             return {'error': str(e)}
@@ -334,20 +864,23 @@ class MessagingAPIController(http.Controller):
         - action: add, remove, or toggle (default toggle)
         """
         try:
+            limited = self._check_rate_limit('reaction')
+            if limited:
+                return limited
+
             if not message_id or not content:
                 return {'error': 'message_id and content are required'}
 
-            message = request.env['messaging.message'].browse(int(message_id))
-            if not message.exists():
+            message = self._browse_message(int(message_id))
+            if not message:
                 return {'error': 'Message not found'}
 
             user_partner_id = request.env.user.partner_id.id
-            if user_partner_id not in message.thread_id.partner_ids.ids:
+            if not message.thread_id._is_member(user_partner_id):
                 return {'error': 'Access denied'}
 
-            mail_message = message.mail_message_id
-            if not mail_message:
-                return {'error': 'Message not synchronized with Discuss'}
+            # Reactions live on the Discuss message: the first one gives the thread its channel if it has none.
+            mail_message = message.sudo()._ensure_mail_message()
 
             mail_message_sudo = mail_message.sudo()
             reaction_model = request.env['mail.message.reaction'].sudo()
@@ -374,6 +907,9 @@ class MessagingAPIController(http.Controller):
                 'reactions': self._serialize_reactions(mail_message_sudo, user_partner_id),
             }
 
+        except SerializationFailure:
+            # The thread's Discuss channel was created concurrently; let Odoo retry.
+            raise
         except Exception as e:
             _logger.error(f"Error processing reaction: {str(e)}")
             return {'error': str(e)}
@@ -383,6 +919,10 @@ class MessagingAPIController(http.Controller):
         """
         Mark message(s) as read
 
+        Reading a message also acknowledges every earlier message of its
+        thread. The receipt is buffered and applied in batches; the caller's
+        own read endpoints see it immediately.
+
         Parameters:
         - message_id: Single message ID
         - message_ids: List of message IDs
@@ -391,6 +931,10 @@ class MessagingAPIController(http.Controller):
         - success: Boolean
         """
         try:
+            limited = self._check_rate_limit('read')
+            if limited:
+                return limited
+
             if message_id:
                 message_ids = [int(message_id)]
             elif message_ids:
@@ -398,14 +942,20 @@ class MessagingAPIController(http.Controller):
             else:
                 return {'error': 'message_id or message_ids required'}
 
-            messages = request.env['messaging.message'].browse(message_ids)
-            messages.mark_as_read()
+            # Only the caller's watermark per thread is raised here; the flush
+            # cron applies it to the messages in one batched write.
+            marked_count = request.env['messaging.read.receipt'].sudo()._buffer(
+                request.env.user.partner_id.id, message_ids
+            )
 
             return {
                 'success': True,
-                'marked_count': len(messages)
+                'marked_count': marked_count
             }
 
+        except SerializationFailure:
+            # The flush cron claimed this watermark; let Odoo retry the request.
+            raise
         except Exception as e:
             _logger.error(f"Error marking messages as read: {str(e)}")
             return {'error': str(e)}
@@ -420,8 +970,24 @@ class MessagingAPIController(http.Controller):
         - unread_by_thread: Unread count per thread
         """
         try:
+            limited = self._check_rate_limit('count')
+            if limited:
+                return limited
+
             user_partner_id = request.env.user.partner_id.id
 
+            if self._read_path_enabled():
+                with read_path.read_cursor(request.env) as cr:
+                    rows = read_path.unread_by_thread(cr, user_partner_id)
+                return {
+                    'unread_count': sum(row['unread_count'] for row in rows),
+                    'unread_by_thread': [{
+                        'thread_id': row['id'],
+                        'thread_name': row['name'],
+                        'unread_count': row['unread_count']
+                    } for row in rows]
+                }
+
             threads = request.env['messaging.thread'].search([
                 ('partner_ids', 'in', [user_partner_id])
             ])
@@ -431,7 +997,7 @@ class MessagingAPIController(http.Controller):
 
             for thread in threads:
                 unread_messages = thread.message_ids.filtered(
-                    lambda m: not m.is_read and m.author_id.id != user_partner_id
+                    lambda m: self._is_unread(m, user_partner_id)
                 )
                 count = len(unread_messages)
 
@@ -452,6 +1018,264 @@ class MessagingAPIController(http.Controller):
             _logger.error(f"Error fetching unread count: {str(e)}")
             return {'error': str(e)}
 
+    # =====================
+    # Cold Start
+    # =====================
+
+    @http.route('/api/messaging/bootstrap', type='json', auth='user', methods=['POST'], csrf=False)
+    def bootstrap(self, thread_limit=BOOTSTRAP_THREADS, message_limit=BOOTSTRAP_MESSAGES, thread_type=None,
+                  fields=None, profile=None, message_fields=None, message_profile=None,
+                  participant_fields=None, participant_profile=None, **kwargs):
+        """
+        Return everything an app needs to render the inbox on launch, in one round trip
+
+        Parameters:
+        - thread_limit: Number of threads, latest activity first (default 20, max 200)
+        - message_limit: Latest messages per thread (default 20, max 50, 0 for none)
+        - thread_type: Optional filter by type (sms, chat, group)
+        - fields / profile: Optional thread keys or profile (default list)
+        - message_fields / message_profile: Optional message keys or profile (default list)
+        - participant_fields / participant_profile: Optional participant keys or profile (default list)
+
+        Returns:
+        - threads: Thread summaries, each with its latest messages (newest first) under messages
+        - next_cursor: Cursor to continue the thread list with /api/messaging/threads
+        - unread_count: Total unread messages
+        - unread_by_thread: Unread count per thread, all threads included
+        - presence: Status of the participants of the returned threads
+        - sync_token: Token for /api/messaging/sync to fetch what changed after this snapshot
+        """
+        try:
+            user_partner_id = request.env.user.partner_id.id
+            thread_fields = self._resolve_fields('thread', fields, profile, default='list')
+            partner_fields = self._resolve_fields(
+                'partner', participant_fields, participant_profile, default='list'
+            )
+            message_fields = self._resolve_fields('message', message_fields, message_profile, default='list')
+            thread_limit = min(max(1, int(thread_limit or BOOTSTRAP_THREADS)), THREADS_MAX_PAGE_SIZE)
+            message_limit = BOOTSTRAP_MESSAGES if message_limit is None else int(message_limit)
+            message_limit = min(max(0, message_limit), BOOTSTRAP_MAX_MESSAGES)
+            base_url = request.env['ir.config_parameter'].sudo().get_param('web.base.url')
+
+            # A single read snapshot: the sync token is read first so that
+            # anything committed meanwhile is delivered again by the next sync.
+            with read_path.read_cursor(request.env) as cr:
+                head = read_path.change_head(cr)
+                threads, keys, participants = self._thread_page_rows(
+                    cr, user_partner_id, {'thread_type': thread_type}, thread_limit, None,
+                    thread_fields, partner_fields, load_participants=True,
+                )
+                messages = {}
+                if message_limit and threads:
+                    rows = read_path.latest_message_rows(
+                        cr, [thread['id'] for thread in threads], user_partner_id, message_limit
+                    )
+                    serialized = self._serialize_message_rows(cr, rows, user_partner_id, base_url, message_fields)
+                    for row, data in zip(rows, serialized):
+                        messages.setdefault(row['thread_id'], []).append(data)
+                unread_rows = read_path.unread_by_thread(cr, user_partner_id)
+                partner_ids = {pid for pids in participants.values() for pid in pids} - {user_partner_id}
+                last_seen = read_path.partner_last_seen(cr, partner_ids) if partner_ids else {}
+
+            for thread in threads:
+                thread['messages'] = messages.get(thread['id'], [])
+
+            return {
+                'threads': threads,
+                'next_cursor': (
+                    self._encode_thread_cursor(*keys[thread_limit - 1]) if len(keys) > thread_limit else None
+                ),
+                'unread_count': sum(row['unread_count'] for row in unread_rows),
+                'unread_by_thread': [{
+                    'thread_id': row['id'],
+                    'thread_name': row['name'],
+                    'unread_count': row['unread_count']
+                } for row in unread_rows],
+                'presence': [
+                    dict(partner_id=partner_id, **self._presence_info(last_seen[partner_id]))
+                    for partner_id in sorted(last_seen)
+                ],
+                'sync_token': self._encode_sync_token(head),
+            }
+
+        except Exception as e:
+            _logger.error(f"Error bootstrapping client: {str(e)}")
+            return {'error': str(e)}
+
+    # =====================
+    # SMS APIs
+    # =====================
+
+    def _bearer_token_matches(self, token):
+        """Compare the request's bearer token in constant time."""
+        given = request.httprequest.headers.get('Authorization') or ''
+        return hmac.compare_digest(given.encode(), f'Bearer {token}'.encode())
+
+    def _check_sms_webhook_token(self):
+        """Return an error payload unless the request carries the SMS webhook token."""
+        token = request.env['ir.config_parameter'].sudo().get_param('messaging_api.sms_webhook_token')
+        if not token:
+            return {'error': 'SMS webhook is disabled'}
+        if not self._bearer_token_matches(token):
+            return {'error': 'Unauthorized'}
+        return None
+
+    @http.route('/api/messaging/sms/send', type='json', auth='user', methods=['POST'], csrf=False)
+    def send_sms(self, phone_number=None, message=None, **kwargs):
+        """
+        Queue an SMS to one phone number
+
+        Parameters:
+        - phone_number: Recipient phone number
+        - message: SMS text
+
+        Returns:
+        - success: Boolean
+        - message_id: ID of the queued message
+        - thread_id: ID of the SMS thread for this number
+        - status: SMS status (pending until the dispatcher sends it)
+        """
+        try:
+            if not phone_number or not message:
+                return {'error': 'phone_number and message are required'}
+
+            sms = request.env['messaging.message']._queue_sms([phone_number], message)
+            if not sms:
+                return {'error': 'Invalid phone number'}
+
+            return {
+                'success': True,
+                'message_id': sms.id,
+                'thread_id': sms.thread_id.id,
+                'status': sms.sms_status
+            }
+
+        except Exception as e:
+            _logger.error(f"Error sending SMS: {str(e)}")
+            return {'error': str(e)}
+
+    @http.route('/api/messaging/sms/send_bulk', type='json', auth='user', methods=['POST'], csrf=False)
+    def send_sms_bulk(self, phone_numbers=None, message=None, **kwargs):
+        """
+        Queue the same SMS to many phone numbers
+
+        Parameters:
+        - phone_numbers: List of recipient phone numbers (max 10000)
+        - message: SMS text
+
+        Returns:
+        - success: Boolean
+        - message_ids: IDs of the queued messages, in recipient order
+        - count: Number of queued messages
+        """
+        try:
+            if not phone_numbers or not message:
+                return {'error': 'phone_numbers and message are required'}
+            if not isinstance(phone_numbers, (list, tuple)):
+                return {'error': 'phone_numbers must be a list'}
+            if len(phone_numbers) > SMS_BULK_MAX_NUMBERS:
+                return {'error': f'At most {SMS_BULK_MAX_NUMBERS} phone numbers per request'}
+
+            # Campaign sends skip the per-message Discuss mirror.
+            sms = request.env['messaging.message']._queue_sms(phone_numbers, message, mirror=False)
+
+            return {
+                'success': True,
+                'message_ids': sms.ids,
+                'count': len(sms)
+            }
+
+        except Exception as e:
+            _logger.error(f"Error sending bulk SMS: {str(e)}")
+            return {'error': str(e)}
+
+    @http.route('/api/messaging/sms/receive', type='json', auth='none', methods=['POST'], csrf=False)
+    def receive_sms(self, messages=None, phone_number=None, message=None, provider_message_id=None,
+                    gateway=None, **kwargs):
+        """
+        Webhook for inbound SMS, single or batched
+
+        Requires the header "Authorization: Bearer <token>" matching the
+        messaging_api.sms_webhook_token system parameter. Disabled when unset.
+
+        Parameters:
+        - messages: List of {phone_number, message, provider_message_id} (max 5000)
+        - phone_number, message, provider_message_id: A single message, instead of messages
+        - gateway: Optional gateway name stored on the messages
+
+        Returns:
+        - success: Boolean
+        - message_ids: IDs of the newly stored messages
+        - duplicates: Number of messages already received before
+        - invalid: Indexes of messages with no valid number or body
+        """
+        try:
+            denied = self._check_sms_webhook_token()
+            if denied:
+                return denied
+
+            if messages is None:
+                messages = [{
+                    'phone_number': phone_number,
+                    'message': message,
+                    'provider_message_id': provider_message_id,
+                }]
+            if not isinstance(messages, list) or not all(isinstance(m, dict) for m in messages):
+                return {'error': 'messages must be a list of objects'}
+            if len(messages) > SMS_INBOUND_MAX_BATCH:
+                return {'error': f'At most {SMS_INBOUND_MAX_BATCH} messages per request'}
+
+            result = request.env['messaging.message'].sudo()._receive_sms(messages, gateway=gateway)
+
+            response = {'success': True}
+            response.update(result)
+            if phone_number and len(result['message_ids']) == 1:
+                response['message_id'] = result['message_ids'][0]
+            return response
+
+        except Exception as e:
+            _logger.error(f"Error receiving SMS: {str(e)}")
+            return {'error': str(e)}
+
+    @http.route('/api/messaging/sms/status', type='json', auth='none', methods=['POST'], csrf=False)
+    def sms_delivery_receipts(self, receipts=None, **kwargs):
+        """
+        Webhook for batched SMS delivery receipts
+
+        Requires the same bearer token as /api/messaging/sms/receive.
+
+        Parameters:
+        - receipts: List of {provider_message_id, status, error} (max 10000).
+          status is one of queued, accepted, sent, delivered, undelivered,
+          failed, rejected or expired
+
+        Returns:
+        - success: Boolean
+        - updated: Number of messages whose status changed
+        - ignored: Receipts for unknown messages or older than the current status
+        - deferred: Provider message ids busy in another transaction, to be resent
+        - invalid: Indexes of receipts with no provider id or an unknown status
+        """
+        try:
+            denied = self._check_sms_webhook_token()
+            if denied:
+                return denied
+
+            if not isinstance(receipts, list) or not all(isinstance(r, dict) for r in receipts):
+                return {'error': 'receipts must be a list of objects'}
+            if len(receipts) > SMS_RECEIPT_MAX_BATCH:
+                return {'error': f'At most {SMS_RECEIPT_MAX_BATCH} receipts per request'}
+
+            result = request.env['messaging.message'].sudo()._apply_sms_receipts(receipts)
+
+            response = {'success': True}
+            response.update(result)
+            return response
+
+        except Exception as e:
+            _logger.error(f"Error applying SMS delivery receipts: {str(e)}")
+            return {'error': str(e)}
+
     # =====================
     # Attachment APIs
     # =====================
@@ -479,7 +1303,9 @@ class MessagingAPIController(http.Controller):
                 )
 
             file_name = kwargs.get('name', file_data.filename)
-            file_content = base64.b64encode(file_data.read())
+            raw_content = file_data.read()
+            metrics.inc('messaging_api_attachment_bytes_in_total', len(raw_content))
+            file_content = base64.b64encode(raw_content)
 
             attachment_vals = {
                 'name': file_name,
@@ -552,6 +1378,7 @@ class MessagingAPIController(http.Controller):
                 )
 
             file_content = base64.b64decode(attachment.datas)
+            metrics.inc('messaging_api_attachment_bytes_out_total', len(file_content))
 
             headers = [
                 ('Content-Type', attachment.mimetype or 'application/octet-stream'),
@@ -589,10 +1416,10 @@ class MessagingAPIController(http.Controller):
             # Check if user is the owner or has access
             user_partner_id = request.env.user.partner_id.id
 
-            # Find if attachment is linked to any message
-            messages = request.env['messaging.message'].search([
-                ('attachment_ids', 'in', [attachment_id])
-            ])
+            # Find if attachment is linked to any message, archived ones included
+            domain = [('attachment_ids', 'in', [attachment_id])]
+            messages = list(request.env['messaging.message'].search(domain))
+            messages += list(request.env['messaging.message.archive'].search(domain))
 
             # Check if user is author of any message with this attachment
             if not any(msg.author_id.id == user_partner_id for msg in messages):
@@ -628,15 +1455,9 @@ class MessagingAPIController(http.Controller):
 
             base_url = request.env['ir.config_parameter'].sudo().get_param('web.base.url')
 
-            return {
-                'id': attachment.id,
-                'name': attachment.name,
-                'mimetype': attachment.mimetype,
-                'file_size': attachment.file_size,
-                'url': f"{base_url}/api/messaging/attachment/{attachment.id}",
-                'access_token': attachment.access_token,
-                'create_date': attachment.create_date.strftime('%Y-%m-%d %H:%M:%S')
-            }
+            info = self._serialize_attachment(attachment, base_url)
+            info['create_date'] = attachment.create_date.strftime('%Y-%m-%d %H:%M:%S')
+            return info
 
         except Exception as e:
             _logger.error(f"Error fetching attachment info: {str(e)}")
@@ -682,17 +1503,23 @@ class MessagingAPIController(http.Controller):
             return {'error': str(e)}
 
     @http.route('/api/messaging/thread/participants/<int:thread_id>', type='json', auth='user', methods=['POST'], csrf=False)
-    def get_thread_participants(self, thread_id, **kwargs):
+    def get_thread_participants(self, thread_id, fields=None, profile=None, limit=None, offset=0, **kwargs):
         """
         Get participants of a thread
 
         Parameters:
         - thread_id: ID of the thread
+        - fields: Optional list of participant keys to return
+        - profile: Optional named profile (minimal, list, full; default full)
+        - limit: Optional page size (default: all participants, 100 for large groups)
+        - offset: Optional offset for pagination (default 0)
 
         Returns:
         - participants: List of participants
+        - total: Number of participants in the thread
         """
         try:
+            partner_fields = self._resolve_fields('partner', fields, profile)
             thread = request.env['messaging.thread'].browse(thread_id)
 
             if not thread.exists():
@@ -700,17 +1527,33 @@ class MessagingAPIController(http.Controller):
 
             # Check if user is participant
             user_partner_id = request.env.user.partner_id.id
-            if user_partner_id not in thread.partner_ids.ids:
+            if not thread._is_member(user_partner_id):
                 return {'error': 'Access denied'}
 
+            if limit is None and thread.large_group:
+                limit = PARTICIPANTS_PAGE_SIZE
+            offset = max(0, int(offset or 0))
+            if limit is None:
+                partners = thread.partner_ids[offset:]
+            else:
+                limit = max(1, int(limit))
+                request.env['messaging.thread'].flush_model(['partner_ids'])
+                partners = request.env['res.partner'].browse(
+                    read_path.participant_page(request.env.cr, thread.id, limit, offset)
+                )
+
+            self._warm_partner_stubs(partners.ids)
             result = []
-            for partner in thread.partner_ids:
-                result.append(self._serialize_partner(partner, include_contact=True))
+            for partner in partners:
+                result.append(self._serialize_partner(partner, fields=partner_fields))
 
             return {
                 'thread_id': thread_id,
                 'thread_name': thread.name,
-                'participants': result
+                'participants': result,
+                'total': thread.participant_count,
+                'limit': limit,
+                'offset': offset,
             }
 
         except Exception as e:
@@ -740,7 +1583,7 @@ class MessagingAPIController(http.Controller):
 
             # Check if user is participant
             user_partner_id = request.env.user.partner_id.id
-            if user_partner_id not in thread.partner_ids.ids:
+            if not thread._is_member(user_partner_id):
                 return {'error': 'Access denied'}
 
             normalized_ids = self._normalize_partner_ids([partner_id])
@@ -748,7 +1591,7 @@ class MessagingAPIController(http.Controller):
                 return {'error': 'Participant not found'}
 
             participant_partner_id = normalized_ids[0]
-            if participant_partner_id not in thread.partner_ids.ids:
+            if not thread._is_member(participant_partner_id):
                 thread.write({
                     'partner_ids': [(4, participant_partner_id)]
                 })
@@ -773,126 +1616,146 @@ class MessagingAPIController(http.Controller):
     # =====================
 
     @http.route('/api/messaging/poll/messages', type='json', auth='user', methods=['POST'], csrf=False)
-    def poll_messages(self, thread_id=None, last_message_id=None, timeout=30, **kwargs):
+    def poll_messages(self, thread_id=None, last_message_id=None, timeout=30, fields=None, profile=None,
+                      client_id=None, thread_ids=None, last_message_ids=None, **kwargs):
         """
         Long polling endpoint for real-time messages
-        Waits up to timeout seconds for new messages
+        Waits up to timeout seconds for new messages in one or several threads
 
         Parameters:
         - thread_id: ID of the thread to monitor
         - last_message_id: ID of the last message client has (optional)
+        - thread_ids: IDs of several threads to monitor at once (max 100), instead of thread_id
+        - last_message_ids: Map of thread ID to the last message ID client has, for thread_ids
         - timeout: Maximum seconds to wait (default 30, max 60)
+        - fields: Optional list of message keys to return
+        - profile: Optional named profile (minimal, list, full; default full)
+        - client_id: Optional client identifier; a newer poll with the same id replaces this one
 
         Returns:
-        - messages: List of new messages
+        - messages: List of new messages (thread_id polls)
+        - threads: List of {thread_id, messages, count} with new messages (thread_ids polls)
         - has_new: Boolean indicating if there are new messages
+        - retry_after: Seconds to wait before polling again, when the server is saturated
+        - superseded: True when a newer poll from the same client took over
         """
         try:
-            if not thread_id:
-                return {'error': 'thread_id is required'}
+            multi = thread_ids is not None
+            if multi:
+                if not isinstance(thread_ids, list) or not thread_ids:
+                    return {'error': 'thread_ids must be a non-empty list'}
+                if len(thread_ids) > POLL_MAX_THREADS:
+                    return {'error': f'At most {POLL_MAX_THREADS} threads per poll'}
+                last_message_ids = last_message_ids or {}
+                if not isinstance(last_message_ids, dict):
+                    return {'error': 'last_message_ids must be an object'}
+                cursors = {
+                    int(tid): int(last_message_ids.get(str(tid)) or last_message_ids.get(tid) or 0)
+                    for tid in thread_ids
+                }
+            else:
+                if not thread_id:
+                    return {'error': 'thread_id is required'}
+                cursors = {int(thread_id): int(last_message_id) if last_message_id else 0}
 
-            thread_id = int(thread_id)
             timeout = min(int(timeout) if timeout else 30, 60)  # Max 60 seconds
-            last_message_id = int(last_message_id) if last_message_id else 0
+            message_fields = self._resolve_fields('message', fields, profile)
 
             user_partner_id = request.env.user.partner_id.id
             _logger.info(
-                "MessagingAPI: poll_messages start thread_id=%s last_message_id=%s timeout=%s user_partner=%s",
-                thread_id,
-                last_message_id,
+                "MessagingAPI: poll_messages start threads=%s timeout=%s user_partner=%s",
+                cursors,
                 timeout,
                 user_partner_id,
             )
 
-            thread = request.env['messaging.thread'].browse(thread_id)
-            if not thread.exists():
-                return {'error': 'Thread not found'}
-
-            # Check if user is participant
-            if user_partner_id not in thread.partner_ids.ids:
-                return {'error': 'Access denied'}
-
-            import time
-            start_time = time.time()
-            poll_interval = 1  # Check every 1 second
-
-            base_url = request.env['ir.config_parameter'].sudo().get_param('web.base.url')
-
-            while (time.time() - start_time) < timeout:
-                # Search for new messages
-                domain = [
-                    ('thread_id', '=', thread_id),
-                ]
-                if last_message_id:
-                    domain.append(('id', '>', last_message_id))
-
-                new_messages = request.env['messaging.message'].search(
-                    domain,
-                    order='create_date asc'
-                )
-
-                if new_messages:
-                    result = []
-                    for msg in new_messages:
-                        author_info = self._serialize_partner(msg.author_id)
-                        attachments = [{
-                            'id': a.id,
-                            'name': a.name,
-                            'mimetype': a.mimetype,
-                            'file_size': a.file_size,
-                            'url': f"{base_url}/api/messaging/attachment/{a.id}",
-                            'access_token': a.access_token
-                        } for a in msg.attachment_ids]
-
-                        result.append({
-                            'id': msg.id,
-                            'author_id': author_info['id'],
-                            'author_partner_id': author_info['partner_id'],
-                            'author_user_id': author_info['user_id'],
-                            'author_name': author_info['name'],
-                            'body': msg.body,
-                            'message_type': msg.message_type,
-                            'is_read': msg.is_read,
-                            'created_date': msg.create_date.strftime('%Y-%m-%d %H:%M:%S'),
-                            'attachments': attachments,
-                            'reactions': self._serialize_reactions(msg.mail_message_id, user_partner_id),
-                        })
-
-                    response = {
-                        'has_new': True,
-                        'messages': result,
-                        'count': len(result)
-                    }
-                    _logger.info(
-                        "MessagingAPI: poll_messages new_messages=%s thread_id=%s last_message_id=%s",
-                        len(result),
-                        thread_id,
-                        last_message_id,
-                    )
-                    return response
-
-                # Wait before checking again
-                time.sleep(poll_interval)
-
-            # Timeout reached, no new messages
-            response = {
-                'has_new': False,
-                'messages': [],
-                'count': 0
-            }
-            _logger.info(
-                "MessagingAPI: poll_messages timeout thread_id=%s last_message_id=%s",
-                thread_id,
-                last_message_id,
-            )
-            return response
+            # Existence and membership for the whole set in one query
+            allowed = set(request.env['messaging.thread'].search([
+                ('id', 'in', list(cursors)),
+                ('partner_ids', 'in', [user_partner_id]),
+            ]).ids)
+            denied = [tid for tid in cursors if tid not in allowed]
+            if denied:
+                if not multi:
+                    thread = request.env['messaging.thread'].browse(denied[0])
+                    return {'error': 'Access denied' if thread.exists() else 'Thread not found'}
+                return {'error': 'Access denied', 'thread_ids': denied}
+
+            def empty(**extra):
+                response = {'has_new': False, 'count': 0}
+                response.update({'threads': []} if multi else {'messages': []})
+                response.update(extra)
+                return response
+
+            with self._long_poll_admission(client_id) as admission:
+                if admission.rejected:
+                    return empty(retry_after=admission.retry_after)
+
+                with metrics.track('messaging_api_longpoll_waiters', route='/api/messaging/poll/messages'):
+                    import time
+                    start_time = time.time()
+                    poll_interval = 1  # Check every 1 second
+
+                    base_url = request.env['ir.config_parameter'].sudo().get_param('web.base.url')
+
+                    sql_read_path = self._read_path_enabled()
+
+                    while (time.time() - start_time) < timeout:
+                        if sql_read_path:
+                            with read_path.read_cursor(request.env) as cr:
+                                rows = read_path.new_message_rows(cr, cursors, user_partner_id)
+                                serialized = self._serialize_message_rows(
+                                    cr, rows, user_partner_id, base_url, message_fields
+                                )
+                            if rows:
+                                by_thread = {}
+                                for row, payload in zip(rows, serialized):
+                                    by_thread.setdefault(row['thread_id'], []).append(payload)
+                                return self._poll_messages_response(multi, cursors, by_thread, len(rows))
+                            changed = []
+                        else:
+                            changed = self._threads_with_new_messages(cursors)
+                        if changed:
+                            domain = expression.OR([
+                                [('thread_id', '=', tid), ('id', '>', cursors[tid])] for tid in changed
+                            ])
+                            new_messages = request.env['messaging.message'].search(
+                                domain,
+                                order='create_date asc, id asc'
+                            )
+
+                            self._warm_partner_stubs(new_messages.author_id.ids)
+                            by_thread = {}
+                            for msg in new_messages:
+                                by_thread.setdefault(msg.thread_id.id, []).append(
+                                    self._serialize_message(msg, user_partner_id, base_url, message_fields)
+                                )
+                            _logger.info(
+                                "MessagingAPI: poll_messages new_messages=%s threads=%s",
+                                len(new_messages),
+                                list(by_thread),
+                            )
+
+                            return self._poll_messages_response(multi, cursors, by_thread, len(new_messages))
+
+                        # A newer poll from the same client replaces this one
+                        if admission.superseded():
+                            return empty(superseded=True)
+
+                        # Wait before checking again
+                        time.sleep(poll_interval)
+                        self._refresh_poll_snapshot()
+
+                    # Timeout reached, no new messages
+                    _logger.info("MessagingAPI: poll_messages timeout threads=%s", cursors)
+                    return empty()
 
         except Exception as e:
             _logger.error(f"Error in long polling: {str(e)}")
             return {'error': str(e)}
 
     @http.route('/api/messaging/poll/updates', type='json', auth='user', methods=['POST'], csrf=False)
-    def poll_all_updates(self, last_check=None, timeout=30, **kwargs):
+    def poll_all_updates(self, last_check=None, timeout=30, client_id=None, **kwargs):
         """
         Long polling for all updates across all threads
         Returns unread counts, new messages, typing indicators
@@ -900,73 +1763,350 @@ class MessagingAPIController(http.Controller):
         Parameters:
         - last_check: Last check timestamp (ISO format)
         - timeout: Maximum seconds to wait (default 30, max 60)
+        - client_id: Optional client identifier; a newer poll with the same id replaces this one
 
         Returns:
         - has_updates: Boolean
         - unread_count: Total unread count
         - threads_with_updates: List of threads that have updates
+        - retry_after: Seconds to wait before polling again, when the server is saturated
+        - superseded: True when a newer poll from the same client took over
         """
         try:
             timeout = min(int(timeout) if timeout else 30, 60)
             user_partner_id = request.env.user.partner_id.id
 
-            import time
-            from datetime import datetime
-            start_time = time.time()
-            poll_interval = 2
+            with self._long_poll_admission(client_id) as admission:
+                if admission.rejected:
+                    return {
+                        'has_updates': False,
+                        'unread_count': 0,
+                        'threads_with_updates': [],
+                        'retry_after': admission.retry_after
+                    }
 
-            # Get initial unread count
-            threads = request.env['messaging.thread'].search([
-                ('partner_ids', 'in', [user_partner_id])
-            ])
+                with metrics.track('messaging_api_longpoll_waiters', route='/api/messaging/poll/updates'):
+                    import time
+                    from datetime import datetime
+                    start_time = time.time()
+                    poll_interval = 2
+
+                    # Get initial unread count
+                    threads = request.env['messaging.thread'].search([
+                        ('partner_ids', 'in', [user_partner_id])
+                    ])
+
+                    initial_unread = sum([
+                        len(t.message_ids.filtered(lambda m: self._is_unread(m, user_partner_id)))
+                        for t in threads
+                    ])
+
+                    while (time.time() - start_time) < timeout:
+                        # Check for new unread messages
+                        current_unread = sum([
+                            len(t.message_ids.filtered(lambda m: self._is_unread(m, user_partner_id)))
+                            for t in threads
+                        ])
+
+                        if current_unread != initial_unread:
+                            # Something changed, return updates
+                            threads_with_updates = []
+                            for thread in threads:
+                                unread_messages = thread.message_ids.filtered(
+                                    lambda m: self._is_unread(m, user_partner_id)
+                                )
+                                if unread_messages:
+                                    threads_with_updates.append({
+                                        'thread_id': thread.id,
+                                        'thread_name': thread.name,
+                                        'unread_count': len(unread_messages),
+                                        'last_message': unread_messages[0].body if unread_messages else '',
+                                        'last_message_date': unread_messages[0].create_date.strftime('%Y-%m-%d %H:%M:%S') if unread_messages else ''
+                                    })
+
+                            return {
+                                'has_updates': True,
+                                'unread_count': current_unread,
+                                'threads_with_updates': threads_with_updates
+                            }
+
+                        if admission.superseded():
+                            return {
+                                'has_updates': False,
+                                'unread_count': initial_unread,
+                                'threads_with_updates': [],
+                                'superseded': True
+                            }
+
+                        time.sleep(poll_interval)
+                        self._refresh_poll_snapshot()
+
+                    # Timeout, no updates
+                    return {
+                        'has_updates': False,
+                        'unread_count': initial_unread,
+                        'threads_with_updates': []
+                    }
 
-            initial_unread = sum([
-                len(t.message_ids.filtered(lambda m: not m.is_read and m.author_id.id != user_partner_id))
-                for t in threads
-            ])
+        except Exception as e:
+            _logger.error(f"Error in poll updates: {str(e)}")
+            return {'error': str(e)}
 
-            while (time.time() - start_time) < timeout:
-                # Check for new unread messages
-                current_unread = sum([
-                    len(t.message_ids.filtered(lambda m: not m.is_read and m.author_id.id != user_partner_id))
-                    for t in threads
-                ])
+    # =====================
+    # Delta Sync
+    # =====================
 
-                if current_unread != initial_unread:
-                    # Something changed, return updates
-                    threads_with_updates = []
-                    for thread in threads:
-                        unread_messages = thread.message_ids.filtered(
-                            lambda m: not m.is_read and m.author_id.id != user_partner_id
-                        )
-                        if unread_messages:
-                            threads_with_updates.append({
-                                'thread_id': thread.id,
-                                'thread_name': thread.name,
-                                'unread_count': len(unread_messages),
-                                'last_message': unread_messages[0].body if unread_messages else '',
-                                'last_message_date': unread_messages[0].create_date.strftime('%Y-%m-%d %H:%M:%S') if unread_messages else ''
-                            })
+    def _encode_sync_token(self, xact_id, change_id=0):
+        """Encode a change log position; (horizon, 0) stands for every change below the horizon."""
+        return base64.urlsafe_b64encode(f"v2:{xact_id}:{change_id}".encode()).decode()
 
-                    return {
-                        'has_updates': True,
-                        'unread_count': current_unread,
-                        'threads_with_updates': threads_with_updates
-                    }
+    def _decode_sync_token(self, sync_token):
+        """Return the (transaction, change id) position of a token, None for a v1 token (a reset)."""
+        try:
+            version, *position = base64.urlsafe_b64decode(sync_token.encode()).decode().split(':')
+            if version == 'v1' and len(position) == 1:
+                int(position[0])
+                return None
+            if version != 'v2' or len(position) != 2:
+                raise ValueError
+            return int(position[0]), int(position[1])
+        except (ValueError, TypeError, UnicodeDecodeError):
+            raise ValueError('Invalid sync token')
+
+    @http.route('/api/messaging/sync', type='json', auth='user', methods=['POST'], csrf=False)
+    def sync(self, sync_token=None, limit=500, fields=None, profile=None, **kwargs):
+        """
+        Return what changed in the user's threads since a sync token
 
-                time.sleep(poll_interval)
+        Parameters:
+        - sync_token: Token returned by the previous sync (omit for the first sync)
+        - limit: Maximum number of changes to consume per page (default 500, max 5000)
+        - fields: Optional list of message keys to return
+        - profile: Optional named message profile (minimal, list, full; default full)
 
-            # Timeout, no updates
+        Returns:
+        - sync_token: Token to send on the next call
+        - has_more: Boolean, call again with the new token to fetch the next page
+        - reset: Boolean, the token is missing or expired and the client must refetch everything
+        - threads: New or changed thread summaries
+        - messages: New or changed messages
+        - read_state: Messages whose read state changed
+        - reactions: Messages whose reactions changed
+        - membership: Participants added to or removed from threads
+        - deleted: Thread and message ids that are gone
+        """
+        try:
+            limit = min(int(limit) if limit else 500, 5000)
+            message_fields = self._resolve_fields('message', fields, profile)
+            Change = request.env['messaging.change'].sudo()
+
+            since = self._decode_sync_token(sync_token) if sync_token else None
+            horizon = Change._horizon()
+            if since is None or since < Change._pruned_position():
+                return {
+                    'sync_token': self._encode_sync_token(horizon),
+                    'has_more': False,
+                    'reset': True,
+                }
+
+            user_partner_id = request.env.user.partner_id.id
+            member_thread_ids = set(request.env['messaging.thread'].search([
+                ('partner_ids', 'in', [user_partner_id])
+            ]).ids)
+
+            # Changes of transactions still running are left for a later call.
+            page = Change._read_since(since, horizon, member_thread_ids, user_partner_id, limit + 1)
+            has_more = len(page) > limit
+            page = page[:limit]
+            changes = [change for change, _position in page]
+
+            thread_ids, message_ids, read_ids, reaction_ids = set(), set(), set(), set()
+            deleted_thread_ids, deleted_message_ids = set(), set()
+            membership = {}
+            for change in changes:
+                change_type = change.change_type
+                if change_type == 'thread':
+                    thread_ids.add(change.thread_id)
+                elif change_type == 'thread_delete':
+                    deleted_thread_ids.add(change.thread_id)
+                elif change_type in ('member_add', 'member_remove'):
+                    if change.partner_id == user_partner_id:
+                        thread_ids.add(change.thread_id)
+                        continue
+                    info = membership.setdefault(change.thread_id, {'added': set(), 'removed': set()})
+                    if change_type == 'member_add':
+                        info['added'].add(change.partner_id)
+                        info['removed'].discard(change.partner_id)
+                    else:
+                        info['removed'].add(change.partner_id)
+                        info['added'].discard(change.partner_id)
+                elif change_type == 'message':
+                    message_ids.add(change.res_id)
+                elif change_type == 'message_delete':
+                    deleted_message_ids.add(change.res_id)
+                elif change_type == 'read':
+                    read_ids.add(change.res_id)
+                elif change_type == 'reaction':
+                    reaction_ids.add(change.res_id)
+
+            # Threads the user lost access to are reported as deleted.
+            deleted_thread_ids |= thread_ids - member_thread_ids
+            deleted_thread_ids -= member_thread_ids
+            thread_ids &= member_thread_ids
+
+            thread_fields = self._resolve_fields('thread', profile='list')
+            partner_fields = self._resolve_fields('partner', profile='list')
+            threads = request.env['messaging.thread'].browse(sorted(thread_ids))
+            thread_result = self._serialize_threads(threads, user_partner_id, thread_fields, partner_fields)
+
+            touched_ids = (message_ids | read_ids | reaction_ids) - deleted_message_ids
+            hot = request.env['messaging.message'].search([
+                ('id', 'in', list(touched_ids)),
+                ('thread_id', 'in', list(member_thread_ids)),
+            ])
+            # Messages archived since the change are still there, not deleted.
+            archived = request.env['messaging.message.archive'].search([
+                ('id', 'in', list(touched_ids - set(hot.ids))),
+                ('thread_id', 'in', list(member_thread_ids)),
+            ])
+            messages = sorted(list(hot) + list(archived), key=lambda msg: msg.id)
+            deleted_message_ids |= touched_ids - {msg.id for msg in messages}
+            self._warm_partner_stubs((hot.author_id | archived.author_id).ids)
+
+            base_url = request.env['ir.config_parameter'].sudo().get_param('web.base.url')
+            message_result, read_state, reactions = [], [], []
+            for msg in messages:
+                payload = {}
+                if msg.id in message_ids:
+                    payload = self._serialize_message(msg, user_partner_id, base_url, message_fields)
+                    payload['thread_id'] = msg.thread_id.id
+                    message_result.append(payload)
+                if msg.id in read_ids and 'is_read' not in payload:
+                    read_state.append({
+                        'id': msg.id,
+                        'thread_id': msg.thread_id.id,
+                        'is_read': self._is_read(msg, user_partner_id),
+                    })
+                if msg.id in reaction_ids and 'reactions' not in payload:
+                    reactions.append({
+                        'message_id': msg.id,
+                        'thread_id': msg.thread_id.id,
+                        'reactions': self._serialize_reactions(msg.mail_message_id, user_partner_id),
+                    })
+
+            membership_result = [{
+                'thread_id': thread_id,
+                'added_partner_ids': sorted(info['added']),
+                'removed_partner_ids': sorted(info['removed']),
+            } for thread_id, info in membership.items() if thread_id in member_thread_ids]
+
+            if has_more:
+                next_position = page[-1][1]
+            else:
+                # Every change below the horizon has been read.
+                next_position = max(since, (horizon, 0))
             return {
-                'has_updates': False,
-                'unread_count': initial_unread,
-                'threads_with_updates': []
+                'sync_token': self._encode_sync_token(*next_position),
+                'has_more': has_more,
+                'reset': False,
+                'threads': thread_result,
+                'messages': message_result,
+                'read_state': read_state,
+                'reactions': reactions,
+                'membership': membership_result,
+                'deleted': {
+                    'thread_ids': sorted(deleted_thread_ids),
+                    'message_ids': sorted(deleted_message_ids),
+                },
             }
 
         except Exception as e:
-            _logger.error(f"Error in poll updates: {str(e)}")
+            _logger.error(f"Error in sync: {str(e)}")
             return {'error': str(e)}
 
+    # =====================
+    # History Export / Import
+    # =====================
+
+    @http.route('/api/messaging/export', type='http', auth='user', methods=['GET'], csrf=False)
+    def export_history(self, thread_id=None, date_from=None, date_to=None, **kwargs):
+        """
+        Stream message history as NDJSON (one JSON object per line)
+
+        Parameters (query string):
+        - thread_id: Optional thread to export; default all threads of the user
+        - date_from: Optional inclusive lower bound on the message date (YYYY-MM-DD[ HH:MM:SS])
+        - date_to: Optional exclusive upper bound on the message date
+
+        Administrators export every thread; other users only threads they belong to.
+
+        Returns:
+        - application/x-ndjson stream, oldest message first
+        """
+        try:
+            user = request.env.user
+            all_threads = user.has_group('base.group_system')
+            thread_id = int(thread_id) if thread_id else None
+            if thread_id and not all_threads:
+                thread = request.env['messaging.thread'].browse(thread_id)
+                if not thread.exists() or not thread._is_member(user.partner_id.id):
+                    return Response(json.dumps({'error': 'Access denied'}), status=403,
+                                    content_type='application/json')
+
+            date_from = Datetime.to_datetime(date_from) if date_from else None
+            date_to = Datetime.to_datetime(date_to) if date_to else None
+            attachment_field = request.env['messaging.message']._fields['attachment_ids']
+
+            stream = history.export_ndjson(
+                request.env.registry, user.partner_id.id,
+                (attachment_field.relation, attachment_field.column1, attachment_field.column2),
+                thread_id=thread_id, date_from=date_from, date_to=date_to, all_threads=all_threads,
+            )
+            filename = f"messages_{thread_id or 'all'}.ndjson"
+            return Response(
+                stream,
+                content_type='application/x-ndjson; charset=utf-8',
+                headers=[('Content-Disposition', f'attachment; filename="{filename}"')],
+                direct_passthrough=True,
+            )
+
+        except Exception as e:
+            _logger.error(f"Error exporting history: {str(e)}")
+            return Response(json.dumps({'error': str(e)}), status=500, content_type='application/json')
+
+    @http.route('/api/messaging/import', type='http', auth='user', methods=['POST'], csrf=False)
+    def import_history(self, mirror='deferred', **kwargs):
+        """
+        Bulk import message history from an NDJSON request body (administrators only)
+
+        Each line: {"thread_id", "body", "author_id" or "author_email"/"author_name",
+        "message_type", "phone_number", "sms_status", "is_read", "created_date",
+        "attachment_ids"}. Messages are loaded with COPY and are read unless
+        "is_read" is false.
+
+        Parameters (query string):
+        - mirror: deferred (default, a cron posts them to Discuss) or none
+
+        Returns:
+        - imported: Number of imported messages
+        - error_count: Number of rejected lines
+        - errors: The first rejected lines with the reason
+        - thread_ids: Threads that received messages
+        """
+        try:
+            if not request.env.user.has_group('base.group_system'):
+                return Response(json.dumps({'error': 'Access denied'}), status=403,
+                                content_type='application/json')
+
+            result = request.env['messaging.message'].sudo()._import_history(
+                request.httprequest.stream, mirror=mirror
+            )
+            return Response(json.dumps(dict(result, success=True)), content_type='application/json')
+
+        except Exception as e:
+            _logger.error(f"Error importing history: {str(e)}")
+            return Response(json.dumps({'error': str(e)}), status=500, content_type='application/json')
+
     # =====================
     # Typing Indicators
     # =====================
@@ -983,6 +2123,10 @@ class MessagingAPIController(http.Controller):
         - success: Boolean
         """
         try:
+            limited = self._check_rate_limit('typing')
+            if limited:
+                return limited
+
             if not thread_id:
                 return {'error': 'thread_id is required'}
 
@@ -1028,6 +2172,10 @@ class MessagingAPIController(http.Controller):
         - success: Boolean
         """
         try:
+            limited = self._check_rate_limit('typing')
+            if limited:
+                return limited
+
             if not thread_id:
                 return {'error': 'thread_id is required'}
 
@@ -1073,6 +2221,17 @@ class MessagingAPIController(http.Controller):
     # Presence / Online Status
     # =====================
 
+    def _presence_info(self, last_activity):
+        """Return the status and last_seen keys of a partner's presence from their last activity date."""
+        from datetime import datetime, timedelta
+
+        # Consider online if last activity within PRESENCE_ONLINE_MINUTES
+        is_online = bool(last_activity) and datetime.now() - last_activity < timedelta(minutes=PRESENCE_ONLINE_MINUTES)
+        return {
+            'status': 'online' if is_online else 'offline',
+            'last_seen': last_activity.strftime('%Y-%m-%d %H:%M:%S') if last_activity else None,
+        }
+
     @http.route('/api/messaging/presence/update', type='json', auth='user', methods=['POST'], csrf=False)
     def update_presence(self, status='online', **kwargs):
         """
@@ -1085,6 +2244,10 @@ class MessagingAPIController(http.Controller):
         - success: Boolean
         """
         try:
+            limited = self._check_rate_limit('presence')
+            if limited:
+                return limited
+
             user = request.env.user
             partner = user.partner_id
 
@@ -1116,6 +2279,10 @@ class MessagingAPIController(http.Controller):
         - presence: List of partner presence info
         """
         try:
+            limited = self._check_rate_limit('presence')
+            if limited:
+                return limited
+
             if not partner_ids:
                 return {'error': 'partner_ids required'}
 
@@ -1123,27 +2290,12 @@ class MessagingAPIController(http.Controller):
             if not normalized_ids:
                 return {'error': 'No valid partners found'}
 
-            from datetime import datetime, timedelta
-
             partners = request.env['res.partner'].sudo().browse(normalized_ids)
 
             result = []
             for partner in partners:
-                # Consider online if last activity within 5 minutes
-                is_online = False
-                last_seen = None
-
-                if partner.write_date:
-                    time_diff = datetime.now() - partner.write_date
-                    is_online = time_diff < timedelta(minutes=5)
-                    last_seen = partner.write_date.strftime('%Y-%m-%d %H:%M:%S')
-
                 partner_info = self._serialize_partner(partner)
-                partner_info.update({
-                    'status': 'online' if is_online else 'offline',
-                    'last_seen': last_seen
-                })
-
+                partner_info.update(self._presence_info(partner.write_date))
                 result.append(partner_info)
 
             return {
@@ -1154,6 +2306,100 @@ class MessagingAPIController(http.Controller):
             _logger.error(f"Error getting presence: {str(e)}")
             return {'error': str(e)}
 
+    # =====================
+    # Push Notifications
+    # =====================
+
+    @http.route('/api/messaging/push/register', type='json', auth='user', methods=['POST'], csrf=False)
+    def register_push_device(self, token=None, platform='android', **kwargs):
+        """
+        Register a device for push notifications while the user is offline
+
+        Parameters:
+        - token: Device token issued by the push provider
+        - platform: android, ios or web (default android)
+
+        Returns:
+        - success: Boolean
+        - device_id: ID of the registered device
+        """
+        try:
+            if not token or not isinstance(token, str):
+                return {'error': 'token is required'}
+            if platform not in PUSH_PLATFORMS:
+                return {'error': f"platform must be one of {', '.join(PUSH_PLATFORMS)}"}
+
+            device = request.env['messaging.push.device'].sudo()._register(token, platform)
+            return {'success': True, 'device_id': device.id}
+
+        except Exception as e:
+            _logger.error(f"Error registering push device: {str(e)}")
+            return {'error': str(e)}
+
+    @http.route('/api/messaging/push/unregister', type='json', auth='user', methods=['POST'], csrf=False)
+    def unregister_push_device(self, token=None, **kwargs):
+        """
+        Stop push notifications to a device, e.g. on logout
+
+        Parameters:
+        - token: Device token given to /push/register
+
+        Returns:
+        - success: Boolean
+        - removed: False when the token was not registered for this user
+        """
+        try:
+            if not token or not isinstance(token, str):
+                return {'error': 'token is required'}
+
+            removed = request.env['messaging.push.device'].sudo()._unregister(token)
+            return {'success': True, 'removed': removed}
+
+        except Exception as e:
+            _logger.error(f"Error unregistering push device: {str(e)}")
+            return {'error': str(e)}
+
+    # =====================
+    # Monitoring
+    # =====================
+
+    @http.route('/api/messaging/metrics', type='http', auth='none', methods=['GET'], csrf=False)
+    def export_metrics(self, **kwargs):
+        """
+        Prometheus scrape endpoint, aggregated across all worker processes
+
+        Requires the header "Authorization: Bearer <token>" matching the
+        messaging_api.metrics_token system parameter. Disabled when unset.
+
+        Returns:
+        - Metrics in Prometheus text exposition format
+        """
+        try:
+            token = request.env['ir.config_parameter'].sudo().get_param('messaging_api.metrics_token')
+            if not token:
+                return Response('Not found', status=404)
+            if not self._bearer_token_matches(token):
+                return Response('Unauthorized', status=401)
+
+            merged = metrics.collect()
+            request.env.cr.execute("""
+                SELECT count(*) FROM messaging_message
+                 WHERE message_type = 'sms' AND sms_status = 'pending'
+            """)
+            merged['gauges'][('messaging_api_outbox_depth', ())] = request.env.cr.fetchone()[0]
+            request.env.cr.execute("SELECT count(*) FROM messaging_push_notification")
+            merged['gauges'][('messaging_api_push_queue_depth', ())] = request.env.cr.fetchone()[0]
+
+            return Response(
+                api_metrics.render(merged),
+                content_type='text/plain; version=0.0.4; charset=utf-8',
+                status=200
+            )
+
+        except Exception as e:
+            _logger.error(f"Error rendering metrics: {str(e)}")
+            return Response(str(e), status=500)
+
     # =====================
     # Notifications
     # =====================
@@ -1168,11 +2414,11 @@ class MessagingAPIController(http.Controller):
         - by_type: Breakdown by thread type
         """
         try:
-            user_partner_id = request.env.user.partner_id.id
+            limited = self._check_rate_limit('count')
+            if limited:
+                return limited
 
-            threads = request.env['messaging.thread'].search([
-                ('partner_ids', 'in', [user_partner_id])
-            ])
+            user_partner_id = request.env.user.partner_id.id
 
             total = 0
             by_type = {
@@ -1181,9 +2427,25 @@ class MessagingAPIController(http.Controller):
                 'sms': 0
             }
 
+            if self._read_path_enabled():
+                with read_path.read_cursor(request.env) as cr:
+                    rows = read_path.unread_by_thread(cr, user_partner_id)
+                for row in rows:
+                    total += row['unread_count']
+                    if row['thread_type'] in by_type:
+                        by_type[row['thread_type']] += row['unread_count']
+                return {
+                    'total_count': total,
+                    'by_type': by_type
+                }
+
+            threads = request.env['messaging.thread'].search([
+                ('partner_ids', 'in', [user_partner_id])
+            ])
+
             for thread in threads:
                 unread = thread.message_ids.filtered(
-                    lambda m: not m.is_read and m.author_id.id != user_partner_id
+                    lambda m: self._is_unread(m, user_partner_id)
                 )
                 count = len(unread)
                 total += count
@@ -1,4 +1,5 @@
 def post_init_hook(env):
-    env['messaging.thread'].sudo().with_context(messaging_api_skip_channel_user=True).search([
+    # Existing threads get their Discuss channel from the channel cron, not during the install.
+    env['messaging.thread'].sudo().search([
         ('mail_channel_id', '=', False),
-    ])._ensure_mail_channel()
+    ])._schedule_mail_channels()
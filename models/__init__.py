@@ -1,3 +1,14 @@
 # -*- coding: utf-8 -*-
 
 from . import messaging_thread
+from . import messaging_change
+from . import messaging_message_archive
+from . import messaging_sms
+from . import messaging_history
+from . import messaging_idempotency
+from . import messaging_read_receipt
+from . import messaging_push
+from . import ir_attachment
+from . import ir_http
+from . import res_partner
+from . import res_users
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import time
+from datetime import timedelta
+
+from odoo import models, fields, api, tools
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_UPLOAD_GRACE_HOURS = 24
+UPLOAD_GC_BATCH_SIZE = 1000
+UPLOAD_GC_TIME_BUDGET = 50
+DRY_RUN_SAMPLE_SIZE = 20
+
+# Uploads of /api/messaging/attachment/upload, before and after they are linked
+# to a message: linking only fills the relation tables.
+UPLOAD_DOMAIN_SQL = "res_model = 'messaging.message' AND res_id = 0"
+
+
+class IrAttachment(models.Model):
+    _inherit = 'ir.attachment'
+
+    def init(self):
+        super().init()
+        tools.create_index(
+            self._cr, 'ir_attachment_messaging_upload_idx', self._table, ['id'],
+            where=UPLOAD_DOMAIN_SQL,
+        )
+
+    @api.model
+    def _gc_messaging_uploads(self, dry_run=None, batch_size=UPLOAD_GC_BATCH_SIZE, time_budget=UPLOAD_GC_TIME_BUDGET):
+        """Delete API uploads that no message references, once they are older than the grace period.
+
+        ``dry_run`` (default: the ``messaging_api.upload_gc_dry_run`` parameter)
+        only reports what would be deleted. Returns the number of orphans,
+        their size in bytes, the oldest upload date, a sample of ids and
+        whether the scan finished within ``time_budget``.
+        """
+        params = self.env['ir.config_parameter'].sudo()
+        if dry_run is None:
+            dry_run = params.get_param('messaging_api.upload_gc_dry_run', 'False').lower() in ('1', 'true')
+        grace_hours = int(params.get_param('messaging_api.upload_grace_hours', DEFAULT_UPLOAD_GRACE_HOURS))
+        cutoff = fields.Datetime.now() - timedelta(hours=grace_hours)
+        references = [
+            self.env['messaging.message']._fields['attachment_ids'],
+            self.env['messaging.message.archive']._fields['attachment_ids'],
+            self.env['mail.message']._fields['attachment_ids'],
+        ]
+        unreferenced = ' AND '.join(
+            f'NOT EXISTS (SELECT 1 FROM "{rel.relation}" r WHERE r."{rel.column2}" = a.id)' for rel in references
+        )
+
+        deadline = time.monotonic() + time_budget
+        report = {'dry_run': dry_run, 'count': 0, 'bytes': 0, 'oldest': None, 'sample_ids': []}
+        after = 0
+        exhausted = False
+        while True:
+            if time.monotonic() >= deadline:
+                exhausted = True
+                break
+            # Keyset scan of the partial upload index; rows a sending request
+            # holds are skipped and looked at again by the next run.
+            self.env.cr.execute(f"""
+                SELECT a.id, COALESCE(a.file_size, 0), a.create_date
+                  FROM ir_attachment a
+                 WHERE a.res_model = 'messaging.message' AND a.res_id = 0
+                   AND a.id > %s
+                   AND a.create_date < %s
+                   AND {unreferenced}
+              ORDER BY a.id
+                 LIMIT %s
+                   {'' if dry_run else 'FOR UPDATE OF a SKIP LOCKED'}
+            """, (after, cutoff, batch_size))
+            rows = self.env.cr.fetchall()
+            if not rows:
+                break
+            after = rows[-1][0]
+            ids = [row[0] for row in rows]
+
+            report['count'] += len(rows)
+            report['bytes'] += sum(row[1] for row in rows)
+            oldest = min(row[2] for row in rows)
+            report['oldest'] = min(report['oldest'] or oldest, oldest)
+            report['sample_ids'] += ids[:DRY_RUN_SAMPLE_SIZE - len(report['sample_ids'])]
+            if dry_run:
+                continue
+
+            # unlink() queues the files for the filestore garbage collector.
+            self.sudo().browse(ids).unlink()
+            self.env.cr.commit()
+            self.env.invalidate_all()
+            _logger.info("MessagingAPI: deleted %s orphaned uploads (%s total)", len(ids), report['count'])
+
+        report['complete'] = not exhausted
+        if report['oldest']:
+            report['oldest'] = fields.Datetime.to_string(report['oldest'])
+        _logger.info(
+            "MessagingAPI: %s %s orphaned uploads (%s bytes)",
+            'found' if dry_run else 'deleted', report['count'], report['bytes'],
+        )
+        if exhausted and not dry_run:
+            self.env.ref('messaging_api.ir_cron_messaging_upload_gc').sudo()._trigger()
+        return report
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+
+import gzip
+import json
+import logging
+import random
+import threading
+import time
+
+from odoo import models
+from odoo.http import request
+
+from ..tools.metrics import registry as metrics, QUERY_BUCKETS
+from ..tools.profiling import RequestProfiler
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+_logger = logging.getLogger(__name__)
+
+API_PREFIX = '/api/messaging/'
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPES = ('application/msgpack', 'application/x-msgpack')
+DEFAULT_COMPRESSION_MIN_BYTES = 1024
+METRICS_ENVIRON_KEY = 'messaging_api.metrics'
+PROFILER_ENVIRON_KEY = 'messaging_api.profiler'
+ERROR_ENVIRON_KEY = 'messaging_api.error'
+PROFILE_HEADER = 'X-Messaging-Profile'
+PROFILE_REPORT_HEADER = 'X-Messaging-Profile-Report'
+DEFAULT_SLOW_REQUEST_MS = 1000
+
+
+class IrHttp(models.AbstractModel):
+    _inherit = 'ir.http'
+
+    @classmethod
+    def _pre_dispatch(cls, rule, args):
+        super()._pre_dispatch(rule, args)
+        if request.httprequest.path.startswith(API_PREFIX):
+            thread = threading.current_thread()
+            request.httprequest.environ[METRICS_ENVIRON_KEY] = (
+                rule.rule,
+                time.perf_counter(),
+                getattr(thread, 'query_count', 0),
+                getattr(thread, 'query_time', 0),
+            )
+            reason = cls._messaging_profile_reason()
+            if reason:
+                include_params = request.env['ir.config_parameter'].sudo().get_param(
+                    'messaging_api.profile_query_params', 'False'
+                ).lower() in ('1', 'true')
+                profiler = RequestProfiler(rule.rule, reason, include_params=include_params)
+                request.httprequest.environ[PROFILER_ENVIRON_KEY] = profiler
+                profiler.start()
+
+    @classmethod
+    def _dispatch(cls, endpoint):
+        result = super()._dispatch(endpoint)
+        if isinstance(result, dict) and 'error' in result and request.httprequest.path.startswith(API_PREFIX):
+            # Handlers report failures as {"error": ...} with a 200 status.
+            request.httprequest.environ[ERROR_ENVIRON_KEY] = True
+        return result
+
+    @classmethod
+    def _post_dispatch(cls, response):
+        super()._post_dispatch(response)
+        if request.httprequest.path.startswith(API_PREFIX):
+            cls._messaging_finish_profile(response)
+            cls._messaging_record_metrics(response.status_code)
+            cls._messaging_encode_response(response)
+
+    @classmethod
+    def _handle_error(cls, exception):
+        profiler = request.httprequest.environ.pop(PROFILER_ENVIRON_KEY, None)
+        if profiler:
+            profiler.stop()
+        response = None
+        try:
+            response = super()._handle_error(exception)
+            return response
+        finally:
+            # _post_dispatch is skipped when the handler raised.
+            if request.httprequest.path.startswith(API_PREFIX):
+                cls._messaging_record_metrics(getattr(response, 'status_code', 500), failed=True)
+
+    @classmethod
+    def _messaging_profile_reason(cls):
+        """Return why this request should be profiled, or None."""
+        user = request.env.user
+        if not user:
+            return None
+        if request.httprequest.headers.get(PROFILE_HEADER) and user.has_group('base.group_system'):
+            return 'header'
+        if user.sudo().messaging_api_profiling:
+            return 'user'
+        sample_rate = float(request.env['ir.config_parameter'].sudo().get_param(
+            'messaging_api.profile_sample_rate', 0
+        ))
+        if sample_rate and random.random() < sample_rate:
+            return 'sample'
+        return None
+
+    @classmethod
+    def _messaging_finish_profile(cls, response):
+        """Stop the request profiler and write its report when it is worth keeping."""
+        profiler = request.httprequest.environ.pop(PROFILER_ENVIRON_KEY, None)
+        if not profiler:
+            return
+        profiler.stop()
+        try:
+            if profiler.reason == 'sample':
+                threshold_ms = int(request.env['ir.config_parameter'].sudo().get_param(
+                    'messaging_api.slow_request_ms', DEFAULT_SLOW_REQUEST_MS
+                ))
+                if profiler.elapsed * 1000 < threshold_ms:
+                    return
+            filename = profiler.write_report(request.env.user.login)
+            response.headers[PROFILE_REPORT_HEADER] = filename
+            _logger.info(
+                "MessagingAPI: profiled %s in %.1fms (%s queries), report %s",
+                profiler.route,
+                profiler.elapsed * 1000,
+                len(profiler.queries),
+                filename,
+            )
+        except Exception as e:
+            _logger.error(f"Error writing profile report: {str(e)}")
+
+    @classmethod
+    def _messaging_record_metrics(cls, status_code, failed=False):
+        """Record latency, SQL usage and the outcome of an API request, once."""
+        started = request.httprequest.environ.pop(METRICS_ENVIRON_KEY, None)
+        if not started:
+            return
+        route, start, query_count, query_time = started
+        thread = threading.current_thread()
+        status = str(status_code)
+
+        metrics.inc('messaging_api_requests_total', route=route, status=status)
+        metrics.observe('messaging_api_request_duration_seconds', time.perf_counter() - start, route=route)
+        metrics.observe(
+            'messaging_api_sql_queries', getattr(thread, 'query_count', 0) - query_count,
+            buckets=QUERY_BUCKETS, route=route,
+        )
+        metrics.inc(
+            'messaging_api_sql_seconds_total', getattr(thread, 'query_time', 0) - query_time, route=route,
+        )
+
+        if failed or status_code >= 400 or request.httprequest.environ.get(ERROR_ENVIRON_KEY):
+            metrics.inc('messaging_api_errors_total', route=route)
+
+    @classmethod
+    def _messaging_encode_response(cls, response):
+        """Apply the negotiated body encoding and compression to an API response."""
+        if getattr(response, 'direct_passthrough', False) or response.is_streamed:
+            return
+        if response.headers.get('Content-Encoding'):
+            return
+
+        mimetype = response.mimetype
+        if mimetype != JSON_MIMETYPE:
+            return
+
+        try:
+            httprequest = request.httprequest
+            data = response.get_data()
+
+            accepted = {value for value, quality in httprequest.accept_mimetypes if quality > 0}
+            wanted_msgpack = next((m for m in MSGPACK_MIMETYPES if m in accepted), None)
+            if msgpack and wanted_msgpack:
+                data = msgpack.packb(json.loads(data), use_bin_type=True)
+                mimetype = wanted_msgpack
+
+            content_encoding = None
+            threshold = int(request.env['ir.config_parameter'].sudo().get_param(
+                'messaging_api.compression_min_bytes', DEFAULT_COMPRESSION_MIN_BYTES
+            ))
+            encodings = ['gzip']
+            if brotli:
+                encodings.insert(0, 'br')
+            encoding = httprequest.accept_encodings.best_match(encodings)
+            if encoding and len(data) >= threshold:
+                if encoding == 'br':
+                    data = brotli.compress(data, quality=5)
+                else:
+                    data = gzip.compress(data, compresslevel=6)
+                content_encoding = encoding
+
+            response.set_data(data)
+            response.mimetype = mimetype
+            if content_encoding:
+                response.headers['Content-Encoding'] = content_encoding
+            response.vary.add('Accept')
+            response.vary.add('Accept-Encoding')
+        except Exception as e:
+            _logger.error(f"Error encoding API response: {str(e)}")
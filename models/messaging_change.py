@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+from datetime import timedelta
+
+from odoo import models, fields, api, tools
+
+DEFAULT_CHANGE_RETENTION_DAYS = 30
+
+# Change ids are taken from the sequence at insert time, but transactions
+# commit in any order: a change with a lower id can become visible after a
+# reader went past it. Sync positions are therefore (transaction id, change
+# id) pairs, and readers only go up to the oldest transaction still running
+# (the horizon), below which the log can no longer grow.
+HORIZON_SQL = "txid_snapshot_xmin(txid_current_snapshot())"
+
+
+class MessagingChange(models.Model):
+    _name = 'messaging.change'
+    _description = 'Messaging Sync Change Log'
+    _order = 'id'
+    _log_access = False
+
+    thread_id = fields.Integer(string='Thread ID', required=True, index=True)
+    res_id = fields.Integer(string='Record ID')
+    partner_id = fields.Integer(string='Partner ID', index=True)
+    change_type = fields.Selection([
+        ('thread', 'Thread Changed'),
+        ('thread_delete', 'Thread Deleted'),
+        ('member_add', 'Participant Added'),
+        ('member_remove', 'Participant Removed'),
+        ('message', 'Message Changed'),
+        ('message_delete', 'Message Deleted'),
+        ('read', 'Read State Changed'),
+        ('reaction', 'Reactions Changed'),
+    ], string='Change Type', required=True)
+    date = fields.Datetime(string='Date', required=True, default=fields.Datetime.now, index=True)
+
+    def init(self):
+        # Not an ORM field: the database fills it with the writing transaction,
+        # also for rows inserted with raw SQL.
+        if not tools.column_exists(self._cr, self._table, 'xact_id'):
+            self._cr.execute(f"""
+                ALTER TABLE {self._table} ADD COLUMN xact_id bigint;
+                UPDATE {self._table} SET xact_id = 0;
+                ALTER TABLE {self._table} ALTER COLUMN xact_id SET DEFAULT txid_current(),
+                                          ALTER COLUMN xact_id SET NOT NULL;
+            """)
+        tools.create_index(self._cr, 'messaging_change_position_idx', self._table, ['xact_id', 'id'])
+
+    @api.model
+    def _log(self, change_type, entries):
+        """Record one change per (thread_id, res_id, partner_id) entry."""
+        if not entries:
+            return self.browse()
+        return self.sudo().create([{
+            'change_type': change_type,
+            'thread_id': thread_id,
+            'res_id': res_id or False,
+            'partner_id': partner_id or False,
+        } for thread_id, res_id, partner_id in entries])
+
+    @api.model
+    def _horizon(self, cr=None):
+        """Return the oldest transaction id still running; earlier transactions can add no change."""
+        cr = cr or self.env.cr
+        cr.execute(f"SELECT {HORIZON_SQL}")
+        return cr.fetchone()[0]
+
+    @api.model
+    def _read_since(self, position, horizon, thread_ids, partner_id, limit):
+        """Return the changes of the threads or the partner after ``position``, up to ``horizon``.
+
+        Changes come in (transaction, id) order as a list of (change, position).
+        """
+        self.env.cr.execute("""
+            SELECT id, xact_id FROM messaging_change
+             WHERE (xact_id, id) > (%s, %s) AND xact_id < %s
+               AND (thread_id = ANY(%s) OR partner_id = %s)
+          ORDER BY xact_id, id
+             LIMIT %s
+        """, (position[0], position[1], horizon, list(thread_ids), partner_id, limit))
+        rows = self.env.cr.fetchall()
+        changes = self.sudo().browse([row[0] for row in rows])
+        return [(change, (xact_id, change.id)) for change, (_id, xact_id) in zip(changes, rows)]
+
+    @api.model
+    def _prune_changes(self):
+        """Drop changes older than the retention window and remember the cut-off position."""
+        params = self.env['ir.config_parameter'].sudo()
+        retention_days = int(params.get_param(
+            'messaging_api.sync_retention_days', DEFAULT_CHANGE_RETENTION_DAYS
+        ))
+        cutoff = fields.Datetime.now() - timedelta(days=retention_days)
+        self.env.cr.execute("""
+            SELECT xact_id, id FROM messaging_change
+             WHERE date < %s AND xact_id < {horizon}
+          ORDER BY xact_id DESC, id DESC
+             LIMIT 1
+        """.format(horizon=HORIZON_SQL), (cutoff,))
+        expired = self.env.cr.fetchone()
+        if not expired:
+            return 0
+
+        self.env.cr.execute("DELETE FROM messaging_change WHERE (xact_id, id) <= (%s, %s)", expired)
+        pruned = self.env.cr.rowcount
+        params.set_param('messaging_api.sync_pruned_position', '%s:%s' % expired)
+        return pruned
+
+    @api.model
+    def _pruned_position(self):
+        """Return the highest (transaction, change id) position that is no longer retained."""
+        position = self.env['ir.config_parameter'].sudo().get_param('messaging_api.sync_pruned_position', '0:0')
+        xact_id, change_id = position.split(':')
+        return int(xact_id), int(change_id)
@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+
+import csv
+import io
+import json
+import logging
+import time
+
+from odoo import models, fields, api, tools
+
+_logger = logging.getLogger(__name__)
+
+IMPORT_CHUNK_SIZE = 10000
+MAX_REPORTED_ERRORS = 100
+MIRROR_BATCH_SIZE = 1000
+MIRROR_LIVE_BATCH_SIZE = 100
+MIRROR_TIME_BUDGET = 50
+
+# Columns written by COPY, in order.
+IMPORT_COLUMNS = (
+    'id', 'thread_id', 'author_id', 'body', 'message_type', 'phone_number', 'sms_status',
+    'is_read', 'mail_sync_pending', 'sms_attempts', 'create_uid', 'create_date', 'write_uid', 'write_date',
+)
+
+
+class MessagingMessage(models.Model):
+    _inherit = 'messaging.message'
+
+    mail_sync_pending = fields.Boolean(string='Discuss Mirror Pending', copy=False)
+    mail_sync_notify = fields.Boolean(
+        string='Notify on Mirror', copy=False,
+        help='Post with notifications (live large-group messages) rather than as silent history.',
+    )
+
+    def init(self):
+        super().init()
+        tools.create_index(
+            self._cr, 'messaging_message_mail_sync_pending_idx', self._table, ['id'],
+            where='mail_sync_pending',
+        )
+        tools.create_index(
+            self._cr, 'messaging_message_mail_sync_notify_idx', self._table, ['id'],
+            where='mail_sync_pending AND mail_sync_notify',
+        )
+
+    @api.model
+    def _import_history(self, lines, mirror='deferred'):
+        """Bulk-load NDJSON history lines with COPY, one chunk at a time.
+
+        Each line is a JSON object with ``thread_id``, ``body``, ``author_id``
+        (or ``author_email`` and optional ``author_name``), and optionally
+        ``message_type``, ``phone_number``, ``sms_status``, ``is_read``,
+        ``created_date`` and ``attachment_ids``. ``mirror`` is ``deferred``
+        (the mirror cron posts the messages to Discuss later) or ``none``.
+        """
+        if mirror not in ('deferred', 'none'):
+            raise ValueError("mirror must be 'deferred' or 'none'")
+
+        result = {'imported': 0, 'errors': [], 'error_count': 0, 'thread_ids': set()}
+        chunk = []
+        for line_number, line in enumerate(lines, 1):
+            if isinstance(line, bytes):
+                line = line.decode('utf-8')
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError('line is not a JSON object')
+            except ValueError as e:
+                self._import_error(result, line_number, str(e))
+                continue
+            chunk.append((line_number, record))
+            if len(chunk) >= IMPORT_CHUNK_SIZE:
+                self._import_history_chunk(chunk, mirror, result)
+                chunk = []
+        if chunk:
+            self._import_history_chunk(chunk, mirror, result)
+
+        thread_ids = sorted(result['thread_ids'])
+        if thread_ids:
+            # One change per thread tells sync clients to reload it, instead of
+            # a change per imported message.
+            self.env['messaging.change']._log('thread', [(thread_id, None, None) for thread_id in thread_ids])
+            cron = self.env.ref('messaging_api.ir_cron_messaging_mail_mirror', raise_if_not_found=False)
+            if cron and mirror == 'deferred':
+                cron.sudo()._trigger()
+        self.env.invalidate_all()
+        result['thread_ids'] = thread_ids
+        return result
+
+    @api.model
+    def _import_error(self, result, line_number, error):
+        result['error_count'] += 1
+        if len(result['errors']) < MAX_REPORTED_ERRORS:
+            result['errors'].append({'line': line_number, 'error': error})
+
+    @api.model
+    def _import_history_chunk(self, chunk, mirror, result):
+        cr = self.env.cr
+        self.env.flush_all()
+
+        thread_ids = {r.get('thread_id') for _n, r in chunk if isinstance(r.get('thread_id'), int)}
+        cr.execute("SELECT id FROM messaging_thread WHERE id = ANY(%s)", (list(thread_ids),))
+        known_threads = {row[0] for row in cr.fetchall()}
+
+        author_ids = {r.get('author_id') for _n, r in chunk if isinstance(r.get('author_id'), int)}
+        cr.execute("SELECT id FROM res_partner WHERE id = ANY(%s)", (list(author_ids),))
+        known_authors = {row[0] for row in cr.fetchall()}
+        authors_by_email = self._import_authors_by_email(chunk)
+        known_authors.update(authors_by_email.values())
+
+        attachment_ids = {
+            a for _n, r in chunk if isinstance(r.get('attachment_ids'), list)
+            for a in r['attachment_ids'] if isinstance(a, int)
+        }
+        cr.execute("SELECT id FROM ir_attachment WHERE id = ANY(%s)", (list(attachment_ids),))
+        known_attachments = {row[0] for row in cr.fetchall()}
+
+        rows, attachments = [], []
+        now = fields.Datetime.now()
+        for line_number, record in chunk:
+            thread_id = record.get('thread_id')
+            author_id = record.get('author_id')
+            if not author_id and isinstance(record.get('author_email'), str):
+                author_id = authors_by_email.get(record['author_email'].strip().lower())
+            record_attachments = record.get('attachment_ids') or []
+            if not isinstance(record_attachments, list):
+                record_attachments = [None]
+            body = record.get('body')
+            message_type = record.get('message_type') or 'text'
+            try:
+                create_date = fields.Datetime.to_datetime(record.get('created_date')) or now
+            except ValueError:
+                create_date = None
+
+            if not isinstance(thread_id, int) or thread_id not in known_threads:
+                error = 'unknown thread_id'
+            elif not isinstance(author_id, int) or author_id not in known_authors:
+                error = 'unknown author'
+            elif not body or not isinstance(body, str):
+                error = 'body is required'
+            elif message_type not in ('text', 'sms'):
+                error = 'invalid message_type'
+            elif create_date is None:
+                error = 'invalid created_date'
+            elif any(not isinstance(a, int) or a not in known_attachments for a in record_attachments):
+                error = 'unknown attachment'
+            else:
+                error = None
+            if error:
+                self._import_error(result, line_number, error)
+                continue
+
+            sms_status = None
+            if message_type == 'sms':
+                # Never hand imported history to the outbound dispatcher.
+                sms_status = record.get('sms_status') if record.get('sms_status') in (
+                    'sent', 'delivered', 'failed', 'received'
+                ) else 'sent'
+            rows.append([
+                None, thread_id, author_id, body, message_type, record.get('phone_number') or None,
+                sms_status, 't' if record.get('is_read', True) else 'f',
+                't' if mirror == 'deferred' else 'f', 0, self.env.uid, create_date, self.env.uid, now,
+            ])
+            attachments.append(list(dict.fromkeys(record_attachments)))
+
+        if not rows:
+            return
+
+        cr.execute(
+            "SELECT nextval('messaging_message_id_seq') FROM generate_series(1, %s)", (len(rows),)
+        )
+        for row, (message_id,) in zip(rows, cr.fetchall()):
+            row[0] = message_id
+
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        cr.copy_expert(
+            f"COPY messaging_message ({', '.join(IMPORT_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer
+        )
+
+        relation = self._fields['attachment_ids']
+        links = [(row[0], a) for row, row_attachments in zip(rows, attachments) for a in row_attachments]
+        if links:
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(links)
+            buffer.seek(0)
+            cr.copy_expert(
+                f'COPY "{relation.relation}" ("{relation.column1}", "{relation.column2}") '
+                f'FROM STDIN WITH (FORMAT csv)', buffer
+            )
+
+        cr.execute("""
+            UPDATE messaging_thread t
+               SET last_message_date = GREATEST(t.last_message_date, m.create_date)
+              FROM (SELECT thread_id, max(create_date) AS create_date
+                      FROM messaging_message WHERE id = ANY(%s)
+                  GROUP BY thread_id) m
+             WHERE t.id = m.thread_id
+        """, ([row[0] for row in rows],))
+
+        result['imported'] += len(rows)
+        result['thread_ids'].update(row[1] for row in rows)
+        _logger.info("MessagingAPI: imported %s history messages (%s total)", len(rows), result['imported'])
+
+    @api.model
+    def _import_authors_by_email(self, chunk):
+        """Return {email: partner_id} for email-identified authors, creating unknown ones in one batch."""
+        names = {}
+        for _n, record in chunk:
+            email = record.get('author_email')
+            if not record.get('author_id') and isinstance(email, str) and email.strip():
+                names.setdefault(email.strip().lower(), record.get('author_name') or email.strip())
+        if not names:
+            return {}
+
+        Partner = self.env['res.partner'].sudo().with_context(tracking_disable=True, mail_create_nolog=True)
+        by_email = {}
+        for partner in Partner.search([('email_normalized', 'in', list(names))], order='id'):
+            by_email.setdefault(partner.email_normalized, partner.id)
+        missing = [email for email in names if email not in by_email]
+        if missing:
+            created = Partner.create([{'name': names[email], 'email': email} for email in missing])
+            by_email.update(zip(missing, created.ids))
+        return by_email
+
+    @api.model
+    def _mirror_pending_messages(self, batch_size=MIRROR_BATCH_SIZE, time_budget=MIRROR_TIME_BUDGET):
+        """Post deferred messages to their Discuss channels, one committed batch at a time.
+
+        Live large-group messages go first and are posted normally, so members
+        are notified. Imported history, and the messages a thread received
+        before its channel was created, are written as plain channel messages,
+        without notifications or bus traffic.
+        """
+        deadline = time.monotonic() + time_budget
+        mirrored = 0
+        exhausted = False
+        while True:
+            if time.monotonic() >= deadline:
+                exhausted = True
+                break
+            live = self._claim_mirror_batch(MIRROR_LIVE_BATCH_SIZE, notify=True)
+            messages = live or self._claim_mirror_batch(batch_size, notify=False)
+            if not messages:
+                break
+
+            # Messages of threads without a channel yet are mirrored when it is created.
+            waiting = messages.filtered(lambda m: not m.thread_id.mail_channel_id)
+            messages -= waiting
+            mail_messages = []
+            if messages and live:
+                mail_messages = self._mirror_live(messages)
+            elif messages:
+                mail_messages = self._mirror_history(messages)
+
+            self.env.flush_all()
+            self.env.cr.execute("""
+                UPDATE messaging_message m
+                   SET mail_message_id = v.mail_message_id, mail_sync_pending = false, mail_sync_notify = false
+                  FROM unnest(%s::int[], %s::int[]) AS v(id, mail_message_id)
+                 WHERE m.id = v.id
+            """, (messages.ids + waiting.ids, mail_messages + [None] * len(waiting)))
+            self.env.cr.commit()
+            self.env.invalidate_all()
+            mirrored += len(messages)
+
+        if exhausted:
+            self.env.ref('messaging_api.ir_cron_messaging_mail_mirror').sudo()._trigger()
+        return mirrored
+
+    def _ensure_mail_message(self):
+        """Return the message's Discuss counterpart, creating its thread's channel and mirroring it first if needed."""
+        self.ensure_one()
+        # Locked against the mirror cron, which would post it a second time.
+        self.env.cr.execute("SELECT 1 FROM messaging_message WHERE id = %s FOR UPDATE", (self.id,))
+        self.invalidate_recordset(['mail_message_id'])
+        if not self.mail_message_id:
+            self.thread_id._ensure_mail_channel()
+            (mail_message_id,) = self._mirror_history(self)
+            self.write({'mail_message_id': mail_message_id, 'mail_sync_pending': False, 'mail_sync_notify': False})
+        return self.mail_message_id
+
+    @api.model
+    def _claim_mirror_batch(self, limit, notify):
+        self.env.cr.execute(f"""
+            SELECT id FROM messaging_message
+             WHERE mail_sync_pending AND mail_sync_notify IS {'TRUE' if notify else 'NOT TRUE'}
+          ORDER BY id
+             LIMIT %s
+               FOR UPDATE SKIP LOCKED
+        """, (limit,))
+        return self.sudo().browse([row[0] for row in self.env.cr.fetchall()])
+
+    def _mirror_live(self, messages):
+        """Post messages through message_post; return the mail.message ids in order."""
+        mail_message_ids = []
+        for message in messages:
+            channel = message.thread_id.mail_channel_id
+            mail_message = channel.with_context(skip_messaging_sync=True).message_post(
+                body=message.body or '',
+                message_type='comment',
+                subtype_xmlid='mail.mt_comment',
+                author_id=message.author_id.id,
+                attachment_ids=message.attachment_ids.ids,
+            )
+            mail_message_ids.append(mail_message.id if mail_message else None)
+        return mail_message_ids
+
+    def _mirror_history(self, messages):
+        """Create silent channel messages with the original dates; return their ids in order."""
+        comment_subtype = self.env.ref('mail.mt_comment')
+        return self.env['mail.message'].sudo().create([{
+            'model': 'discuss.channel',
+            'res_id': message.thread_id.mail_channel_id.id,
+            'message_type': 'comment',
+            'subtype_id': comment_subtype.id,
+            'author_id': message.author_id.id,
+            'body': message.body or '',
+            'date': message.create_date,
+            'attachment_ids': [(6, 0, message.attachment_ids.ids)],
+        } for message in messages]).ids
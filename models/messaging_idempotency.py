@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+from datetime import timedelta
+
+from odoo import models, fields, api, tools
+
+DEFAULT_IDEMPOTENCY_RETENTION_HOURS = 24
+IDEMPOTENCY_KEY_MAX_LENGTH = 128
+
+
+class MessagingIdempotencyKey(models.Model):
+    _name = 'messaging.idempotency.key'
+    _description = 'Messaging API Idempotency Key'
+    _order = 'id'
+    _log_access = False
+
+    user_id = fields.Integer(string='User ID', required=True)
+    scope = fields.Selection([
+        ('message', 'Send Message'),
+        ('thread', 'Create Thread'),
+    ], string='Scope', required=True)
+    key = fields.Char(string='Key', required=True)
+    res_id = fields.Integer(string='Record ID')
+    date = fields.Datetime(string='Date', required=True, default=fields.Datetime.now, index=True)
+
+    def init(self):
+        tools.create_unique_index(
+            self._cr, 'messaging_idempotency_key_uniq', self._table, ['user_id', 'scope', 'key']
+        )
+
+    @api.model
+    def _claim(self, scope, key):
+        """Reserve ``key`` for the current user and return the id recorded by an earlier request.
+
+        Returns False when this request has to do the work. A concurrent request
+        with the same key waits on the unique index until the first one ends. If
+        the first one failed, the work is done again; if it committed, the insert
+        raises a serialization failure under REPEATABLE READ, which the
+        controllers let through so Odoo retries the request and the retry
+        returns the committed result.
+        """
+        if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            raise ValueError(f'Idempotency key longer than {IDEMPOTENCY_KEY_MAX_LENGTH} characters')
+        cr = self.env.cr
+        cr.execute("""
+            INSERT INTO messaging_idempotency_key (user_id, scope, key, date)
+            VALUES (%s, %s, %s, now() AT TIME ZONE 'UTC')
+            ON CONFLICT (user_id, scope, key) DO NOTHING
+            RETURNING id
+        """, (self.env.uid, scope, key))
+        if cr.fetchone():
+            return False
+        cr.execute("""
+            SELECT res_id FROM messaging_idempotency_key
+             WHERE user_id = %s AND scope = %s AND key = %s
+        """, (self.env.uid, scope, key))
+        row = cr.fetchone()
+        return row[0] if row and row[0] else False
+
+    @api.model
+    def _remember(self, scope, key, res_id):
+        self.env.cr.execute("""
+            UPDATE messaging_idempotency_key SET res_id = %s
+             WHERE user_id = %s AND scope = %s AND key = %s
+        """, (res_id, self.env.uid, scope, key))
+
+    @api.model
+    def _prune_keys(self):
+        """Forget keys older than the retention window."""
+        retention_hours = int(self.env['ir.config_parameter'].sudo().get_param(
+            'messaging_api.idempotency_retention_hours', DEFAULT_IDEMPOTENCY_RETENTION_HOURS
+        ))
+        cutoff = fields.Datetime.now() - timedelta(hours=retention_hours)
+        self.env.cr.execute("DELETE FROM messaging_idempotency_key WHERE date < %s", (cutoff,))
+        return self.env.cr.rowcount
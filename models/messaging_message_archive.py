@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+import logging
+from datetime import timedelta
+
+from odoo import models, fields, api, tools
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_ARCHIVE_AFTER_DAYS = 180
+ARCHIVE_BATCH_SIZE = 5000
+
+# Columns copied verbatim from messaging_message; ids are kept so clients'
+# message ids and cursors stay valid after a message moves to the archive.
+ARCHIVED_COLUMNS = (
+    'id', 'thread_id', 'author_id', 'body', 'message_type', 'phone_number', 'sms_status',
+    'is_read', 'mail_message_id', 'create_date', 'create_uid', 'write_date', 'write_uid',
+)
+
+
+class MessagingMessageArchive(models.Model):
+    _name = 'messaging.message.archive'
+    _description = 'Archived Messaging Message'
+    _order = 'create_date desc'
+
+    thread_id = fields.Many2one('messaging.thread', string='Thread', required=True, ondelete='cascade')
+    author_id = fields.Many2one('res.partner', string='Author', required=True)
+    body = fields.Text(string='Message Body', required=True)
+    message_type = fields.Selection([
+        ('sms', 'SMS'),
+        ('text', 'Text'),
+    ], string='Message Type', default='text', required=True)
+    attachment_ids = fields.Many2many(
+        'ir.attachment', 'messaging_message_archive_attachment_rel',
+        'message_id', 'attachment_id', string='Attachments',
+    )
+    phone_number = fields.Char(string='Phone Number')
+    sms_status = fields.Selection([
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('delivered', 'Delivered'),
+        ('failed', 'Failed'),
+        ('received', 'Received'),
+    ], string='SMS Status')
+    is_read = fields.Boolean(string='Is Read', default=True)
+    create_date = fields.Datetime(string='Created Date', readonly=True)
+    mail_message_id = fields.Many2one('mail.message', string='Discuss Message', readonly=True)
+
+    def init(self):
+        tools.create_index(
+            self._cr, 'messaging_message_archive_thread_create_date_idx',
+            self._table, ['thread_id', 'create_date DESC'],
+        )
+
+    def _ensure_mail_message(self):
+        """Return the archived message's Discuss counterpart, creating its thread's channel and mirroring it first if needed."""
+        self.ensure_one()
+        self.env.cr.execute("SELECT 1 FROM messaging_message_archive WHERE id = %s FOR UPDATE", (self.id,))
+        self.invalidate_recordset(['mail_message_id'])
+        if not self.mail_message_id:
+            self.thread_id._ensure_mail_channel()
+            (mail_message_id,) = self.env['messaging.message']._mirror_history(self)
+            self.mail_message_id = mail_message_id
+        return self.mail_message_id
+
+    @api.model
+    def _archive_old_messages(self, batch_size=ARCHIVE_BATCH_SIZE, max_batches=None):
+        """Move read messages older than the hot window to the archive, one committed batch at a time."""
+        days = int(self.env['ir.config_parameter'].sudo().get_param(
+            'messaging_api.archive_after_days', DEFAULT_ARCHIVE_AFTER_DAYS
+        ))
+        cutoff = fields.Datetime.now() - timedelta(days=days)
+        hot_rel = self.env['messaging.message']._fields['attachment_ids']
+        cold_rel = self._fields['attachment_ids']
+        columns = ', '.join(ARCHIVED_COLUMNS)
+
+        moved = 0
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            self.env.cr.execute("""
+                SELECT id FROM messaging_message
+                 WHERE create_date < %s AND is_read AND mail_sync_pending IS NOT TRUE
+              ORDER BY id
+                 LIMIT %s
+                   FOR UPDATE SKIP LOCKED
+            """, (cutoff, batch_size))
+            ids = [row[0] for row in self.env.cr.fetchall()]
+            if not ids:
+                break
+
+            self.env.cr.execute(f"""
+                INSERT INTO messaging_message_archive ({columns})
+                SELECT {columns} FROM messaging_message WHERE id = ANY(%s)
+            """, (ids,))
+            self.env.cr.execute(f"""
+                INSERT INTO "{cold_rel.relation}" ("{cold_rel.column1}", "{cold_rel.column2}")
+                SELECT "{hot_rel.column1}", "{hot_rel.column2}" FROM "{hot_rel.relation}"
+                 WHERE "{hot_rel.column1}" = ANY(%s)
+            """, (ids,))
+            self.env.cr.execute("DELETE FROM messaging_message WHERE id = ANY(%s)", (ids,))
+            self.env.cr.commit()
+
+            moved += len(ids)
+            batches += 1
+            _logger.info("MessagingAPI: archived %s messages (%s total)", len(ids), moved)
+
+        self.env.invalidate_all()
+        return moved
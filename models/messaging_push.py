@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import random
+import time
+from datetime import timedelta
+
+from odoo import models, fields, api, tools
+
+from ..tools.admission import NS_POLL_SLOT, SLOTS_PER_USER
+from ..tools.metrics import registry as metrics
+from ..tools.push_gateway import PushResult, get_provider
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_PUSH_COALESCE_SECONDS = 30
+# Same window as /api/messaging/presence/status.
+PRESENCE_TIMEOUT_MINUTES = 5
+PUSH_MAX_ATTEMPTS = 5
+PUSH_BACKOFF_BASE = 30
+PUSH_BACKOFF_MAX = 3600
+PUSH_STALE_CLAIM_MINUTES = 10
+PUSH_TIME_BUDGET = 50
+PUSH_PREVIEW_LENGTH = 120
+
+
+class MessagingPushDevice(models.Model):
+    _name = 'messaging.push.device'
+    _description = 'Messaging Push Device'
+    _order = 'id'
+
+    user_id = fields.Many2one('res.users', string='User', required=True, ondelete='cascade', index=True)
+    token = fields.Char(string='Device Token', required=True)
+    platform = fields.Selection([
+        ('android', 'Android'),
+        ('ios', 'iOS'),
+        ('web', 'Web'),
+    ], string='Platform', required=True, default='android')
+    last_seen = fields.Datetime(string='Last Seen', default=fields.Datetime.now)
+
+    def init(self):
+        tools.create_unique_index(self._cr, 'messaging_push_device_token_uniq', self._table, ['token'])
+
+    @api.model
+    def _register(self, token, platform):
+        """Attach the device token to the current user; a token moves with the last user to register it."""
+        self.env.cr.execute("""
+            INSERT INTO messaging_push_device (user_id, token, platform, last_seen,
+                                               create_uid, create_date, write_uid, write_date)
+            VALUES (%(uid)s, %(token)s, %(platform)s, now() AT TIME ZONE 'UTC',
+                    %(uid)s, now() AT TIME ZONE 'UTC', %(uid)s, now() AT TIME ZONE 'UTC')
+            ON CONFLICT (token) DO UPDATE
+               SET user_id = EXCLUDED.user_id, platform = EXCLUDED.platform, last_seen = EXCLUDED.last_seen,
+                   write_uid = EXCLUDED.write_uid, write_date = EXCLUDED.write_date
+         RETURNING id
+        """, {'uid': self.env.uid, 'token': token, 'platform': platform})
+        self.invalidate_model()
+        return self.browse(self.env.cr.fetchone()[0])
+
+    @api.model
+    def _unregister(self, token):
+        self.env.cr.execute(
+            "DELETE FROM messaging_push_device WHERE token = %s AND user_id = %s", (token, self.env.uid)
+        )
+        self.invalidate_model()
+        return bool(self.env.cr.rowcount)
+
+
+class MessagingPushNotification(models.Model):
+    """Queue of pushes to offline users, at most one pending row per user.
+
+    New messages for a user who already has a pending push only raise its
+    message count, so a burst becomes a single notification. Rows wait
+    ``messaging_api.push_coalesce_seconds`` before the delivery cron picks them.
+    """
+    _name = 'messaging.push.notification'
+    _description = 'Messaging Push Notification Queue'
+    _order = 'id'
+    _log_access = False
+
+    user_id = fields.Integer(string='User ID', required=True)
+    state = fields.Selection([
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('retry', 'Retry'),
+    ], string='State', required=True, default='pending')
+    message_count = fields.Integer(string='Messages', default=0)
+    last_message_id = fields.Integer(string='Last Message ID')
+    last_thread_id = fields.Integer(string='Last Thread ID')
+    attempts = fields.Integer(string='Attempts', default=0)
+    date = fields.Datetime(string='Queued On', required=True, default=fields.Datetime.now)
+    next_attempt = fields.Datetime(string='Next Attempt')
+    claimed_at = fields.Datetime(string='Claimed At')
+
+    def init(self):
+        tools.create_unique_index(
+            self._cr, 'messaging_push_notification_pending_uniq', self._table, ['user_id'],
+            where="state = 'pending'",
+        )
+
+    @api.model
+    def _push_provider_name(self):
+        return self.env['ir.config_parameter'].sudo().get_param('messaging_api.push_provider')
+
+    @api.model
+    def _coalesce_seconds(self):
+        return int(self.env['ir.config_parameter'].sudo().get_param(
+            'messaging_api.push_coalesce_seconds', DEFAULT_PUSH_COALESCE_SECONDS
+        ))
+
+    @api.model
+    def _enqueue(self, message_ids):
+        """Queue or coalesce a push for every offline recipient of the messages with a registered device.
+
+        Recipients are offline when their presence is older than
+        PRESENCE_TIMEOUT_MINUTES and no long poll of theirs is running.
+        """
+        if not message_ids or not self._push_provider_name():
+            return 0
+        self.env.flush_all()
+        self.env.cr.execute("""
+            WITH polling AS (
+                SELECT DISTINCT objid::bigint / %(slots)s AS user_id
+                  FROM pg_locks
+                 WHERE locktype = 'advisory' AND classid = %(namespace)s AND objsubid = 2 AND granted
+                   AND database = (SELECT oid FROM pg_database WHERE datname = current_database())
+            ), recipients AS (
+                SELECT u.id AS user_id, count(*) AS message_count, max(m.id) AS last_message_id,
+                       (array_agg(m.thread_id ORDER BY m.id DESC))[1] AS last_thread_id
+                  FROM messaging_message m
+                  JOIN messaging_thread_res_partner_rel member
+                    ON member.messaging_thread_id = m.thread_id AND member.res_partner_id != m.author_id
+                  JOIN res_users u ON u.partner_id = member.res_partner_id AND u.active
+                  JOIN res_partner p ON p.id = u.partner_id
+                 WHERE m.id = ANY(%(message_ids)s)
+                   AND (p.write_date IS NULL
+                        OR p.write_date < (now() AT TIME ZONE 'UTC') - make_interval(mins => %(presence)s))
+                   AND u.id NOT IN (SELECT user_id FROM polling)
+                   AND EXISTS (SELECT 1 FROM messaging_push_device d WHERE d.user_id = u.id)
+              GROUP BY u.id
+            )
+            INSERT INTO messaging_push_notification
+                   (user_id, state, message_count, last_message_id, last_thread_id, attempts, date)
+            SELECT user_id, 'pending', message_count, last_message_id, last_thread_id, 0,
+                   now() AT TIME ZONE 'UTC'
+              FROM recipients
+                ON CONFLICT (user_id) WHERE state = 'pending' DO UPDATE
+               SET message_count = messaging_push_notification.message_count + EXCLUDED.message_count,
+                   last_message_id = GREATEST(messaging_push_notification.last_message_id, EXCLUDED.last_message_id),
+                   last_thread_id = EXCLUDED.last_thread_id
+         RETURNING xmax = 0
+        """, {
+            'slots': SLOTS_PER_USER,
+            'namespace': NS_POLL_SLOT,
+            'message_ids': list(message_ids),
+            'presence': PRESENCE_TIMEOUT_MINUTES,
+        })
+        created = sum(1 for (inserted,) in self.env.cr.fetchall() if inserted)
+        if created:
+            # Deliver once the coalescing window of the new rows has passed.
+            cron = self.env.ref('messaging_api.ir_cron_messaging_push_deliver', raise_if_not_found=False)
+            if cron:
+                cron.sudo()._trigger(fields.Datetime.now() + timedelta(seconds=self._coalesce_seconds()))
+        return created
+
+    @api.model
+    def _deliver_push_notifications(self, time_budget=PUSH_TIME_BUDGET):
+        """Send due pushes through the configured provider in rate-limited batches."""
+        provider_name = self._push_provider_name()
+        if not provider_name:
+            return 0
+        try:
+            provider = get_provider(self.env, provider_name)
+        except ValueError as e:
+            _logger.error(f"Error delivering push notifications: {str(e)}")
+            return 0
+
+        deadline = time.monotonic() + time_budget
+        delivered = 0
+        exhausted = False
+        while True:
+            if time.monotonic() >= deadline:
+                exhausted = True
+                break
+            batch = self._claim_push_batch(provider.batch_size)
+            if not batch:
+                break
+
+            started = time.monotonic()
+            entries = self._push_entries(batch)
+            try:
+                results = provider.send_batch(entries) if entries else []
+            except Exception as e:
+                _logger.error(f"Error sending push batch via {provider_name}: {str(e)}")
+                results = [PushResult(entry['id'], 'retry', str(e)) for entry in entries]
+            self._apply_push_results(batch, entries, results)
+            self.env.cr.commit()
+            delivered += len(batch)
+
+            wait = len(entries) / provider.rate_per_second - (time.monotonic() - started)
+            if wait > 0:
+                time.sleep(wait)
+
+        if exhausted:
+            self.env.ref('messaging_api.ir_cron_messaging_push_deliver').sudo()._trigger()
+        return delivered
+
+    @api.model
+    def _claim_push_batch(self, limit):
+        """Move due rows to ``sending`` and commit, so new messages start a fresh pending push."""
+        self.env.cr.execute("""
+            UPDATE messaging_push_notification n
+               SET state = 'sending', claimed_at = now() AT TIME ZONE 'UTC', attempts = n.attempts + 1
+             WHERE n.id IN (
+                    SELECT id FROM messaging_push_notification
+                     WHERE (state = 'pending' AND date <= (now() AT TIME ZONE 'UTC') - make_interval(secs => %s))
+                        OR (state = 'retry' AND next_attempt <= (now() AT TIME ZONE 'UTC'))
+                        OR (state = 'sending'
+                            AND claimed_at < (now() AT TIME ZONE 'UTC') - make_interval(mins => %s))
+                  ORDER BY id
+                     LIMIT %s
+                       FOR UPDATE SKIP LOCKED
+             )
+         RETURNING n.id, n.user_id, n.message_count, n.last_message_id, n.last_thread_id, n.attempts
+        """, (self._coalesce_seconds(), PUSH_STALE_CLAIM_MINUTES, limit))
+        columns = ('id', 'user_id', 'message_count', 'last_message_id', 'last_thread_id', 'attempts')
+        batch = [dict(zip(columns, row)) for row in self.env.cr.fetchall()]
+        self.env.cr.commit()
+        return batch
+
+    @api.model
+    def _push_entries(self, batch):
+        """Build one provider entry per device of the batch's users."""
+        cr = self.env.cr
+        cr.execute("""
+            SELECT m.id, m.body, t.name, p.name
+              FROM messaging_message m
+              JOIN messaging_thread t ON t.id = m.thread_id
+              JOIN res_partner p ON p.id = m.author_id
+             WHERE m.id = ANY(%s)
+        """, ([n['last_message_id'] for n in batch],))
+        last_messages = {row[0]: row[1:] for row in cr.fetchall()}
+        cr.execute("""
+            SELECT id, user_id, token, platform FROM messaging_push_device WHERE user_id = ANY(%s)
+        """, ([n['user_id'] for n in batch],))
+        devices = {}
+        for device_id, user_id, token, platform in cr.fetchall():
+            devices.setdefault(user_id, []).append((device_id, token, platform))
+
+        entries = []
+        for notification in batch:
+            body, thread_name, author_name = last_messages.get(notification['last_message_id'], (None, None, None))
+            count = notification['message_count']
+            if body is None:
+                text = f"{count} new messages"
+            else:
+                preview = body if len(body) <= PUSH_PREVIEW_LENGTH else body[:PUSH_PREVIEW_LENGTH - 1] + '…'
+                text = f"{author_name}: {preview}" + (f" (+{count - 1} more)" if count > 1 else '')
+            for device_id, token, platform in devices.get(notification['user_id'], []):
+                entries.append({
+                    'id': device_id,
+                    'notification_id': notification['id'],
+                    'token': token,
+                    'platform': platform,
+                    'title': thread_name or 'New messages',
+                    'body': text,
+                    'data': {
+                        'thread_id': notification['last_thread_id'],
+                        'message_id': notification['last_message_id'],
+                        'message_count': count,
+                    },
+                })
+        return entries
+
+    @api.model
+    def _apply_push_results(self, batch, entries, results):
+        """Drop delivered pushes and invalid devices; back off the pushes with a transient failure."""
+        states = {result.id: result.state for result in results}
+        by_notification = {}
+        for entry in entries:
+            by_notification.setdefault(entry['notification_id'], []).append(states.get(entry['id'], 'retry'))
+
+        now = fields.Datetime.now()
+        done, retry_ids, next_attempts, failed = [], [], [], 0
+        for notification in batch:
+            outcome = by_notification.get(notification['id'], [])
+            if 'retry' not in outcome:
+                done.append(notification['id'])
+            elif notification['attempts'] >= PUSH_MAX_ATTEMPTS:
+                done.append(notification['id'])
+                failed += 1
+            else:
+                delay = min(PUSH_BACKOFF_MAX, PUSH_BACKOFF_BASE * 2 ** (notification['attempts'] - 1))
+                retry_ids.append(notification['id'])
+                next_attempts.append(now + timedelta(seconds=delay * (0.5 + random.random())))
+
+        cr = self.env.cr
+        invalid = [result.id for result in results if result.state == 'invalid']
+        if invalid:
+            cr.execute("DELETE FROM messaging_push_device WHERE id = ANY(%s)", (invalid,))
+        if done:
+            cr.execute("DELETE FROM messaging_push_notification WHERE id = ANY(%s)", (done,))
+        if retry_ids:
+            cr.execute("""
+                UPDATE messaging_push_notification n
+                   SET state = 'retry', next_attempt = v.next_attempt, claimed_at = NULL
+                  FROM unnest(%s::int[], %s::timestamp[]) AS v(id, next_attempt)
+                 WHERE n.id = v.id
+            """, (retry_ids, next_attempts))
+
+        metrics.inc('messaging_api_push_total', sum(1 for r in results if r.state == 'sent'), result='sent')
+        metrics.inc('messaging_api_push_total', len(invalid), result='invalid')
+        metrics.inc('messaging_api_push_total', len(retry_ids), result='retry')
+        metrics.inc('messaging_api_push_total', failed, result='failed')
+
+
+class MessagingMessage(models.Model):
+    _inherit = 'messaging.message'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        if not self.env.context.get('skip_push'):
+            self.env['messaging.push.notification'].sudo()._enqueue(records.ids)
+        return records
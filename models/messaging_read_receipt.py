@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+from psycopg2.errors import SerializationFailure
+
+from odoo import models, fields, api, tools
+
+FLUSH_BATCH_SIZE = 5000
+FLUSH_TIME_BUDGET = 50  # seconds; the cron re-triggers itself to continue
+
+
+class MessagingReadReceipt(models.Model):
+    """Read watermarks waiting to be applied to messages.
+
+    ``/api/messaging/message/read`` only raises the caller's watermark for the
+    thread, one narrow row per (partner, thread). The flush cron applies the
+    watermarks to ``messaging.message`` in batched UPDATEs; until then the read
+    endpoints merge the caller's watermarks into the stored ``is_read``.
+    """
+    _name = 'messaging.read.receipt'
+    _description = 'Messaging Pending Read Receipt'
+    _order = 'id'
+    _log_access = False
+
+    partner_id = fields.Integer(string='Partner ID', required=True)
+    thread_id = fields.Integer(string='Thread ID', required=True)
+    message_id = fields.Integer(string='Highest Read Message ID', required=True)
+
+    def init(self):
+        tools.create_unique_index(
+            self._cr, 'messaging_read_receipt_partner_thread_uniq', self._table, ['partner_id', 'thread_id']
+        )
+
+    @api.model
+    def _buffer(self, partner_id, message_ids):
+        """Raise the partner's watermark in each thread of ``message_ids``; return the messages covered.
+
+        Archived messages count as well. Messages of threads the partner does
+        not belong to are ignored.
+        """
+        cr = self.env.cr
+        cr.execute("""
+            WITH acknowledged AS (
+                SELECT m.thread_id, max(m.id) AS message_id, count(*) AS message_count
+                  FROM (
+                        SELECT id, thread_id FROM messaging_message WHERE id = ANY(%(message_ids)s)
+                     UNION ALL
+                        SELECT id, thread_id FROM messaging_message_archive WHERE id = ANY(%(message_ids)s)
+                  ) m
+                  JOIN messaging_thread_res_partner_rel member
+                    ON member.messaging_thread_id = m.thread_id AND member.res_partner_id = %(partner_id)s
+              GROUP BY m.thread_id
+            ), buffered AS (
+                INSERT INTO messaging_read_receipt (partner_id, thread_id, message_id)
+                SELECT %(partner_id)s, thread_id, message_id FROM acknowledged
+                ON CONFLICT (partner_id, thread_id) DO UPDATE
+                   SET message_id = EXCLUDED.message_id
+                 WHERE messaging_read_receipt.message_id < EXCLUDED.message_id
+            )
+            SELECT COALESCE(sum(message_count), 0) FROM acknowledged
+        """, {'partner_id': partner_id, 'message_ids': list(message_ids)})
+        return cr.fetchone()[0]
+
+    @api.model
+    def _watermarks(self, partner_id):
+        """Return ``partner_id``'s pending watermarks as {thread_id: highest read message id}."""
+        self.env.cr.execute(
+            "SELECT thread_id, message_id FROM messaging_read_receipt WHERE partner_id = %s", (partner_id,)
+        )
+        return dict(self.env.cr.fetchall())
+
+    @api.model
+    def _flush(self, batch_size=FLUSH_BATCH_SIZE):
+        """Apply one batch of pending watermarks; return (watermarks applied, messages marked read).
+
+        Watermarks a request is raising right now are locked by it and left to
+        the next batch.
+        """
+        self.env['messaging.message'].flush_model(['is_read'])
+        cr = self.env.cr
+        cr.execute("""
+            WITH claimed AS (
+                SELECT id FROM messaging_read_receipt
+              ORDER BY id
+                 LIMIT %(limit)s
+                   FOR UPDATE SKIP LOCKED
+            ), pending AS (
+                DELETE FROM messaging_read_receipt receipt
+                 USING claimed
+                 WHERE receipt.id = claimed.id
+             RETURNING receipt.partner_id, receipt.thread_id, receipt.message_id
+            ), marked AS (
+                UPDATE messaging_message m
+                   SET is_read = true, write_uid = %(uid)s, write_date = now() AT TIME ZONE 'UTC'
+                  FROM pending
+                 WHERE m.thread_id = pending.thread_id
+                   AND m.id <= pending.message_id
+                   AND m.is_read IS NOT TRUE
+                   AND m.author_id != pending.partner_id
+             RETURNING m.thread_id, m.id
+            )
+            SELECT (SELECT count(*) FROM pending),
+                   COALESCE((SELECT array_agg(ARRAY[thread_id, id]) FROM marked), '{}')
+        """, {'limit': batch_size, 'uid': self.env.uid})
+        applied, marked = cr.fetchone()
+        entries = [(thread_id, message_id, None) for thread_id, message_id in marked]
+        if entries:
+            self.env['messaging.message'].invalidate_model(['is_read'])
+            self.env['messaging.change']._log('read', entries)
+        return applied, len(entries)
+
+    @api.model
+    def _flush_read_receipts(self, batch_size=FLUSH_BATCH_SIZE, time_budget=FLUSH_TIME_BUDGET):
+        """Cron entry point: apply the pending watermarks, one committed batch at a time."""
+        deadline = time.monotonic() + time_budget
+        marked = 0
+        exhausted = False
+        while True:
+            if time.monotonic() >= deadline:
+                exhausted = True
+                break
+            try:
+                applied, batch_marked = self._flush(batch_size)
+            except SerializationFailure:
+                # A request updated the same messages; the batch is retried on the next run.
+                self.env.cr.rollback()
+                self.env.invalidate_all()
+                exhausted = True
+                break
+            self.env.cr.commit()
+            marked += batch_marked
+            if applied < batch_size:
+                break
+
+        if exhausted:
+            self.env.ref('messaging_api.ir_cron_messaging_read_receipt_flush').sudo()._trigger()
+        return marked
@@ -0,0 +1,467 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import random
+import re
+import time
+from datetime import timedelta
+
+from odoo import models, fields, api, tools
+
+from ..tools.metrics import registry as metrics
+from ..tools.sms_gateway import SmsResult, get_gateway
+
+_logger = logging.getLogger(__name__)
+
+SMS_MAX_ATTEMPTS = 5
+SMS_BACKOFF_BASE = 30
+SMS_BACKOFF_MAX = 3600
+SMS_DISPATCH_TIME_BUDGET = 50
+SMS_INBOUND_GATEWAY = 'webhook'
+
+E164_PATTERN = re.compile(r'^\+[1-9]\d{6,14}$')
+
+# Delivery-receipt statuses as reported by common providers, mapped to sms_status.
+SMS_RECEIPT_STATES = {
+    'queued': 'sent',
+    'accepted': 'sent',
+    'sent': 'sent',
+    'delivered': 'delivered',
+    'undelivered': 'failed',
+    'failed': 'failed',
+    'rejected': 'failed',
+    'expired': 'failed',
+}
+# Statuses only move forward; delivered and failed are final.
+SMS_STATUS_RANK = {'pending': 0, 'sent': 1, 'delivered': 2, 'failed': 2}
+
+
+class MessagingThread(models.Model):
+    _inherit = 'messaging.thread'
+
+    phone_number = fields.Char(string='Phone Number', index=True)
+
+
+class MessagingMessage(models.Model):
+    _inherit = 'messaging.message'
+
+    sms_gateway = fields.Char(string='SMS Gateway', copy=False)
+    sms_provider_message_id = fields.Char(string='Provider Message ID', copy=False)
+    sms_attempts = fields.Integer(string='SMS Attempts', default=0, copy=False)
+    sms_next_attempt = fields.Datetime(string='Next SMS Attempt', copy=False)
+    sms_error = fields.Char(string='SMS Error', copy=False)
+    sms_status = fields.Selection(selection_add=[('received', 'Received')])
+
+    def init(self):
+        super().init()
+        tools.create_index(
+            self._cr, 'messaging_message_sms_queue_idx', self._table, ['id'],
+            where="message_type = 'sms' AND sms_status = 'pending'",
+        )
+        # Gateways retry webhooks; the unique index makes inbound ingestion idempotent.
+        tools.create_unique_index(
+            self._cr, 'messaging_message_sms_provider_uniq', self._table, ['sms_provider_message_id'],
+        )
+
+    @api.model
+    def _default_sms_gateway(self):
+        return self.env['ir.config_parameter'].sudo().get_param('messaging_api.sms_gateway')
+
+    @api.model
+    def _normalize_sms_number(self, number):
+        """Return the number in E.164 format, or None when it cannot be one."""
+        if not number or not isinstance(number, str):
+            return None
+        number = number.strip()
+        digits = re.sub(r'\D', '', number)
+        if number.startswith('+'):
+            candidate = '+' + digits
+        elif digits.startswith('00'):
+            candidate = '+' + digits[2:]
+        else:
+            country = self.env.company.country_id
+            if not country.phone_code:
+                return None
+            candidate = f'+{country.phone_code}{digits.lstrip("0")}'
+            try:
+                from odoo.addons.phone_validation.tools.phone_validation import phone_format
+            except ImportError:
+                phone_format = None
+            if phone_format:
+                # Uses the phonenumbers library when installed, for national trunk prefixes.
+                formatted = phone_format(
+                    number, country.code, country.phone_code, force_format='E164', raise_exception=False,
+                )
+                if formatted and E164_PATTERN.match(formatted):
+                    candidate = formatted
+        return candidate if E164_PATTERN.match(candidate) else None
+
+    @api.model
+    def _get_sms_threads(self, numbers, partner_id, any_member=False):
+        """Return {number: thread} for the partner's SMS threads, creating missing ones in one batch.
+
+        SMS threads belong to their participants: another user texting the same
+        number gets a thread of their own, and members are never added here.
+        With ``any_member`` (inbound SMS) the number's most recently active
+        thread is used whoever it belongs to; ``partner_id`` only owns the new
+        ones.
+        """
+        Thread = self.env['messaging.thread']
+        domain = [('thread_type', '=', 'sms'), ('phone_number', 'in', list(numbers))]
+        if not any_member:
+            domain.append(('partner_ids', 'in', [partner_id]))
+        by_number = {}
+        for thread in Thread.search(domain, order='last_message_date desc nulls last, id desc'):
+            by_number.setdefault(thread.phone_number, thread)
+
+        missing = [number for number in numbers if number not in by_number]
+        if missing:
+            created = Thread.create([{
+                'name': number,
+                'thread_type': 'sms',
+                'phone_number': number,
+                'partner_ids': [(6, 0, [partner_id])],
+            } for number in missing])
+            by_number.update(zip(missing, created))
+        return by_number
+
+    @api.model
+    def _queue_sms(self, numbers, body, author_partner_id=None, mirror=True):
+        """Create one pending SMS message per number and wake up the dispatcher."""
+        author_partner_id = author_partner_id or self.env.user.partner_id.id
+        normalized = (self._normalize_sms_number(n) for n in numbers)
+        numbers = list(dict.fromkeys(n for n in normalized if n))
+        if not numbers:
+            return self.browse()
+
+        threads = self._get_sms_threads(numbers, author_partner_id)
+        gateway = self._default_sms_gateway()
+        messages = self.with_context(skip_mail_sync=not mirror).create([{
+            'thread_id': threads[number].id,
+            'author_id': author_partner_id,
+            'body': body,
+            'message_type': 'sms',
+            'phone_number': number,
+            'sms_status': 'pending',
+            'sms_gateway': gateway,
+        } for number in numbers])
+
+        cron = self.env.ref('messaging_api.ir_cron_sms_dispatch', raise_if_not_found=False)
+        if cron and gateway:
+            cron.sudo()._trigger()
+        return messages
+
+    @api.model
+    def _dispatch_sms(self, time_budget=SMS_DISPATCH_TIME_BUDGET):
+        """Send pending SMS per gateway in rate-limited batches; return the number processed."""
+        default_gateway = self._default_sms_gateway()
+        if not default_gateway:
+            return 0
+
+        self.env.cr.execute("""
+            SELECT DISTINCT COALESCE(sms_gateway, %s) FROM messaging_message
+             WHERE message_type = 'sms' AND sms_status = 'pending'
+        """, (default_gateway,))
+        gateway_names = [row[0] for row in self.env.cr.fetchall()]
+
+        deadline = time.monotonic() + time_budget
+        processed = 0
+        exhausted = False
+        for gateway_name in gateway_names:
+            try:
+                gateway = get_gateway(self.env, gateway_name)
+            except ValueError as e:
+                _logger.error(f"Error dispatching SMS: {str(e)}")
+                continue
+
+            while True:
+                if time.monotonic() >= deadline:
+                    exhausted = True
+                    break
+                batch = self._claim_sms_batch(gateway_name, default_gateway, gateway.batch_size)
+                if not batch:
+                    break
+
+                started = time.monotonic()
+                try:
+                    results = gateway.send_batch(batch)
+                except Exception as e:
+                    _logger.error(f"Error sending SMS batch via {gateway_name}: {str(e)}")
+                    results = [SmsResult(m['id'], 'retry', None, str(e)) for m in batch]
+                self._apply_sms_results(batch, results)
+                self.env.cr.commit()
+                processed += len(batch)
+
+                # Provider rate limit: a batch may not go faster than rate_per_second.
+                wait = len(batch) / gateway.rate_per_second - (time.monotonic() - started)
+                if wait > 0:
+                    time.sleep(wait)
+
+        if exhausted:
+            self.env.ref('messaging_api.ir_cron_sms_dispatch').sudo()._trigger()
+        self.env.invalidate_all()
+        return processed
+
+    @api.model
+    def _claim_sms_batch(self, gateway_name, default_gateway, limit):
+        """Lock a batch of due SMS for this transaction; concurrent dispatchers skip them."""
+        self.env.cr.execute("""
+            SELECT id, phone_number, body, sms_attempts
+              FROM messaging_message
+             WHERE message_type = 'sms'
+               AND sms_status = 'pending'
+               AND phone_number IS NOT NULL
+               AND COALESCE(sms_gateway, %s) = %s
+               AND (sms_next_attempt IS NULL OR sms_next_attempt <= (now() AT TIME ZONE 'UTC'))
+          ORDER BY id
+             LIMIT %s
+               FOR UPDATE SKIP LOCKED
+        """, (default_gateway, gateway_name, limit))
+        return [
+            {'id': row[0], 'number': row[1], 'body': row[2], 'attempts': row[3] or 0}
+            for row in self.env.cr.fetchall()
+        ]
+
+    @api.model
+    def _apply_sms_results(self, batch, results):
+        """Write the outcome of a batch with one UPDATE and log the status changes."""
+        attempts = {m['id']: m['attempts'] for m in batch}
+        now = fields.Datetime.now()
+        ids, states, provider_ids, next_attempts, errors = [], [], [], [], []
+        for result in results:
+            attempt = attempts.get(result.message_id, 0) + 1
+            state, next_attempt = result.state, None
+            if state == 'retry':
+                if attempt >= SMS_MAX_ATTEMPTS:
+                    state = 'failed'
+                else:
+                    state = 'pending'
+                    delay = min(SMS_BACKOFF_MAX, SMS_BACKOFF_BASE * 2 ** (attempt - 1))
+                    next_attempt = now + timedelta(seconds=delay * (0.5 + random.random()))
+            ids.append(result.message_id)
+            states.append(state)
+            provider_ids.append(result.provider_message_id)
+            next_attempts.append(next_attempt)
+            errors.append(result.error)
+
+        if not ids:
+            return
+        self.env.cr.execute("""
+            UPDATE messaging_message m
+               SET sms_status = v.state,
+                   sms_provider_message_id = COALESCE(v.provider_id, m.sms_provider_message_id),
+                   sms_attempts = COALESCE(m.sms_attempts, 0) + 1,
+                   sms_next_attempt = v.next_attempt,
+                   sms_error = v.error,
+                   write_date = now() AT TIME ZONE 'UTC'
+              FROM unnest(%s::int[], %s::varchar[], %s::varchar[], %s::timestamp[], %s::varchar[])
+                   AS v(id, state, provider_id, next_attempt, error)
+             WHERE m.id = v.id
+         RETURNING m.thread_id, m.id, v.state
+        """, (ids, states, provider_ids, next_attempts, errors))
+        changed = [(thread_id, message_id, None) for thread_id, message_id, state in self.env.cr.fetchall()
+                   if state != 'pending']
+        self.env['messaging.change']._log('message', changed)
+
+    @api.model
+    def _sms_inbox_user(self):
+        """User that owns inbound SMS threads (messaging_api.sms_inbox_user_id, else admin)."""
+        user_id = self.env['ir.config_parameter'].sudo().get_param('messaging_api.sms_inbox_user_id')
+        user = self.env['res.users'].sudo().browse(int(user_id)).exists() if user_id else None
+        return user or self.env.ref('base.user_admin')
+
+    @api.model
+    def _get_sms_partners(self, numbers):
+        """Return {number: partner_id} for senders, creating contacts for unknown numbers."""
+        Partner = self.env['res.partner'].with_context(tracking_disable=True, mail_create_nolog=True)
+        partners = Partner.search([('phone_sanitized', 'in', list(numbers))], order='id')
+        by_number = {}
+        for partner in partners:
+            by_number.setdefault(partner.phone_sanitized, partner.id)
+
+        missing = [number for number in numbers if number not in by_number]
+        if missing:
+            created = Partner.create([{'name': number, 'phone': number} for number in missing])
+            by_number.update(zip(missing, created.ids))
+        return by_number
+
+    @api.model
+    def _receive_sms(self, messages, gateway=None):
+        """Ingest a batch of inbound SMS with one INSERT.
+
+        Messages of threads with a Discuss channel are queued for the mirror
+        cron, which posts them there with notifications.
+
+        ``messages`` are dicts with ``phone_number``, ``message`` and an optional
+        ``provider_message_id``. Messages whose provider id was already stored,
+        or repeats one earlier in the batch, are counted as duplicates.
+        """
+        inbox_user = self._sms_inbox_user()
+        self = self.with_user(inbox_user).sudo()
+
+        valid, invalid, duplicates = [], [], 0
+        seen_provider_ids = set()
+        for index, message in enumerate(messages):
+            number = self._normalize_sms_number(message.get('phone_number'))
+            body = message.get('message')
+            if not number or not body:
+                invalid.append(index)
+                continue
+            provider_id = message.get('provider_message_id') or None
+            if provider_id:
+                provider_id = str(provider_id)
+                if provider_id in seen_provider_ids:
+                    duplicates += 1
+                    continue
+                seen_provider_ids.add(provider_id)
+            valid.append((number, body, provider_id))
+
+        message_ids = []
+        if valid:
+            numbers = list(dict.fromkeys(number for number, _body, _provider_id in valid))
+            # Replies land in the conversation that texted the number last.
+            threads = self._get_sms_threads(numbers, inbox_user.partner_id.id, any_member=True)
+            authors = self._get_sms_partners(numbers)
+
+            self.env.flush_all()
+            self.env.cr.execute("""
+                INSERT INTO messaging_message
+                       (thread_id, author_id, body, message_type, phone_number, sms_status,
+                        sms_gateway, sms_provider_message_id, sms_attempts, is_read,
+                        mail_sync_pending, mail_sync_notify,
+                        create_uid, create_date, write_uid, write_date)
+                SELECT v.thread_id, v.author_id, v.body, 'sms', v.number, 'received',
+                       %s, v.provider_id, 0, false,
+                       t.mail_channel_id IS NOT NULL, t.mail_channel_id IS NOT NULL,
+                       %s, now() AT TIME ZONE 'UTC', %s, now() AT TIME ZONE 'UTC'
+                  FROM unnest(%s::int[], %s::int[], %s::text[], %s::varchar[], %s::varchar[])
+                       AS v(thread_id, author_id, body, number, provider_id),
+                       messaging_thread t
+                 WHERE t.id = v.thread_id
+                    ON CONFLICT (sms_provider_message_id) DO NOTHING
+             RETURNING id, thread_id, mail_sync_pending
+            """, (
+                gateway or SMS_INBOUND_GATEWAY, self.env.uid, self.env.uid,
+                [threads[number].id for number, _body, _provider_id in valid],
+                [authors[number] for number, _body, _provider_id in valid],
+                [body for _number, body, _provider_id in valid],
+                [number for number, _body, _provider_id in valid],
+                [provider_id for _number, _body, provider_id in valid],
+            ))
+            inserted = self.env.cr.fetchall()
+            message_ids = [message_id for message_id, _thread_id, _pending in inserted]
+            duplicates += len(valid) - len(inserted)
+
+            if inserted:
+                # Also a write conflict with a concurrent creation of the thread's
+                # Discuss channel, which would otherwise miss these messages.
+                self.env.cr.execute("""
+                    UPDATE messaging_thread t
+                       SET last_message_date = m.create_date
+                      FROM (SELECT thread_id, max(create_date) AS create_date
+                              FROM messaging_message WHERE id = ANY(%s)
+                          GROUP BY thread_id) m
+                     WHERE t.id = m.thread_id
+                """, (message_ids,))
+                self.env['messaging.thread'].invalidate_model(['last_message_date', 'message_ids'])
+                self.env['messaging.change']._log('message', [
+                    (thread_id, message_id, None) for message_id, thread_id, _pending in inserted
+                ])
+                self.env['messaging.push.notification'].sudo()._enqueue(message_ids)
+                if any(pending for _message_id, _thread_id, pending in inserted):
+                    # Posted to the threads' Discuss channels by the mirror cron.
+                    self.env.ref('messaging_api.ir_cron_messaging_mail_mirror').sudo()._trigger()
+
+        metrics.inc('messaging_api_sms_inbound_total', len(message_ids), result='received')
+        metrics.inc('messaging_api_sms_inbound_total', duplicates, result='duplicate')
+        metrics.inc('messaging_api_sms_inbound_total', len(invalid), result='invalid')
+        return {
+            'message_ids': message_ids,
+            'duplicates': duplicates,
+            'invalid': invalid,
+        }
+
+    @api.model
+    def _apply_sms_receipts(self, receipts):
+        """Apply a batch of delivery receipts with one UPDATE.
+
+        ``receipts`` are dicts with ``provider_message_id``, ``status`` and an
+        optional ``error``. Receipts that would move a message backwards, or
+        that match no message, are ignored. Rows locked by a concurrent
+        dispatcher or receipt batch are skipped rather than waited for and
+        returned as ``deferred`` so the gateway can deliver them again.
+        """
+        latest, invalid = {}, []
+        for index, receipt in enumerate(receipts):
+            provider_id = receipt.get('provider_message_id')
+            state = SMS_RECEIPT_STATES.get(str(receipt.get('status') or '').lower())
+            if not provider_id or not state:
+                invalid.append(index)
+                continue
+            provider_id = str(provider_id)
+            # Several receipts for one message in a batch: keep the most advanced.
+            current = latest.get(provider_id)
+            if not current or SMS_STATUS_RANK[state] > SMS_STATUS_RANK[current[0]]:
+                latest[provider_id] = (state, receipt.get('error') or None)
+
+        updated, deferred = [], []
+        if latest:
+            provider_ids = list(latest)
+            states = [latest[provider_id][0] for provider_id in provider_ids]
+            ranks = [SMS_STATUS_RANK[state] for state in states]
+            errors = [latest[provider_id][1] for provider_id in provider_ids]
+
+            self.env.flush_all()
+            self.env.cr.execute("""
+                WITH receipt AS (
+                    SELECT * FROM unnest(%s::varchar[], %s::varchar[], %s::int[], %s::varchar[])
+                           AS r(provider_id, state, rank, error)
+                ), target AS (
+                    SELECT m.id, r.state, r.error
+                      FROM messaging_message m
+                      JOIN receipt r ON r.provider_id = m.sms_provider_message_id
+                     WHERE m.message_type = 'sms'
+                       AND CASE m.sms_status WHEN 'pending' THEN 0 WHEN 'sent' THEN 1 ELSE 2 END < r.rank
+                       FOR UPDATE OF m SKIP LOCKED
+                )
+                UPDATE messaging_message m
+                   SET sms_status = target.state,
+                       sms_error = COALESCE(target.error, m.sms_error),
+                       sms_next_attempt = NULL,
+                       write_date = now() AT TIME ZONE 'UTC'
+                  FROM target
+                 WHERE m.id = target.id
+             RETURNING m.thread_id, m.id, m.sms_provider_message_id
+            """, (provider_ids, states, ranks, errors))
+            updated = self.env.cr.fetchall()
+
+            applied = {provider_id for _thread_id, _message_id, provider_id in updated}
+            remaining = [provider_id for provider_id in provider_ids if provider_id not in applied]
+            if remaining:
+                # Whatever would still move forward was skipped because it was locked.
+                self.env.cr.execute("""
+                    SELECT m.sms_provider_message_id
+                      FROM messaging_message m
+                      JOIN unnest(%s::varchar[], %s::int[]) AS r(provider_id, rank)
+                        ON r.provider_id = m.sms_provider_message_id
+                     WHERE m.message_type = 'sms'
+                       AND CASE m.sms_status WHEN 'pending' THEN 0 WHEN 'sent' THEN 1 ELSE 2 END < r.rank
+                """, (remaining, [SMS_STATUS_RANK[latest[provider_id][0]] for provider_id in remaining]))
+                deferred = [row[0] for row in self.env.cr.fetchall()]
+
+            if updated:
+                self.invalidate_model(['sms_status', 'sms_error', 'sms_next_attempt'])
+                self.env['messaging.change']._log('message', [
+                    (thread_id, message_id, None) for thread_id, message_id, _provider_id in updated
+                ])
+
+        ignored = len(latest) - len(updated) - len(deferred)
+        metrics.inc('messaging_api_sms_receipts_total', len(updated), result='updated')
+        metrics.inc('messaging_api_sms_receipts_total', ignored, result='ignored')
+        metrics.inc('messaging_api_sms_receipts_total', len(deferred), result='deferred')
+        return {
+            'updated': len(updated),
+            'ignored': ignored,
+            'deferred': deferred,
+            'invalid': invalid,
+        }
@@ -1,6 +1,40 @@
 # -*- coding: utf-8 -*-
 
-from odoo import models, fields, api
+import logging
+import time
+
+from psycopg2.errors import SerializationFailure
+
+from odoo import models, fields, api, tools
+
+_logger = logging.getLogger(__name__)
+
+# Message fields whose changes are replayed to clients by the delta sync.
+SYNC_MESSAGE_FIELDS = {'author_id', 'body', 'message_type', 'attachment_ids', 'phone_number', 'sms_status'}
+
+# Group threads with at least this many participants switch to large-group mode
+# (messaging_api.large_group_threshold).
+DEFAULT_LARGE_GROUP_THRESHOLD = 500
+
+# Thread types whose Discuss channel is created in the background for internal
+# members (messaging_api.discuss_channel_types); others get one on first use.
+DEFAULT_DISCUSS_CHANNEL_TYPES = 'chat,group'
+CHANNEL_CREATE_BATCH_SIZE = 200
+CHANNEL_CREATE_TIME_BUDGET = 50
+
+# Chat threads with at most this many participants are direct chats: one per
+# participant set, reused by /api/messaging/thread/create.
+DIRECT_CHAT_MAX_PARTICIPANTS = 2
+DIRECT_CHAT_MERGE_BATCH_SIZE = 100
+DIRECT_CHAT_MERGE_TIME_BUDGET = 50
+
+
+def direct_chat_key(thread_type, partner_ids):
+    """Return the canonical participant key of a direct chat, None for other threads."""
+    partner_ids = set(partner_ids)
+    if thread_type != 'chat' or not 0 < len(partner_ids) <= DIRECT_CHAT_MAX_PARTICIPANTS:
+        return None
+    return ','.join(str(pid) for pid in sorted(partner_ids))
 
 
 class MessagingThread(models.Model):
@@ -19,14 +53,153 @@ class MessagingThread(models.Model):
     active = fields.Boolean(default=True)
     last_message_date = fields.Datetime(string='Last Message Date', compute='_compute_last_message_date', store=True)
     mail_channel_id = fields.Many2one('discuss.channel', string='Discuss Channel', copy=False, readonly=True)
+    mail_channel_pending = fields.Boolean(
+        string='Discuss Channel Queued', copy=False, readonly=True,
+        help='The Discuss channel is created by the background job shortly after.',
+    )
+    participant_count = fields.Integer(string='Participant Count', compute='_compute_participant_count', store=True)
+    large_group_mode = fields.Selection([
+        ('auto', 'From Threshold'),
+        ('on', 'Always'),
+        ('off', 'Never'),
+    ], string='Large Group Mode', default='auto', required=True,
+        help='Force large-group mode on or off regardless of the participant count.',
+    )
+    large_group = fields.Boolean(
+        string='Large Group', compute='_compute_large_group', store=True,
+        help='Participants are listed page by page, summaries only carry the participant count '
+             'and messages reach Discuss through the background mirror.',
+    )
+    participant_key = fields.Char(
+        string='Participant Key', compute='_compute_participant_key', store=True, copy=False,
+        help='Sorted participant ids of a direct chat, empty for other threads.',
+    )
+
+    def init(self):
+        # Inbox pages are read in this order by /api/messaging/threads.
+        tools.create_index(
+            self._cr, 'messaging_thread_last_message_date_idx', self._table,
+            ['last_message_date DESC NULLS LAST', 'id DESC'], where='active',
+        )
+        self._init_member_sort_key()
+        # Create-or-get of direct chats looks them up by participant set.
+        tools.create_index(
+            self._cr, 'messaging_thread_participant_key_idx', self._table,
+            ['participant_key'], where='participant_key IS NOT NULL AND active',
+        )
+        tools.create_index(
+            self._cr, 'messaging_thread_mail_channel_pending_idx', self._table, ['id'],
+            where='mail_channel_pending',
+        )
+
+    def _init_member_sort_key(self):
+        """Copy ``last_message_date`` onto every membership row, so one member's inbox is an index range.
+
+        Not an ORM field: triggers keep it in step, also with the raw SQL
+        writes of SMS ingestion and history imports. A message therefore
+        updates one membership row per participant.
+        """
+        relation = self._fields['partner_ids'].relation
+        cr = self._cr
+        if not tools.column_exists(cr, relation, 'last_message_date'):
+            cr.execute(f"""
+                ALTER TABLE {relation} ADD COLUMN last_message_date timestamp;
+                UPDATE {relation} member SET last_message_date = t.last_message_date
+                  FROM {self._table} t
+                 WHERE t.id = member.messaging_thread_id AND t.last_message_date IS NOT NULL;
+            """)
+        cr.execute(f"""
+            CREATE OR REPLACE FUNCTION messaging_thread_member_sort_key_copy() RETURNS trigger AS $$
+            BEGIN
+                UPDATE {relation} SET last_message_date = NEW.last_message_date
+                 WHERE messaging_thread_id = NEW.id;
+                RETURN NULL;
+            END $$ LANGUAGE plpgsql;
+
+            CREATE OR REPLACE FUNCTION messaging_thread_member_sort_key_init() RETURNS trigger AS $$
+            BEGIN
+                SELECT last_message_date INTO NEW.last_message_date
+                  FROM {self._table} WHERE id = NEW.messaging_thread_id;
+                RETURN NEW;
+            END $$ LANGUAGE plpgsql;
+
+            DROP TRIGGER IF EXISTS messaging_thread_member_sort_key_copy ON {self._table};
+            CREATE TRIGGER messaging_thread_member_sort_key_copy
+                AFTER UPDATE OF last_message_date ON {self._table}
+                FOR EACH ROW WHEN (OLD.last_message_date IS DISTINCT FROM NEW.last_message_date)
+                EXECUTE FUNCTION messaging_thread_member_sort_key_copy();
+
+            DROP TRIGGER IF EXISTS messaging_thread_member_sort_key_init ON {relation};
+            CREATE TRIGGER messaging_thread_member_sort_key_init
+                BEFORE INSERT ON {relation}
+                FOR EACH ROW EXECUTE FUNCTION messaging_thread_member_sort_key_init();
+        """)
+        # Per-member inbox order of the SQL read path (tools/read_path.py).
+        tools.create_index(
+            cr, 'messaging_thread_member_last_message_date_idx', relation,
+            ['res_partner_id', 'last_message_date DESC NULLS LAST', 'messaging_thread_id DESC'],
+        )
+
+    @api.depends('partner_ids')
+    def _compute_participant_count(self):
+        for thread in self:
+            thread.participant_count = len(thread.partner_ids)
+
+    @api.depends('participant_count', 'thread_type', 'large_group_mode')
+    def _compute_large_group(self):
+        threshold = int(self.env['ir.config_parameter'].sudo().get_param(
+            'messaging_api.large_group_threshold', DEFAULT_LARGE_GROUP_THRESHOLD
+        ))
+        for thread in self:
+            if thread.large_group_mode != 'auto':
+                thread.large_group = thread.large_group_mode == 'on'
+                continue
+            thread.large_group = thread.thread_type == 'group' and thread.participant_count >= threshold
+
+    @api.depends('thread_type', 'partner_ids')
+    def _compute_participant_key(self):
+        for thread in self:
+            # Group members are never read: only chats can be direct chats.
+            if thread.thread_type != 'chat':
+                thread.participant_key = False
+                continue
+            thread.participant_key = direct_chat_key(thread.thread_type, thread.partner_ids.ids) or False
+
+    @api.model
+    def _find_direct_chat(self, partner_ids):
+        """Return the active direct chat between exactly ``partner_ids``, if there is one."""
+        key = direct_chat_key('chat', partner_ids)
+        if not key:
+            return self.browse()
+        return self.search([('participant_key', '=', key)], order='id', limit=1)
+
+    def _is_member(self, partner_id):
+        """Return True when the partner participates, without loading the member list."""
+        self.ensure_one()
+        self.flush_model(['partner_ids'])
+        self.env.cr.execute("""
+            SELECT 1 FROM messaging_thread_res_partner_rel
+             WHERE messaging_thread_id = %s AND res_partner_id = %s
+        """, (self.id, partner_id))
+        return bool(self.env.cr.fetchone())
 
     @api.depends('message_ids.create_date')
     def _compute_last_message_date(self):
+        # Threads whose hot messages were all archived keep their place in the inbox.
+        cold_ids = [thread._origin.id for thread in self if not thread.message_ids and thread._origin.id]
+        archived_dates = {}
+        if cold_ids:
+            archived_dates = {
+                thread.id: create_date
+                for thread, create_date in self.env['messaging.message.archive'].sudo()._read_group(
+                    [('thread_id', 'in', cold_ids)], ['thread_id'], ['create_date:max'],
+                )
+            }
         for thread in self:
             if thread.message_ids:
                 thread.last_message_date = max(thread.message_ids.mapped('create_date'))
             else:
-                thread.last_message_date = False
+                thread.last_message_date = archived_dates.get(thread._origin.id, False)
 
     def _channel_type_value(self):
         self.ensure_one()
@@ -35,13 +208,28 @@ class MessagingThread(models.Model):
         return 'chat'
 
     def _ensure_mail_channel(self):
+        """Create the Discuss channel of the threads that have none.
+
+        Their messages sent so far are mirrored to it as history by the mirror
+        cron, with their original dates.
+        """
         channel_env = self.env['discuss.channel']
         if self.env.context.get('messaging_api_skip_channel_user'):
             channel_env = channel_env.with_context(install_mode=True)
 
-        for thread in self:
+        missing = self.filtered(lambda t: not t.mail_channel_id)
+        if missing:
+            # Senders touch channel-less threads (see MessagingMessage.create): a
+            # message committed after this transaction's snapshot makes the lock
+            # fail with a serialization error instead of missing the flag below.
+            self.env.cr.execute(
+                "SELECT id FROM messaging_thread WHERE id = ANY(%s) FOR UPDATE", (missing.ids,)
+            )
+            missing.invalidate_recordset(['mail_channel_id'])
+
+        created = self.browse()
+        for thread in missing:
             if thread.mail_channel_id:
-                thread._sync_mail_channel()
                 continue
 
             channel_vals = {
@@ -52,11 +240,90 @@ class MessagingThread(models.Model):
             }
             channel = channel_env.create(channel_vals)
             thread.mail_channel_id = channel
+            created |= thread
+        self.filtered('mail_channel_pending').mail_channel_pending = False
+
+        if created:
+            self.env['messaging.message'].flush_model(['thread_id', 'mail_message_id', 'mail_sync_pending'])
+            # Also rewrites rows the mirror is clearing right now, so none is lost.
+            self.env.cr.execute("""
+                UPDATE messaging_message SET mail_sync_pending = true
+                 WHERE thread_id = ANY(%s) AND mail_message_id IS NULL
+            """, (created.ids,))
+            if self.env.cr.rowcount:
+                self.env['messaging.message'].invalidate_model(['mail_sync_pending'])
+                self.env.ref('messaging_api.ir_cron_messaging_mail_mirror').sudo()._trigger()
+
+    def _schedule_mail_channels(self):
+        """Queue a Discuss channel for the threads an internal user could open in the web client.
+
+        Only thread types listed in ``messaging_api.discuss_channel_types``
+        (default chat and group) qualify; other threads get their channel on
+        first use through the API, e.g. a reaction.
+        """
+        thread_types = self.env['ir.config_parameter'].sudo().get_param(
+            'messaging_api.discuss_channel_types', DEFAULT_DISCUSS_CHANNEL_TYPES
+        ).split(',')
+        candidates = self.filtered(lambda t: (
+            t.active and not t.mail_channel_id and not t.mail_channel_pending
+            and t.thread_type in thread_types
+        ))
+        if not candidates:
+            return
+        self.flush_model(['partner_ids'])
+        self.env.cr.execute("""
+            SELECT DISTINCT rel.messaging_thread_id
+              FROM messaging_thread_res_partner_rel rel
+              JOIN res_users u ON u.partner_id = rel.res_partner_id AND u.active AND NOT u.share
+             WHERE rel.messaging_thread_id = ANY(%s)
+        """, (candidates.ids,))
+        scheduled = self.browse([row[0] for row in self.env.cr.fetchall()])
+        if scheduled:
+            scheduled.mail_channel_pending = True
+            self.env.ref('messaging_api.ir_cron_messaging_channel_create').sudo()._trigger()
 
-    def _sync_mail_channel(self):
+    @api.model
+    def _create_pending_mail_channels(self, batch_size=CHANNEL_CREATE_BATCH_SIZE,
+                                      time_budget=CHANNEL_CREATE_TIME_BUDGET):
+        """Create the queued Discuss channels, one committed batch at a time; return how many."""
+        deadline = time.monotonic() + time_budget
+        created = 0
+        exhausted = False
+        while True:
+            if time.monotonic() >= deadline:
+                exhausted = True
+                break
+            # Threads a request is giving a channel right now are left to it.
+            self.env.cr.execute("""
+                SELECT id FROM messaging_thread
+                 WHERE mail_channel_pending
+              ORDER BY id
+                 LIMIT %s
+                   FOR UPDATE SKIP LOCKED
+            """, (batch_size,))
+            threads = self.sudo().browse([row[0] for row in self.env.cr.fetchall()])
+            if not threads:
+                break
+            try:
+                threads.with_context(messaging_api_skip_channel_user=True)._ensure_mail_channel()
+            except SerializationFailure:
+                # A message was sent to one of these threads meanwhile; retry on the next run.
+                self.env.cr.rollback()
+                self.env.invalidate_all()
+                exhausted = True
+                break
+            self.env.cr.commit()
+            self.env.invalidate_all()
+            created += len(threads)
+
+        if exhausted:
+            self.env.ref('messaging_api.ir_cron_messaging_channel_create').sudo()._trigger()
+        return created
+
+    def _sync_mail_channel(self, previous_members=None):
         for thread in self:
             if not thread.mail_channel_id:
-                thread._ensure_mail_channel()
+                # Created from the thread's current state when it is needed.
                 continue
 
             channel = thread.mail_channel_id.sudo()
@@ -72,7 +339,14 @@ class MessagingThread(models.Model):
             if updates:
                 channel.write(updates)
 
-            if set(channel.channel_partner_ids.ids) != set(thread.partner_ids.ids):
+            if previous_members is not None and thread.id in previous_members:
+                # Apply only the membership delta instead of comparing full member lists.
+                before = previous_members[thread.id]
+                after = set(thread.partner_ids.ids)
+                commands = [(4, pid) for pid in after - before] + [(3, pid) for pid in before - after]
+                if commands:
+                    channel.write({'channel_partner_ids': commands})
+            elif set(channel.channel_partner_ids.ids) != set(thread.partner_ids.ids):
                 channel.write({'channel_partner_ids': [(6, 0, thread.partner_ids.ids)]})
 
             if channel.messaging_thread_id != thread:
@@ -81,17 +355,136 @@ class MessagingThread(models.Model):
     @api.model
     def create(self, vals):
         records = super().create(vals)
-        records._ensure_mail_channel()
+        records._schedule_mail_channels()
+        records._log_membership_changes({thread.id: set() for thread in records})
         return records
 
     def write(self, vals):
+        previous_members = None
+        if 'partner_ids' in vals:
+            previous_members = {thread.id: set(thread.partner_ids.ids) for thread in self}
+
         res = super().write(vals)
         tracked_fields = {'name', 'thread_type', 'partner_ids', 'active'}
         if tracked_fields.intersection(vals.keys()):
-            self._sync_mail_channel()
+            self._sync_mail_channel(previous_members)
+            self._schedule_mail_channels()
+            if previous_members is not None:
+                self._log_membership_changes(previous_members)
+            else:
+                self.env['messaging.change']._log('thread', [(thread.id, None, None) for thread in self])
         return res
 
+    def _log_membership_changes(self, previous_members):
+        """Record thread and participant changes against the previous member sets."""
+        Change = self.env['messaging.change']
+        Change._log('thread', [(thread.id, None, None) for thread in self])
+        added, removed = [], []
+        for thread in self:
+            before = previous_members.get(thread.id, set())
+            after = set(thread.partner_ids.ids)
+            added.extend((thread.id, None, pid) for pid in after - before)
+            removed.extend((thread.id, None, pid) for pid in before - after)
+        Change._log('member_add', added)
+        Change._log('member_remove', removed)
+
+    @api.model
+    def _merge_duplicate_direct_chats(self, batch_size=DIRECT_CHAT_MERGE_BATCH_SIZE,
+                                      time_budget=DIRECT_CHAT_MERGE_TIME_BUDGET):
+        """Fold direct chats sharing a participant set into the oldest one, one committed batch at a time.
+
+        Returns the number of threads merged away. The cron runs again right
+        away when ``time_budget`` runs out before the duplicates do.
+        """
+        self.env.flush_all()
+        deadline = time.monotonic() + time_budget
+        merged = 0
+        exhausted = False
+        while True:
+            if time.monotonic() >= deadline:
+                exhausted = True
+                break
+            self.env.cr.execute("""
+                SELECT array_agg(id ORDER BY id)
+                  FROM messaging_thread
+                 WHERE participant_key IS NOT NULL AND active
+              GROUP BY participant_key
+                HAVING count(*) > 1
+                 LIMIT %s
+            """, (batch_size,))
+            groups = [row[0] for row in self.env.cr.fetchall()]
+            if not groups:
+                break
+            for thread_ids in groups:
+                self.browse(thread_ids[0])._merge_threads(self.browse(thread_ids[1:]))
+                merged += len(thread_ids) - 1
+            self.env.cr.commit()
+            self.env.invalidate_all()
+            _logger.info("MessagingAPI: merged %s duplicate direct chats (%s total)", len(groups), merged)
+
+        if exhausted:
+            self.env.ref('messaging_api.ir_cron_messaging_direct_chat_merge').sudo()._trigger()
+        return merged
+
+    def _merge_threads(self, duplicates):
+        """Move the messages, Discuss history and pending state of ``duplicates`` here, then delete them."""
+        self.ensure_one()
+        cr = self.env.cr
+        duplicate_ids = duplicates.ids
+        # Sends into a duplicate wait for the merge, then fail instead of losing the message.
+        cr.execute("SELECT id FROM messaging_thread WHERE id = ANY(%s) FOR UPDATE", (duplicate_ids + [self.id],))
+        cr.execute("""
+            UPDATE messaging_message SET thread_id = %s WHERE thread_id = ANY(%s) RETURNING id
+        """, (self.id, duplicate_ids))
+        moved_ids = [row[0] for row in cr.fetchall()]
+        cr.execute("""
+            UPDATE messaging_message_archive SET thread_id = %s WHERE thread_id = ANY(%s)
+        """, (self.id, duplicate_ids))
+        cr.execute("""
+            UPDATE messaging_thread
+               SET last_message_date = (SELECT max(last_message_date) FROM messaging_thread WHERE id = ANY(%s))
+             WHERE id = %s
+        """, (duplicate_ids + [self.id], self.id))
+        # Pending read watermarks keep the highest one of each partner.
+        cr.execute("""
+            WITH moved AS (
+                DELETE FROM messaging_read_receipt WHERE thread_id = ANY(%(duplicate_ids)s)
+             RETURNING partner_id, message_id
+            )
+            INSERT INTO messaging_read_receipt (partner_id, thread_id, message_id)
+            SELECT partner_id, %(thread_id)s, max(message_id) FROM moved GROUP BY partner_id
+            ON CONFLICT (partner_id, thread_id) DO UPDATE
+               SET message_id = GREATEST(messaging_read_receipt.message_id, EXCLUDED.message_id)
+        """, {'thread_id': self.id, 'duplicate_ids': duplicate_ids})
+        # Retried creates keep replaying a thread that still exists.
+        cr.execute("""
+            UPDATE messaging_idempotency_key SET res_id = %s WHERE scope = 'thread' AND res_id = ANY(%s)
+        """, (self.id, duplicate_ids))
+
+        channels = duplicates.mail_channel_id
+        if channels and not self.mail_channel_id:
+            # Adopt a duplicate's channel rather than creating one.
+            adopted = channels[0]
+            channels -= adopted
+            duplicates.filtered(lambda thread: thread.mail_channel_id == adopted).mail_channel_id = False
+            self.mail_channel_id = adopted
+            self._sync_mail_channel()
+        if channels:
+            self.env['mail.message'].flush_model(['model', 'res_id'])
+            cr.execute("""
+                UPDATE mail_message SET res_id = %s WHERE model = 'discuss.channel' AND res_id = ANY(%s)
+            """, (self.mail_channel_id.id, channels.ids))
+        self.env.invalidate_all()
+
+        Change = self.env['messaging.change']
+        Change._log('thread', [(self.id, None, None)])
+        Change._log('message', [(self.id, message_id, None) for message_id in moved_ids])
+        duplicates.unlink()
+
     def unlink(self):
+        self.env['messaging.change']._log('thread_delete', [
+            (thread.id, None, pid) for thread in self for pid in thread.partner_ids.ids
+        ])
         channels = self.mapped('mail_channel_id')
         res = super().unlink()
         if channels:
@@ -123,21 +516,43 @@ class MessagingMessage(models.Model):
     create_date = fields.Datetime(string='Created Date', readonly=True)
     mail_message_id = fields.Many2one('mail.message', string='Discuss Message', copy=False, readonly=True)
 
+    def init(self):
+        tools.create_index(
+            self._cr, 'messaging_message_thread_create_date_idx',
+            self._table, ['thread_id', 'create_date DESC'],
+        )
+
     def mark_as_read(self):
         self.write({'is_read': True})
         return True
 
+    def _change_entries(self):
+        return [(message.thread_id.id, message.id, None) for message in self]
+
     @api.model
     def create(self, vals):
         records = super().create(vals)
+        self.env['messaging.change']._log('message', records._change_entries())
+        deferred = self.browse()
         for record in records:
             if self.env.context.get('skip_mail_sync'):
                 continue
 
             thread = record.thread_id
-            thread._ensure_mail_channel()
             channel = thread.mail_channel_id
             if not channel:
+                # Mirrored with the thread's history once its channel is created.
+                # A no-op update, not just a lock: a concurrent channel creation
+                # then waits for this message or fails and is retried, and this
+                # request fails if the channel was created after its snapshot.
+                self.env.cr.execute(
+                    "UPDATE messaging_thread SET mail_channel_pending = mail_channel_pending WHERE id = %s",
+                    (thread.id,),
+                )
+                continue
+            if thread.large_group:
+                # Posting to a huge channel fans out to every member; the mirror cron does it in batches.
+                deferred |= record
                 continue
 
             attachments = record.attachment_ids.ids if record.attachment_ids else []
@@ -151,8 +566,26 @@ class MessagingMessage(models.Model):
             )
             if mail_message:
                 record.mail_message_id = mail_message.id
+        if deferred:
+            deferred.write({'mail_sync_pending': True, 'mail_sync_notify': True})
+            cron = self.env.ref('messaging_api.ir_cron_messaging_mail_mirror', raise_if_not_found=False)
+            if cron:
+                cron.sudo()._trigger()
         return records
 
+    def write(self, vals):
+        res = super().write(vals)
+        Change = self.env['messaging.change']
+        if 'is_read' in vals:
+            Change._log('read', self._change_entries())
+        if SYNC_MESSAGE_FIELDS.intersection(vals.keys()):
+            Change._log('message', self._change_entries())
+        return res
+
+    def unlink(self):
+        self.env['messaging.change']._log('message_delete', self._change_entries())
+        return super().unlink()
+
 
 class DiscussChannel(models.Model):
     _inherit = 'discuss.channel'
@@ -197,3 +630,17 @@ class DiscussChannel(models.Model):
             MessagingMessage.with_context(skip_mail_sync=True).create(msg_vals)
 
         return mail_message
+
+
+class MailMessage(models.Model):
+    _inherit = 'mail.message'
+
+    def _message_reaction(self, content, action):
+        res = super()._message_reaction(content, action)
+        domain = [('mail_message_id', 'in', self.ids)]
+        messages = self.env['messaging.message'].sudo().search(domain)
+        archived = self.env['messaging.message.archive'].sudo().search(domain)
+        self.env['messaging.change']._log('reaction', messages._change_entries() + [
+            (message.thread_id.id, message.id, None) for message in archived
+        ])
+        return res
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models
+
+from ..tools.partner_cache import PARTNER_FIELDS, SEQUENCE, partner_stubs
+
+
+class ResPartner(models.Model):
+    _inherit = 'res.partner'
+
+    def init(self):
+        super().init()
+        self.env.cr.execute(f"CREATE SEQUENCE IF NOT EXISTS {SEQUENCE}")
+
+    def _messaging_invalidate_stubs(self):
+        partner_stubs.invalidate(self.env.cr.dbname, self.ids)
+        partner_stubs.signal(self.env)
+
+    def write(self, vals):
+        res = super().write(vals)
+        if PARTNER_FIELDS.intersection(vals):
+            self._messaging_invalidate_stubs()
+        return res
+
+    def unlink(self):
+        self._messaging_invalidate_stubs()
+        return super().unlink()
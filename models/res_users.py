@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+from odoo import models, fields, api
+
+from ..tools.partner_cache import USER_FIELDS
+
+
+class ResUsers(models.Model):
+    _inherit = 'res.users'
+
+    messaging_api_profiling = fields.Boolean(
+        string='Profile Messaging API Requests',
+        groups='base.group_system',
+        help='Write a Python and SQL profile report for every Messaging API request of this user.',
+    )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        users = super().create(vals_list)
+        users.partner_id._messaging_invalidate_stubs()
+        return users
+
+    def write(self, vals):
+        if not USER_FIELDS.intersection(vals):
+            return super().write(vals)
+        previous_partners = self.partner_id
+        res = super().write(vals)
+        (previous_partners | self.partner_id)._messaging_invalidate_stubs()
+        return res
+
+    def unlink(self):
+        self.partner_id._messaging_invalidate_stubs()
+        return super().unlink()
+
+    def _init_messaging(self, *args, **kwargs):
+        # The web client is opening Discuss: queued channels of the user's threads must exist now.
+        threads = self.env['messaging.thread'].sudo().search([
+            ('mail_channel_pending', '=', True),
+            ('partner_ids', 'in', self.partner_id.ids),
+        ])
+        threads.with_context(messaging_api_skip_channel_user=True)._ensure_mail_channel()
+        return super()._init_messaging(*args, **kwargs)
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+import logging
+
+from odoo import models
+from odoo.tools import populate
+
+_logger = logging.getLogger(__name__)
+
+REACTION_CONTENTS = ['👍', '❤️', '😂', '🎉', '👀']
+WORDS = [
+    'hello', 'thanks', 'meeting', 'today', 'tomorrow', 'invoice', 'ship', 'call', 'please',
+    'update', 'ready', 'done', 'check', 'photo', 'later', 'great', 'sure', 'order', 'where',
+]
+BATCH_SIZE = 1000
+
+
+def _zipf_weights(count):
+    """Return rank-based weights so a few records receive most of the traffic."""
+    return [1.0 / rank for rank in range(1, count + 1)]
+
+
+class MessagingThread(models.Model):
+    _inherit = 'messaging.thread'
+    _populate_dependencies = ['res.users']
+    _populate_sizes = {'small': 50, 'medium': 2000, 'large': 20000}
+
+    def _populate(self, size):
+        records = super(MessagingThread, self.with_context(messaging_api_skip_channel_user=True))._populate(size)
+        # Every thread gets its channel up front: reactions below are Discuss messages.
+        records.with_context(messaging_api_skip_channel_user=True)._ensure_mail_channel()
+        return records
+
+    def _populate_factories(self):
+        user_ids = self.env.registry.populated_models['res.users']
+        partner_ids = self.env['res.users'].browse(user_ids).partner_id.ids
+
+        def get_partner_ids(values, counter, random):
+            if values['thread_type'] == 'group':
+                # Pareto-distributed group sizes: mostly small, a long tail of huge groups.
+                size = int(random.paretovariate(1.1)) + 2
+            else:
+                size = 2
+            size = min(size, len(partner_ids))
+            return [(6, 0, random.sample(partner_ids, size))]
+
+        return [
+            ('thread_type', populate.randomize(['chat', 'group', 'sms'], [0.7, 0.22, 0.08])),
+            ('name', populate.constant('{values[thread_type]}_thread_{counter}')),
+            ('partner_ids', populate.compute(get_partner_ids)),
+        ]
+
+
+class MessagingMessage(models.Model):
+    _inherit = 'messaging.message'
+    _populate_dependencies = ['messaging.thread']
+    _populate_sizes = {'small': 2000, 'medium': 200000, 'large': 2000000}
+
+    def _populate(self, size):
+        # Discuss mirroring is skipped for volume; reactions get their own mail.message below.
+        records = super(MessagingMessage, self.with_context(skip_mail_sync=True))._populate(size)
+        random = populate.Random('messaging.message.extras')
+        self._populate_attachments(records, random)
+        self._populate_reactions(records, random)
+        self.env.invalidate_all()
+        return records
+
+    def _populate_factories(self):
+        thread_ids = self.env.registry.populated_models['messaging.thread']
+        threads = self.env['messaging.thread'].browse(thread_ids)
+        members = {thread['id']: thread['partner_ids'] for thread in threads.read(['partner_ids'])}
+        sms_thread_ids = set(threads.filtered(lambda t: t.thread_type == 'sms').ids)
+
+        def get_author(values, counter, random):
+            return random.choice(members[values['thread_id']])
+
+        def get_message_type(values, counter, random):
+            return 'sms' if values['thread_id'] in sms_thread_ids else 'text'
+
+        def get_body(values, counter, random):
+            return ' '.join(random.choices(WORDS, k=random.randint(1, 25)))
+
+        return [
+            ('thread_id', populate.randomize(thread_ids, _zipf_weights(len(thread_ids)))),
+            ('author_id', populate.compute(get_author)),
+            ('message_type', populate.compute(get_message_type)),
+            ('body', populate.compute(get_body)),
+            ('is_read', populate.randomize([True, False], [0.85, 0.15])),
+        ]
+
+    def _populate_attachments(self, records, random):
+        """Attach one to three small files to about 5% of the messages."""
+        field = self._fields['attachment_ids']
+        sample = [message_id for message_id in records.ids if random.random() < 0.05]
+        for start in range(0, len(sample), BATCH_SIZE):
+            vals_list, links = [], []
+            for message_id in sample[start:start + BATCH_SIZE]:
+                for index in range(random.randint(1, 3)):
+                    vals_list.append({
+                        'name': f'populate_{message_id}_{index}.txt',
+                        'raw': b'x' * random.randint(64, 4096),
+                        'res_model': 'messaging.message',
+                        'res_id': message_id,
+                    })
+                    links.append(message_id)
+            attachments = self.env['ir.attachment'].sudo().create(vals_list)
+            rows = list(zip(links, attachments.ids))
+            self.env.cr.execute(
+                f'INSERT INTO "{field.relation}" ("{field.column1}", "{field.column2}") '
+                f'SELECT * FROM unnest(%s::int[], %s::int[])',
+                ([row[0] for row in rows], [row[1] for row in rows]),
+            )
+            _logger.info('Populated attachments for %s/%s messages', min(start + BATCH_SIZE, len(sample)), len(sample))
+
+    def _populate_reactions(self, records, random):
+        """Give about 10% of the messages a Discuss counterpart carrying reactions."""
+        sample = records.filtered(lambda m: random.random() < 0.10)
+        Reaction = self.env['mail.message.reaction'].sudo()
+        for start in range(0, len(sample), BATCH_SIZE):
+            batch = sample[start:start + BATCH_SIZE]
+            mail_messages = self.env['mail.message'].sudo().create([{
+                'model': 'discuss.channel',
+                'res_id': message.thread_id.mail_channel_id.id,
+                'body': message.body,
+                'author_id': message.author_id.id,
+                'message_type': 'comment',
+            } for message in batch])
+            self.env.cr.execute(
+                'UPDATE messaging_message m SET mail_message_id = v.mail_message_id '
+                'FROM unnest(%s::int[], %s::int[]) AS v(id, mail_message_id) WHERE m.id = v.id',
+                (batch.ids, mail_messages.ids),
+            )
+
+            reaction_vals = []
+            for message, mail_message in zip(batch, mail_messages):
+                partner_ids = message.thread_id.partner_ids.ids
+                reactors = random.sample(partner_ids, min(len(partner_ids), random.randint(1, 5)))
+                for partner_id in reactors:
+                    reaction_vals.append({
+                        'message_id': mail_message.id,
+                        'partner_id': partner_id,
+                        'content': random.choice(REACTION_CONTENTS),
+                    })
+            Reaction.create(reaction_vals)
+            _logger.info('Populated reactions for %s/%s messages', min(start + BATCH_SIZE, len(sample)), len(sample))
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""The benchmark's per-route SQL budgets, enforced on every test run.
+
+The routes are called over HTTP as a plain internal user, so access rules and
+session handling are counted the way a mobile client pays for them. The
+budgets are the ones of ``tools/benchmark.py``; run with
+``--test-tags /messaging_api`` to catch a regression before it ships.
+"""
+
+import uuid
+
+from odoo.tests import HttpCase, new_test_user, tagged, warmup
+
+from ..tools.benchmark import QUERY_BUDGETS
+
+PASSWORD = 'messaging-budget'
+
+
+@tagged('post_install', '-at_install')
+class TestQueryBudgets(HttpCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = new_test_user(cls.env, login='messaging_budget', password=PASSWORD, groups='base.group_user')
+        cls.other_user = new_test_user(
+            cls.env, login='messaging_budget_other', password=PASSWORD, groups='base.group_user',
+        )
+        cls.outsider = cls.env['res.partner'].create({'name': 'Budget Outsider'})
+        members = cls.user.partner_id | cls.other_user.partner_id
+        cls.threads = cls.env['messaging.thread'].create([{
+            'name': f'Budget thread {number}',
+            'thread_type': 'group',
+            'partner_ids': [(6, 0, members.ids)],
+        } for number in range(5)])
+        cls.threads._ensure_mail_channel()
+        cls.thread = cls.threads[0]
+        cls.messages = cls.env['messaging.message'].create([{
+            'thread_id': thread.id,
+            'author_id': author.id,
+            'body': f'Budget message {number}',
+        } for thread in cls.threads for number, author in enumerate(list(members) * 5)])
+
+    def setUp(self):
+        super().setUp()
+        self.authenticate(self.user.login, PASSWORD)
+
+    def _call(self, route, path=None, **params):
+        with self.assertQueryCount(QUERY_BUDGETS[route]):
+            result = self.make_jsonrpc_request(path or route, params)
+        self.assertNotIn('error', result, route)
+        return result
+
+    def _check_read_routes(self):
+        self._call('/api/messaging/threads', limit=20, profile='list')
+        self._call('/api/messaging/threads', limit=20, profile='list', unread_only=True)
+        self._call('/api/messaging/messages', thread_id=self.thread.id, limit=50)
+        self._call('/api/messaging/unread/count')
+        self._call('/api/messaging/bootstrap', thread_limit=20, message_limit=20)
+        self._call('/api/messaging/notifications/count')
+        self._call('/api/messaging/partners/search', query='Budget', limit=20)
+        self._call(
+            '/api/messaging/thread/participants/<int:thread_id>',
+            f'/api/messaging/thread/participants/{self.thread.id}',
+        )
+        token = self._call('/api/messaging/sync')['sync_token']
+        self._call('/api/messaging/sync', sync_token=token)
+
+    @warmup
+    def test_read_routes(self):
+        self._check_read_routes()
+
+    @warmup
+    def test_read_routes_sql(self):
+        self.env['ir.config_parameter'].sudo().set_param('messaging_api.read_path', 'sql')
+        self._check_read_routes()
+
+    @warmup
+    def test_write_routes(self):
+        other = self.other_user.partner_id
+        group = self._call(
+            '/api/messaging/thread/create', name='Budget group', partner_ids=[other.id],
+            thread_type='group', idempotency_key=uuid.uuid4().hex,
+        )
+        chat = self._call('/api/messaging/thread/create', name='Budget chat', partner_ids=[other.id])
+        reopened = self._call('/api/messaging/thread/create', name='Budget chat', partner_ids=[other.id])
+        self.assertEqual(reopened['thread_id'], chat['thread_id'])
+        self._call('/api/messaging/thread/add_participant', thread_id=group['thread_id'], partner_id=self.outsider.id)
+
+        client_msg_id = uuid.uuid4().hex
+        sent = self._call(
+            '/api/messaging/message/send', thread_id=self.thread.id, body='budget', client_msg_id=client_msg_id,
+        )
+        replayed = self._call(
+            '/api/messaging/message/send', thread_id=self.thread.id, body='budget', client_msg_id=client_msg_id,
+        )
+        self.assertEqual(replayed['message_id'], sent['message_id'])
+        self._call('/api/messaging/message/reaction', message_id=sent['message_id'], content='👍')
+        self._call('/api/messaging/message/read', message_ids=self.messages[-5:].ids)
+        self._call('/api/messaging/typing/start', thread_id=self.thread.id)
+        self._call('/api/messaging/presence/update', status='online')
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""Admission control for long polls and rate limits for chatty endpoints.
+
+Long-poll slots are PostgreSQL session-level advisory locks, so they are
+shared by every worker process, are not affected by transaction snapshots,
+and disappear with the connection if a worker dies. Four lock namespaces
+are used:
+
+- ``NS_POLL_SLOT``: one lock per running long poll, keyed by user and slot,
+  enforcing the per-user cap;
+- ``NS_POLL_GLOBAL``: ``max_global`` numbered locks shared by all users; a
+  poll holds one, so the global cap holds even when polls start together;
+- ``NS_POLL_CLIENT``: held by the current long poll of a client;
+- ``NS_POLL_TAKEOVER``: held by a newer poll of the same client while it
+  waits for the older one to notice and return.
+
+Token buckets are kept in process memory and therefore limit each worker
+separately.
+"""
+
+import random
+import threading
+import time
+import zlib
+
+from psycopg2.extensions import TRANSACTION_STATUS_INERROR
+
+NS_POLL_SLOT = 0x6D61
+NS_POLL_CLIENT = 0x6D62
+NS_POLL_TAKEOVER = 0x6D63
+NS_POLL_GLOBAL = 0x6D64
+SLOTS_PER_USER = 64
+
+TAKEOVER_TIMEOUT = 3.0
+TAKEOVER_INTERVAL = 0.2
+RETRY_AFTER = 5
+
+
+def _client_key(user_id, client_id):
+    return zlib.crc32(f'{user_id}:{client_id}'.encode()) & 0x7FFFFFFF
+
+
+def _retry_after():
+    """Spread retries so rejected clients do not come back in lockstep."""
+    return RETRY_AFTER + random.randint(0, RETRY_AFTER)
+
+
+class LongPollAdmission:
+    """Cross-worker admission for one long-poll request."""
+
+    def __init__(self, cr, user_id, client_id=None, max_per_user=3, max_global=16):
+        self.cr = cr
+        self.user_id = user_id
+        self.client_key = _client_key(user_id, client_id) if client_id else None
+        self.max_per_user = min(max_per_user, SLOTS_PER_USER)
+        self.max_global = max(1, max_global)
+        self.retry_after = None
+        self._held = []
+
+    def __enter__(self):
+        self.retry_after = self._acquire()
+        if self.retry_after:
+            self.release()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    @property
+    def rejected(self):
+        return bool(self.retry_after)
+
+    def _try_lock(self, namespace, key):
+        self.cr.execute("SELECT pg_try_advisory_lock(%s, %s)", (namespace, key))
+        if self.cr.fetchone()[0]:
+            self._held.append((namespace, key))
+            return True
+        return False
+
+    def _unlock(self, namespace, key):
+        if self.cr.connection.get_transaction_status() == TRANSACTION_STATUS_INERROR:
+            # The request failed; session locks survive the rollback, which
+            # makes the connection usable again to release them.
+            self.cr.rollback()
+        self.cr.execute("SELECT pg_advisory_unlock(%s, %s)", (namespace, key))
+        self._held.remove((namespace, key))
+
+    def _acquire(self):
+        """Take a client lock and a slot, returning a retry hint when refused."""
+        if self.client_key is not None and not self._try_lock(NS_POLL_CLIENT, self.client_key):
+            if not self._takeover():
+                return _retry_after()
+
+        for slot in range(self.max_per_user):
+            if self._try_lock(NS_POLL_SLOT, self.user_id * SLOTS_PER_USER + slot):
+                break
+        else:
+            return _retry_after()
+
+        # Start at a random slot so concurrent polls rarely contend for the same lock.
+        first = random.randrange(self.max_global)
+        for offset in range(self.max_global):
+            if self._try_lock(NS_POLL_GLOBAL, (first + offset) % self.max_global):
+                return None
+        return _retry_after()
+
+    def _takeover(self):
+        """Ask the running poll of this client to return, then take its place."""
+        if not self._try_lock(NS_POLL_TAKEOVER, self.client_key):
+            # Another newer poll is already taking over.
+            return False
+        try:
+            deadline = time.monotonic() + TAKEOVER_TIMEOUT
+            while time.monotonic() < deadline:
+                time.sleep(TAKEOVER_INTERVAL)
+                if self._try_lock(NS_POLL_CLIENT, self.client_key):
+                    return True
+            return False
+        finally:
+            self._unlock(NS_POLL_TAKEOVER, self.client_key)
+
+    def superseded(self):
+        """Return True when a newer poll from the same client is waiting."""
+        if self.client_key is None:
+            return False
+        self.cr.execute("""
+            SELECT 1 FROM pg_locks
+             WHERE locktype = 'advisory' AND classid = %s AND objid = %s AND objsubid = 2 AND granted
+               AND database = (SELECT oid FROM pg_database WHERE datname = current_database())
+        """, (NS_POLL_TAKEOVER, self.client_key))
+        return bool(self.cr.fetchone())
+
+    def release(self):
+        for namespace, key in list(self._held):
+            self._unlock(namespace, key)
+
+
+class TokenBucketLimiter:
+    """Per-process token buckets keyed by user and endpoint group."""
+
+    MAX_BUCKETS = 10000
+    IDLE_SECONDS = 600
+
+    def __init__(self, limits):
+        self.limits = limits
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def allow(self, user_id, group):
+        """Consume one token; return None when allowed, else seconds to wait."""
+        burst, rate = self.limits[group]
+        now = time.monotonic()
+        key = (user_id, group)
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                allowed = None
+            else:
+                self._buckets[key] = (tokens, now)
+                allowed = max(1, int((1 - tokens) / rate + 0.999))
+            if len(self._buckets) > self.MAX_BUCKETS:
+                self._prune(now)
+        return allowed
+
+    def _prune(self, now):
+        for key, (_tokens, updated) in list(self._buckets.items()):
+            if now - updated > self.IDLE_SECONDS:
+                del self._buckets[key]
@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+"""Latency and SQL query budgets for every ``/api/messaging/*`` route.
+
+Run it from an Odoo shell against a disposable, populated database::
+
+    ./odoo-bin populate -d bench --models messaging.message --size medium
+    ./odoo-bin shell -d bench
+    >>> from odoo.addons.messaging_api.tools import benchmark
+    >>> benchmark.run(env)
+
+Requests go through the real WSGI stack in-process, so the SQL count of each
+call is the one Odoo itself records for the request. ``run`` raises
+:class:`BudgetExceeded` when a route needs more queries than its budget, or
+when a route has no scenario at all.
+"""
+
+import io
+import json
+import logging
+import statistics
+import threading
+import time
+import uuid
+
+from werkzeug.test import Client
+
+from odoo import http
+
+from ..controllers import messaging_api_controller
+from ..controllers.messaging_api_controller import MessagingAPIController
+
+_logger = logging.getLogger(__name__)
+
+BENCHMARK_PASSWORD = 'messaging-benchmark'
+
+# Maximum SQL queries per request, session handling included. The counts do not
+# depend on the dataset size, so an N+1 shows up as soon as data grows.
+QUERY_BUDGETS = {
+    '/api/messaging/threads': 30,
+    # The Discuss channel is created by a cron, not by the request.
+    '/api/messaging/thread/create': 32,
+    '/api/messaging/messages': 25,
+    # Posted to Discuss live; 60 plus the idempotency claim and record and the push queue insert.
+    '/api/messaging/message/send': 63,
+    '/api/messaging/message/reaction': 40,
+    '/api/messaging/message/read': 12,
+    '/api/messaging/unread/count': 20,
+    '/api/messaging/bootstrap': 25,
+    '/api/messaging/attachment/upload': 20,
+    '/api/messaging/attachment/<int:attachment_id>': 10,
+    '/api/messaging/attachment/delete/<int:attachment_id>': 20,
+    '/api/messaging/attachment/info/<int:attachment_id>': 10,
+    '/api/messaging/partners/search': 12,
+    '/api/messaging/thread/participants/<int:thread_id>': 12,
+    '/api/messaging/thread/add_participant': 40,
+    '/api/messaging/poll/messages': 25,
+    '/api/messaging/poll/updates': 40,
+    '/api/messaging/sync': 30,
+    '/api/messaging/metrics': 6,
+    '/api/messaging/sms/send': 60,
+    '/api/messaging/sms/send_bulk': 120,
+    '/api/messaging/sms/receive': 80,
+    '/api/messaging/sms/status': 12,
+    '/api/messaging/export': 15,
+    '/api/messaging/import': 25,
+    '/api/messaging/typing/start': 6,
+    '/api/messaging/typing/stop': 6,
+    '/api/messaging/typing/status/<int:thread_id>': 6,
+    '/api/messaging/presence/update': 10,
+    '/api/messaging/presence/status': 12,
+    '/api/messaging/push/register': 8,
+    '/api/messaging/push/unregister': 6,
+    '/api/messaging/notifications/count': 20,
+    '/api/messaging/notifications/mark_all_read': 25,
+}
+
+
+class BudgetExceeded(AssertionError):
+    pass
+
+
+class BenchmarkClient:
+    """Authenticated in-process client that records latency and SQL counts."""
+
+    def __init__(self, dbname, login, password):
+        self.client = Client(http.root)
+        self.samples = {}
+        response = self.client.post('/web/session/authenticate', json={
+            'jsonrpc': '2.0',
+            'params': {'db': dbname, 'login': login, 'password': password},
+        })
+        if response.json.get('error'):
+            raise RuntimeError(f"Benchmark login failed: {response.json['error']}")
+
+    def _record(self, route, call):
+        thread = threading.current_thread()
+        start = time.perf_counter()
+        response = call()
+        elapsed = (time.perf_counter() - start) * 1000
+        self.samples.setdefault(route, []).append((elapsed, getattr(thread, 'query_count', 0)))
+        return response
+
+    def json(self, route, path=None, headers=None, **params):
+        response = self._record(route, lambda: self.client.post(path or route, headers=headers, json={
+            'jsonrpc': '2.0',
+            'method': 'call',
+            'params': params,
+        }))
+        payload = response.json
+        if payload.get('error'):
+            raise RuntimeError(f"{route} failed: {payload['error']}")
+        result = payload.get('result') or {}
+        if isinstance(result, dict) and result.get('error'):
+            raise RuntimeError(f"{route} failed: {result['error']}")
+        return result
+
+    def http(self, route, path=None, method='GET', **kwargs):
+        return self._record(route, lambda: self.client.open(path or route, method=method, **kwargs))
+
+
+def _declared_routes():
+    routes = set()
+    for attr in dir(MessagingAPIController):
+        routing = getattr(getattr(MessagingAPIController, attr), 'original_routing', None)
+        if routing:
+            routes.update(r for r in routing.get('routes', []) if r.startswith('/api/messaging/'))
+    return routes
+
+
+def _pick_user(env):
+    """Return the populated user who belongs to the most threads."""
+    env.cr.execute("""
+        SELECT u.id
+          FROM messaging_thread_res_partner_rel rel
+          JOIN res_users u ON u.partner_id = rel.res_partner_id
+         WHERE u.active
+      GROUP BY u.id
+      ORDER BY count(*) DESC
+         LIMIT 1
+    """)
+    row = env.cr.fetchone()
+    if not row:
+        raise RuntimeError('No thread members found, populate the database first')
+    return env['res.users'].browse(row[0])
+
+
+def _scenarios(client, env, user):
+    """Exercise every route once, chaining ids between the mutating calls."""
+    partner_id = user.partner_id.id
+    thread = env['messaging.thread'].search([('partner_ids', 'in', [partner_id])], limit=1)
+    other_partner = (thread.partner_ids - user.partner_id)[:1] or user.partner_id
+    latest = env['messaging.message'].search([('thread_id', '=', thread.id)], limit=5)
+
+    client.json('/api/messaging/threads')
+    first_page = client.json('/api/messaging/threads', limit=20, profile='list')
+    if first_page.get('next_cursor'):
+        client.json('/api/messaging/threads', limit=20, profile='list', cursor=first_page['next_cursor'])
+    client.json('/api/messaging/threads', limit=20, profile='list', unread_only=True, search=thread.name[:3])
+    client.json('/api/messaging/messages', thread_id=thread.id, limit=50)
+    client.json('/api/messaging/unread/count')
+    client.json('/api/messaging/bootstrap', thread_limit=20, message_limit=20)
+    client.json('/api/messaging/notifications/count')
+    client.json('/api/messaging/partners/search', query=other_partner.name[:3], limit=20)
+    client.json('/api/messaging/thread/participants/<int:thread_id>', f'/api/messaging/thread/participants/{thread.id}')
+    client.json('/api/messaging/poll/messages', thread_id=thread.id, last_message_id=latest[-1:].id, timeout=1)
+    top_threads = env['messaging.thread'].search([('partner_ids', 'in', [partner_id])], limit=20)
+    client.json(
+        '/api/messaging/poll/messages', thread_ids=top_threads.ids, timeout=1,
+        last_message_ids={str(t.id): t.message_ids[:1].id or 0 for t in top_threads},
+    )
+    client.json('/api/messaging/poll/updates', timeout=1)
+    client.json('/api/messaging/sync', sync_token=client.json('/api/messaging/sync')['sync_token'])
+    client.json('/api/messaging/typing/start', thread_id=thread.id)
+    client.json('/api/messaging/typing/stop', thread_id=thread.id)
+    client.json('/api/messaging/typing/status/<int:thread_id>', f'/api/messaging/typing/status/{thread.id}')
+    client.json('/api/messaging/presence/update', status='online')
+    client.json('/api/messaging/presence/status', partner_ids=thread.partner_ids[:20].ids)
+    client.http('/api/messaging/metrics', headers={'Authorization': f'Bearer {BENCHMARK_PASSWORD}'})
+    push_token = f'benchmark-{uuid.uuid4().hex}'
+    client.json('/api/messaging/push/register', token=push_token, platform='android')
+
+    new_thread = client.json(
+        '/api/messaging/thread/create', name='Benchmark thread', partner_ids=[other_partner.id],
+        thread_type='group', idempotency_key=uuid.uuid4().hex,
+    )['thread_id']
+    # The second create of a direct chat must return the first one.
+    direct_chat = client.json('/api/messaging/thread/create', name='Benchmark chat', partner_ids=[other_partner.id])
+    reopened = client.json('/api/messaging/thread/create', name='Benchmark chat', partner_ids=[other_partner.id])
+    if reopened['thread_id'] != direct_chat['thread_id'] or not reopened.get('existing'):
+        raise RuntimeError('/api/messaging/thread/create duplicated a direct chat')
+    client.json('/api/messaging/thread/add_participant', thread_id=new_thread, partner_id=other_partner.id)
+    # What the channel cron does moments after the create, so sends below are posted to Discuss live.
+    env['messaging.thread']._create_pending_mail_channels()
+
+    upload = client.http(
+        '/api/messaging/attachment/upload', method='POST',
+        data={'file': (io.BytesIO(b'hello' * 512), 'benchmark.txt')},
+    ).json
+    attachment_id = upload['attachment_id']
+    client.json('/api/messaging/attachment/info/<int:attachment_id>', f'/api/messaging/attachment/info/{attachment_id}')
+    client.http('/api/messaging/attachment/<int:attachment_id>', f'/api/messaging/attachment/{attachment_id}')
+    client_msg_id = uuid.uuid4().hex
+    sent = client.json(
+        '/api/messaging/message/send', thread_id=new_thread, body='benchmark', attachment_ids=[attachment_id],
+        client_msg_id=client_msg_id,
+    )['message_id']
+    # A retry must replay the original message instead of creating another one.
+    replayed = client.json(
+        '/api/messaging/message/send', thread_id=new_thread, body='benchmark', client_msg_id=client_msg_id,
+    )
+    if replayed['message_id'] != sent:
+        raise RuntimeError('/api/messaging/message/send did not replay the original message')
+    client.json('/api/messaging/message/reaction', message_id=sent, content='👍')
+    client.json('/api/messaging/message/read', message_ids=latest.ids)
+    client.json('/api/messaging/sms/send', phone_number='+15550000001', message='benchmark')
+    client.json(
+        '/api/messaging/sms/send_bulk', message='benchmark',
+        phone_numbers=[f'+1555{number:07d}' for number in range(100)],
+    )
+    client.json('/api/messaging/sms/receive', headers={'Authorization': f'Bearer {BENCHMARK_PASSWORD}'}, messages=[{
+        'phone_number': f'+1555{number:07d}',
+        'message': 'benchmark reply',
+        'provider_message_id': f'benchmark-{uuid.uuid4().hex}',
+    } for number in range(100)])
+    env.cr.execute("""
+        SELECT sms_provider_message_id FROM messaging_message
+         WHERE message_type = 'sms' AND sms_status = 'sent' AND sms_provider_message_id IS NOT NULL
+         LIMIT 500
+    """)
+    client.json('/api/messaging/sms/status', headers={'Authorization': f'Bearer {BENCHMARK_PASSWORD}'}, receipts=[
+        {'provider_message_id': row[0], 'status': 'delivered'} for row in env.cr.fetchall()
+    ])
+    client.http('/api/messaging/export', query_string={'thread_id': thread.id}).get_data()
+    history_lines = '\n'.join(json.dumps({
+        'thread_id': new_thread,
+        'author_id': other_partner.id,
+        'body': f'imported {number}',
+        'created_date': '2020-01-01 00:00:00',
+    }) for number in range(1000))
+    client.http(
+        '/api/messaging/import', method='POST', query_string={'mirror': 'none'},
+        data=history_lines, content_type='application/x-ndjson',
+    )
+    client.json('/api/messaging/notifications/mark_all_read', thread_id=thread.id)
+    client.json('/api/messaging/push/unregister', token=push_token)
+    client.json(
+        '/api/messaging/attachment/delete/<int:attachment_id>', f'/api/messaging/attachment/delete/{attachment_id}',
+    )
+
+
+def run(env, repeat=5, budgets=None, raise_on_failure=True, read_path='orm'):
+    """Benchmark every API route and compare its SQL count against the budget.
+
+    ``read_path`` selects the implementation of the read endpoints (``orm``
+    or ``sql``, see ``tools/read_path.py``). Queries sent to a read replica
+    are not counted.
+
+    The database is modified (the benchmark user gets a password and the
+    administrator group, threads and messages are created) and committed:
+    only run this against a disposable copy.
+    """
+    budgets = dict(QUERY_BUDGETS, **(budgets or {}))
+    user = _pick_user(env)
+    user.sudo().write({
+        'password': BENCHMARK_PASSWORD,
+        'groups_id': [(4, env.ref('base.group_system').id)],
+    })
+    env['ir.config_parameter'].sudo().set_param('messaging_api.metrics_token', BENCHMARK_PASSWORD)
+    env['ir.config_parameter'].sudo().set_param('messaging_api.sms_webhook_token', BENCHMARK_PASSWORD)
+    env['ir.config_parameter'].sudo().set_param('messaging_api.read_path', read_path)
+    env['ir.config_parameter'].sudo().set_param('messaging_api.push_provider', 'fake')
+    env.cr.commit()
+
+    client = BenchmarkClient(env.cr.dbname, user.login, BENCHMARK_PASSWORD)
+    limiter = messaging_api_controller.rate_limiter
+    saved_limits = limiter.limits
+    limiter.limits = {group: (10 ** 6, 10 ** 6) for group in saved_limits}
+    try:
+        for _iteration in range(repeat):
+            _scenarios(client, env, user)
+            env.invalidate_all()
+    finally:
+        limiter.limits = saved_limits
+
+    report, failures = [], []
+    for route in sorted(_declared_routes() | set(client.samples)):
+        samples = client.samples.get(route)
+        if not samples:
+            failures.append(f"{route}: no benchmark scenario")
+            continue
+        latencies = sorted(sample[0] for sample in samples)
+        queries = max(sample[1] for sample in samples)
+        budget = budgets.get(route)
+        row = {
+            'route': route,
+            'calls': len(samples),
+            'p50_ms': round(statistics.median(latencies), 1),
+            'p95_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 1),
+            'max_queries': queries,
+            'budget': budget,
+        }
+        report.append(row)
+        if budget is None:
+            failures.append(f"{route}: no query budget declared")
+        elif queries > budget:
+            failures.append(f"{route}: {queries} queries > budget {budget}")
+
+    for row in report:
+        _logger.info(
+            "%(route)-60s calls=%(calls)s p50=%(p50_ms)sms p95=%(p95_ms)sms queries=%(max_queries)s/%(budget)s",
+            row,
+        )
+    if failures and raise_on_failure:
+        raise BudgetExceeded('\n'.join(failures))
+    return {'report': report, 'failures': failures}
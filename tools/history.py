@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""Streaming NDJSON export of message history.
+
+The generator runs after the request handler has returned, so it opens its
+own cursor and reads hot and archived messages together in keyset-paginated
+batches of ``EXPORT_BATCH_SIZE``: memory stays constant whatever the size of
+the export. Lines use the format accepted by the history import.
+"""
+
+import json
+
+from . import read_path
+
+EXPORT_BATCH_SIZE = 2000
+
+
+def export_ndjson(db_registry, partner_id, hot_relation, thread_id=None, date_from=None, date_to=None,
+                  all_threads=False):
+    """Yield one JSON line per message, oldest id first.
+
+    Only threads ``partner_id`` belongs to are exported unless ``all_threads``.
+    """
+    params = {
+        'partner_id': partner_id,
+        'thread_id': thread_id,
+        'date_from': date_from,
+        'date_to': date_to,
+        'all_threads': all_threads,
+        'limit': EXPORT_BATCH_SIZE,
+        'after': 0,
+    }
+    with db_registry.cursor() as cr:
+        while True:
+            cr.execute("""
+                SELECT m.id, m.thread_id, m.author_id, p.name AS author_name, p.email AS author_email,
+                       m.body, m.message_type, m.phone_number, m.sms_status, m.is_read,
+                       m.create_date, m.archived
+                  FROM (
+                        SELECT id, thread_id, author_id, body, message_type, phone_number, sms_status,
+                               is_read, create_date, false AS archived
+                          FROM messaging_message
+                     UNION ALL
+                        SELECT id, thread_id, author_id, body, message_type, phone_number, sms_status,
+                               is_read, create_date, true AS archived
+                          FROM messaging_message_archive
+                  ) m
+             LEFT JOIN res_partner p ON p.id = m.author_id
+                 WHERE m.id > %(after)s
+                   AND (%(thread_id)s::int IS NULL OR m.thread_id = %(thread_id)s)
+                   AND (%(date_from)s::timestamp IS NULL OR m.create_date >= %(date_from)s)
+                   AND (%(date_to)s::timestamp IS NULL OR m.create_date < %(date_to)s)
+                   AND (%(all_threads)s OR EXISTS (
+                        SELECT 1 FROM messaging_thread_res_partner_rel member
+                         WHERE member.messaging_thread_id = m.thread_id
+                           AND member.res_partner_id = %(partner_id)s
+                   ))
+              ORDER BY m.id
+                 LIMIT %(limit)s
+            """, params)
+            rows = read_path.fetch_dicts(cr)
+            if not rows:
+                return
+
+            attachments = read_path.message_attachments(cr, [row['id'] for row in rows], hot_relation)
+            lines = []
+            for row in rows:
+                row['created_date'] = row.pop('create_date').strftime('%Y-%m-%d %H:%M:%S')
+                row['attachment_ids'] = [a['id'] for a in attachments.get(row['id'], [])]
+                lines.append(json.dumps(row, ensure_ascii=False))
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+            params['after'] = rows[-1]['id']
+            # Release the snapshot between batches; the next one sees a fresh view.
+            cr.rollback()
@@ -0,0 +1,390 @@
+# -*- coding: utf-8 -*-
+"""Load test simulating many concurrent chat clients against a running server.
+
+Unlike ``benchmark.py``, which measures single requests in-process, this tool
+drives a real Odoo server over HTTP so worker processes, long-poll admission
+and the database all come under load together. Every simulated client has its
+own session and follows one of the behaviours in ``BEHAVIOURS``:
+
+- ``idle``: keeps a ``/poll/updates`` long poll open, nothing else;
+- ``sender``: long-polls its thread and sends a message now and then;
+- ``typing``: sends typing start/stop pings around its messages;
+- ``presence``: sends presence heartbeats;
+- ``inbox``: refreshes the thread list and unread counters.
+
+Prepare users on a disposable database from an Odoo shell::
+
+    >>> from odoo.addons.messaging_api.tools import loadtest
+    >>> loadtest.prepare(env, users=200, password='load', path='/tmp/logins.txt')
+
+then run the load from any machine with ``requests`` installed::
+
+    python loadtest.py --url http://localhost:8069 --db bench --logins /tmp/logins.txt \\
+        --password load --clients 2000 --duration 300 --metrics-token load
+
+The report gives throughput, latency percentiles and errors per action. When
+``--metrics-token`` is set, the server's ``/api/messaging/metrics`` are read
+before and after the run for SQL queries per second, worker busy time and
+long-poll waiters. ``--json`` writes the report; ``--baseline`` compares with
+an earlier one and exits with status 1 on a capacity regression.
+"""
+
+import argparse
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+# Seconds between actions, drawn uniformly from the range, and the mix used
+# when --mix is not given (percent of clients).
+BEHAVIOURS = {
+    'idle': {'poll_timeout': 50},
+    'sender': {'poll_timeout': 25, 'send_every': (20, 90)},
+    'typing': {'poll_timeout': 25, 'send_every': (10, 40), 'typing_pings': (1, 4)},
+    'presence': {'poll_timeout': 25, 'heartbeat_every': (25, 35)},
+    'inbox': {'refresh_every': (10, 30)},
+}
+DEFAULT_MIX = {'idle': 70, 'sender': 10, 'typing': 5, 'presence': 10, 'inbox': 5}
+
+# Allowed degradation against a baseline before the run counts as a regression.
+REGRESSION_TOLERANCE = 0.2
+STACK_SIZE = 256 * 1024
+
+
+def prepare(env, users=100, password='messaging-load', path=None):
+    """Give the most active thread members a known password and return their logins.
+
+    Only run this against a disposable database: passwords are overwritten and
+    the transaction is committed.
+    """
+    env.cr.execute("""
+        SELECT u.id
+          FROM messaging_thread_res_partner_rel rel
+          JOIN res_users u ON u.partner_id = rel.res_partner_id
+         WHERE u.active AND NOT u.share
+      GROUP BY u.id
+      ORDER BY count(*) DESC
+         LIMIT %s
+    """, (users,))
+    users = env['res.users'].browse([row[0] for row in env.cr.fetchall()])
+    users.sudo().write({'password': password})
+    env.cr.commit()
+    logins = users.mapped('login')
+    if path:
+        with open(path, 'w') as f:
+            f.write('\n'.join(logins) + '\n')
+    return logins
+
+
+class Stats:
+    """Thread-safe latency samples and error counts per action."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+        self.rejected = 0
+
+    def record(self, action, elapsed, ok=True):
+        with self._lock:
+            self.samples.setdefault(action, []).append(elapsed)
+            if not ok:
+                self.errors[action] = self.errors.get(action, 0) + 1
+
+    def reject(self):
+        with self._lock:
+            self.rejected += 1
+
+
+class SimulatedClient(threading.Thread):
+
+    def __init__(self, options, login, behaviour, stats, stop, start_delay):
+        super().__init__(daemon=True)
+        self.options = options
+        self.login = login
+        self.behaviour = behaviour
+        self.settings = BEHAVIOURS[behaviour]
+        self.stats = stats
+        self.stop = stop
+        self.start_delay = start_delay
+        self.client_id = uuid.uuid4().hex
+        self.thread_ids = []
+        self.last_message_id = 0
+
+    def call(self, action, path, **params):
+        start = time.perf_counter()
+        ok, result = True, {}
+        try:
+            response = self.session.post(
+                self.options.url + path,
+                json={'jsonrpc': '2.0', 'method': 'call', 'params': params},
+                timeout=self.settings.get('poll_timeout', 30) + 30,
+            )
+            payload = response.json() if response.status_code == 200 else {}
+            result = payload.get('result') or {}
+            ok = response.status_code == 200 and not payload.get('error') and not result.get('error')
+        except Exception:
+            ok = False
+        self.stats.record(action, time.perf_counter() - start, ok)
+        if result.get('retry_after'):
+            self.stats.reject()
+        return result
+
+    def wait(self, bounds):
+        return self.stop.wait(random.uniform(*bounds))
+
+    def run(self):
+        import requests
+
+        if self.stop.wait(self.start_delay):
+            return
+        self.session = requests.Session()
+        response = self.session.post(self.options.url + '/web/session/authenticate', json={
+            'jsonrpc': '2.0',
+            'params': {'db': self.options.db, 'login': self.login, 'password': self.options.password},
+        })
+        if response.status_code != 200 or response.json().get('error'):
+            self.stats.record('login', 0.0, ok=False)
+            return
+        # Cold start, as the mobile app does it: one bootstrap round trip.
+        threads = self.call(
+            'bootstrap', '/api/messaging/bootstrap', thread_limit=50, message_limit=1,
+            profile='minimal', message_profile='minimal',
+        ).get('threads') or []
+        self.thread_ids = [thread['id'] for thread in threads]
+        if threads and threads[0]['messages']:
+            self.last_message_id = threads[0]['messages'][0]['id']
+
+        next_send = time.monotonic() + random.uniform(*self.settings.get('send_every', (0, 0)))
+        next_heartbeat = time.monotonic()
+        while not self.stop.is_set():
+            if self.behaviour == 'inbox':
+                self.call('threads', '/api/messaging/threads', profile='list', limit=50)
+                self.call('unread_count', '/api/messaging/unread/count')
+                self.wait(self.settings['refresh_every'])
+                continue
+
+            if 'heartbeat_every' in self.settings and time.monotonic() >= next_heartbeat:
+                self.call('presence', '/api/messaging/presence/update', status='online')
+                next_heartbeat = time.monotonic() + random.uniform(*self.settings['heartbeat_every'])
+
+            if 'send_every' in self.settings and self.thread_ids and time.monotonic() >= next_send:
+                self.send()
+                next_send = time.monotonic() + random.uniform(*self.settings['send_every'])
+
+            result = self.poll()
+            # Back off after a rejection or a failed call instead of hammering the server.
+            if result.get('retry_after') or result.get('error') or not result:
+                if self.stop.wait(result.get('retry_after') or 1):
+                    return
+
+    def poll(self):
+        timeout = min(self.settings['poll_timeout'], self.options.poll_timeout)
+        if self.behaviour in ('sender', 'typing') and self.thread_ids:
+            result = self.call(
+                'poll_messages', '/api/messaging/poll/messages', client_id=self.client_id, timeout=timeout,
+                thread_id=self.thread_ids[0], last_message_id=self.last_message_id, profile='minimal',
+            )
+            messages = result.get('messages') or []
+            if messages:
+                self.last_message_id = max(message['id'] for message in messages)
+            return result
+        return self.call(
+            'poll_updates', '/api/messaging/poll/updates', client_id=self.client_id, timeout=timeout,
+            last_check=datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+        )
+
+    def send(self):
+        thread_id = random.choice(self.thread_ids)
+        if 'typing_pings' in self.settings:
+            for _ping in range(random.randint(*self.settings['typing_pings'])):
+                self.call('typing', '/api/messaging/typing/start', thread_id=thread_id)
+                if self.stop.wait(random.uniform(0.5, 2)):
+                    return
+            self.call('typing', '/api/messaging/typing/stop', thread_id=thread_id)
+        self.call(
+            'send', '/api/messaging/message/send', thread_id=thread_id,
+            body=f'load test {uuid.uuid4().hex[:8]}', client_msg_id=uuid.uuid4().hex,
+        )
+
+
+def scrape(options):
+    """Return {metric sample name: value} summed over labels, or None without a token."""
+    if not options.metrics_token:
+        return None
+    import requests
+
+    response = requests.get(
+        options.url + '/api/messaging/metrics',
+        headers={'Authorization': f'Bearer {options.metrics_token}'}, timeout=30,
+    )
+    response.raise_for_status()
+    totals = {}
+    for line in response.text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        name, value = line.rsplit(' ', 1)
+        name = name.split('{', 1)[0]
+        if name.endswith('_bucket'):
+            continue
+        totals[name] = totals.get(name, 0.0) + float(value)
+    return totals
+
+
+def _percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def build_report(options, stats, elapsed, before, after, waiter_samples):
+    actions = {}
+    for action, samples in sorted(stats.samples.items()):
+        latencies = sorted(samples)
+        actions[action] = {
+            'calls': len(latencies),
+            'errors': stats.errors.get(action, 0),
+            'rps': round(len(latencies) / elapsed, 2),
+            'p50_ms': round(statistics.median(latencies) * 1000, 1),
+            'p95_ms': round(_percentile(latencies, 0.95) * 1000, 1),
+            'p99_ms': round(_percentile(latencies, 0.99) * 1000, 1),
+            'max_ms': round(latencies[-1] * 1000, 1),
+        }
+    calls = sum(row['calls'] for row in actions.values())
+    report = {
+        'clients': options.clients,
+        'duration_s': round(elapsed, 1),
+        'mix': options.mix,
+        'throughput_rps': round(calls / elapsed, 2),
+        'errors': sum(row['errors'] for row in actions.values()),
+        'longpoll_rejections': stats.rejected,
+        'actions': actions,
+    }
+    if before is not None and after is not None:
+        def delta(name):
+            return after.get(name, 0.0) - before.get(name, 0.0)
+
+        busy = delta('messaging_api_request_duration_seconds_sum')
+        server = {
+            'requests_per_s': round(delta('messaging_api_request_duration_seconds_count') / elapsed, 2),
+            'sql_queries_per_s': round(delta('messaging_api_sql_queries_sum') / elapsed, 1),
+            'sql_time_share': round(delta('messaging_api_sql_seconds_total') / busy, 3) if busy else None,
+            'busy_workers': round(busy / elapsed, 2),
+            'longpoll_waiters_max': max(waiter_samples) if waiter_samples else None,
+        }
+        if options.workers:
+            # Long polls hold a worker while they wait, so they count as busy time.
+            server['worker_saturation'] = round(busy / elapsed / options.workers, 3)
+        report['server'] = server
+    return report
+
+
+def compare(report, baseline, tolerance=REGRESSION_TOLERANCE):
+    """Return the regressions of ``report`` against ``baseline`` as readable lines."""
+    regressions = []
+    if report['throughput_rps'] < baseline['throughput_rps'] * (1 - tolerance):
+        regressions.append(f"throughput {report['throughput_rps']} rps < baseline {baseline['throughput_rps']}")
+    for action, row in report['actions'].items():
+        base = baseline['actions'].get(action)
+        if base and row['p95_ms'] > base['p95_ms'] * (1 + tolerance) and action not in ('poll_updates', 'poll_messages'):
+            regressions.append(f"{action}: p95 {row['p95_ms']}ms > baseline {base['p95_ms']}ms")
+        if base and row['errors'] / row['calls'] > base['errors'] / max(base['calls'], 1) + 0.01:
+            regressions.append(f"{action}: error rate grew to {row['errors']}/{row['calls']}")
+    server, base_server = report.get('server'), baseline.get('server')
+    if server and base_server and base_server.get('sql_queries_per_s') and report['throughput_rps']:
+        queries = server['sql_queries_per_s'] / report['throughput_rps']
+        base_queries = base_server['sql_queries_per_s'] / baseline['throughput_rps']
+        if queries > base_queries * (1 + tolerance):
+            regressions.append(f"SQL queries per request {queries:.1f} > baseline {base_queries:.1f}")
+    return regressions
+
+
+def print_report(report):
+    print(f"{report['clients']} clients for {report['duration_s']}s, mix {report['mix']}")
+    print(f"throughput {report['throughput_rps']} rps, errors {report['errors']}, "
+          f"long-poll rejections {report['longpoll_rejections']}")
+    print(f"{'action':<16}{'calls':>9}{'errors':>8}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for action, row in report['actions'].items():
+        print(f"{action:<16}{row['calls']:>9}{row['errors']:>8}{row['rps']:>9}"
+              f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}{row['max_ms']:>10}")
+    for key, value in (report.get('server') or {}).items():
+        print(f"server {key}: {value}")
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _sep, weight = part.partition('=')
+        if name not in BEHAVIOURS:
+            raise argparse.ArgumentTypeError(f"unknown behaviour {name!r}, use {', '.join(BEHAVIOURS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def run(options):
+    with open(options.logins) as f:
+        logins = [line.strip() for line in f if line.strip()]
+    if not logins:
+        raise SystemExit('The logins file is empty')
+
+    behaviours = random.choices(list(options.mix), weights=list(options.mix.values()), k=options.clients)
+    stats, stop = Stats(), threading.Event()
+    threading.stack_size(STACK_SIZE)
+    clients = [
+        SimulatedClient(options, logins[index % len(logins)], behaviour, stats, stop,
+                        options.ramp_up * index / options.clients)
+        for index, behaviour in enumerate(behaviours)
+    ]
+
+    before = scrape(options)
+    start = time.monotonic()
+    for client in clients:
+        client.start()
+    waiter_samples = []
+    while time.monotonic() - start < options.ramp_up + options.duration:
+        time.sleep(min(5, options.duration))
+        current = scrape(options)
+        if current is not None:
+            waiter_samples.append(current.get('messaging_api_longpoll_waiters', 0))
+    stop.set()
+    elapsed = time.monotonic() - start
+    after = scrape(options)
+    for client in clients:
+        client.join(options.poll_timeout + 30)
+
+    report = build_report(options, stats, elapsed, before, after, waiter_samples)
+    print_report(report)
+    if options.json:
+        with open(options.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if options.baseline:
+        with open(options.baseline) as f:
+            regressions = compare(report, json.load(f))
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--url', default='http://localhost:8069')
+    parser.add_argument('--db', required=True)
+    parser.add_argument('--logins', required=True, help='File with one login per line; clients share them')
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--clients', type=int, default=500)
+    parser.add_argument('--duration', type=float, default=120, help='Seconds of full load after ramp-up')
+    parser.add_argument('--ramp-up', type=float, default=30, help='Seconds over which clients connect')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX, help='e.g. idle=70,sender=10,inbox=20')
+    parser.add_argument('--poll-timeout', type=int, default=50, help='Upper bound of long-poll timeouts')
+    parser.add_argument('--workers', type=int, help='Server worker count, to compute worker saturation')
+    parser.add_argument('--metrics-token', help='messaging_api.metrics_token, to read server metrics')
+    parser.add_argument('--json', help='Write the report to this file')
+    parser.add_argument('--baseline', help='Compare with a report written by --json')
+    return run(parser.parse_args(argv))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""Process-local metrics for the API, aggregated across workers at scrape time.
+
+Every worker keeps its counters, gauges and histograms in memory and flushes a
+snapshot to ``<data_dir>/messaging_api_metrics/<pid>.json`` at most once per
+``FLUSH_INTERVAL``, and at once when a gauge goes down. The scrape endpoint
+merges the snapshots of all workers: counters and histograms are summed, gauges
+only count live processes. Snapshots of dead workers are folded into
+``retired.json`` so counters never go backwards.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from odoo.tools import config
+
+_logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 1.0
+RETIRE_AFTER = 3600
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+METRICS = {
+    'messaging_api_requests_total': ('counter', 'API requests by route and HTTP status.'),
+    'messaging_api_errors_total': ('counter', 'API requests that returned an error payload or status.'),
+    'messaging_api_request_duration_seconds': ('histogram', 'API request latency.'),
+    'messaging_api_sql_queries': ('histogram', 'SQL queries per API request.'),
+    'messaging_api_sql_seconds_total': ('counter', 'Time spent in SQL by API requests.'),
+    'messaging_api_longpoll_waiters': ('gauge', 'Long-poll requests currently waiting.'),
+    'messaging_api_attachment_bytes_in_total': ('counter', 'Attachment bytes uploaded.'),
+    'messaging_api_attachment_bytes_out_total': ('counter', 'Attachment bytes downloaded.'),
+    'messaging_api_outbox_depth': ('gauge', 'Outbound SMS messages waiting to be sent.'),
+    'messaging_api_sms_inbound_total': ('counter', 'Inbound SMS by result (received, duplicate, invalid).'),
+    'messaging_api_sms_receipts_total': ('counter', 'SMS delivery receipts by result (updated, ignored, deferred).'),
+    'messaging_api_push_total': ('counter', 'Push notifications by result (sent, invalid, retry, failed).'),
+    'messaging_api_push_queue_depth': ('gauge', 'Push notifications waiting to be delivered.'),
+}
+
+
+def _labels_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        self._last_flush = 0.0
+
+    @property
+    def directory(self):
+        return os.path.join(config['data_dir'], 'messaging_api_metrics')
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+        self.flush()
+
+    def add(self, name, delta, **labels):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0) + delta
+        # A decrement is often the last change before the worker goes idle:
+        # a throttled flush would leave the scraper reading the raised value.
+        self.flush(force=delta < 0)
+
+    @contextmanager
+    def track(self, name, **labels):
+        """Hold a gauge up by one for the duration of the block."""
+        self.add(name, 1, **labels)
+        try:
+            yield
+        finally:
+            self.add(name, -1, **labels)
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, _labels_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {
+                    'buckets': list(buckets), 'counts': [0] * len(buckets), 'sum': 0, 'count': 0,
+                }
+            for index, bound in enumerate(histogram['buckets']):
+                if value <= bound:
+                    histogram['counts'][index] += 1
+                    break
+            histogram['sum'] += value
+            histogram['count'] += 1
+        self.flush()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+                'gauges': [[name, list(labels), value] for (name, labels), value in self._gauges.items()],
+                'histograms': [
+                    [name, list(labels), dict(h, counts=list(h['counts']))]
+                    for (name, labels), h in self._histograms.items()
+                ],
+            }
+
+    def flush(self, force=False):
+        """Write this process' snapshot for the scraper, throttled to FLUSH_INTERVAL."""
+        now = time.monotonic()
+        if not force and now - self._last_flush < FLUSH_INTERVAL:
+            return
+        self._last_flush = now
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f'{os.getpid()}.json')
+            tmp_path = f'{path}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            _logger.warning(f"Could not flush API metrics: {str(e)}")
+
+    def collect(self):
+        """Merge the snapshots of every worker into one snapshot."""
+        self.flush(force=True)
+        merged = {'counters': {}, 'gauges': {}, 'histograms': {}}
+        if not os.path.isdir(self.directory):
+            return merged
+
+        lock_file = open(os.path.join(self.directory, '.lock'), 'a')
+        try:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self._retire_dead_workers()
+            for filename in os.listdir(self.directory):
+                if not filename.endswith('.json'):
+                    continue
+                snapshot = self._read(os.path.join(self.directory, filename))
+                live = filename != 'retired.json' and self._is_alive(filename[:-5])
+                _merge(merged, snapshot, include_gauges=live)
+        finally:
+            lock_file.close()
+        return merged
+
+    def _retire_dead_workers(self):
+        retired_path = os.path.join(self.directory, 'retired.json')
+        retired = None
+        now = time.time()
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.json') or filename == 'retired.json':
+                continue
+            path = os.path.join(self.directory, filename)
+            if self._is_alive(filename[:-5]) or now - os.path.getmtime(path) < RETIRE_AFTER:
+                continue
+            if retired is None:
+                retired = {'counters': {}, 'gauges': {}, 'histograms': {}}
+                _merge(retired, self._read(retired_path), include_gauges=False)
+            _merge(retired, self._read(path), include_gauges=False)
+            os.unlink(path)
+        if retired is not None:
+            with open(retired_path, 'w') as f:
+                json.dump(_to_snapshot(retired), f)
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def _is_alive(pid):
+        try:
+            os.kill(int(pid), 0)
+        except (ValueError, ProcessLookupError):
+            return False
+        except PermissionError:
+            return True
+        return True
+
+
+def _merge(merged, snapshot, include_gauges):
+    for name, labels, value in snapshot.get('counters', []):
+        key = (name, tuple(map(tuple, labels)))
+        merged['counters'][key] = merged['counters'].get(key, 0) + value
+    if include_gauges:
+        for name, labels, value in snapshot.get('gauges', []):
+            key = (name, tuple(map(tuple, labels)))
+            merged['gauges'][key] = merged['gauges'].get(key, 0) + value
+    for name, labels, histogram in snapshot.get('histograms', []):
+        key = (name, tuple(map(tuple, labels)))
+        target = merged['histograms'].get(key)
+        if target is None:
+            merged['histograms'][key] = dict(histogram, counts=list(histogram['counts']))
+            continue
+        target['counts'] = [a + b for a, b in zip(target['counts'], histogram['counts'])]
+        target['sum'] += histogram['sum']
+        target['count'] += histogram['count']
+
+
+def _to_snapshot(merged):
+    return {
+        kind: [[name, list(labels), value] for (name, labels), value in merged[kind].items()]
+        for kind in ('counters', 'gauges', 'histograms')
+    }
+
+
+def render(merged):
+    """Return the merged snapshot in Prometheus text exposition format."""
+    by_name = {}
+    for kind in ('counters', 'gauges', 'histograms'):
+        for (name, labels), value in merged[kind].items():
+            by_name.setdefault(name, []).append((labels, value))
+
+    lines = []
+    for name in sorted(by_name):
+        metric_type, help_text = METRICS.get(name, ('untyped', ''))
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        for labels, value in sorted(by_name[name]):
+            if metric_type != 'histogram':
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+                continue
+            cumulative = 0
+            for bound, count in zip(value['buckets'], value['counts']):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", str(bound))])} {cumulative}')
+            lines.append(f'{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {value["count"]}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {value["sum"]}')
+            lines.append(f'{name}_count{_format_labels(labels)} {value["count"]}')
+    return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
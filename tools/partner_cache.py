@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""Per-worker LRU cache of partner stubs used by the API serializers.
+
+A stub is the part of a partner payload that does not depend on who asks:
+``id`` (linked user id, else partner id), ``user_id``, ``name`` and
+``partner_id``. Contact details are not cached, they stay subject to the
+caller's access rights.
+
+Entries are dropped locally as soon as a relevant ``res.partner`` or
+``res.users`` field is written. Other workers learn about the change through
+the ``messaging_partner_stub_seq`` sequence: it is bumped after the writing
+transaction commits and every worker compares it with the value it last saw,
+at most once per ``CHECK_INTERVAL``, clearing its whole cache when it moved.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+MAX_ENTRIES = 20000
+CHECK_INTERVAL = 1.0
+SEQUENCE = 'messaging_partner_stub_seq'
+
+# Fields whose change alters a stub.
+PARTNER_FIELDS = {'name', 'user_ids', 'active'}
+USER_FIELDS = {'partner_id', 'active'}
+
+
+class PartnerStubCache:
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._checked = {}
+
+    def _sync(self, cr):
+        """Clear the database's entries when another worker changed a partner."""
+        now = time.monotonic()
+        if now - self._checked.get(cr.dbname, 0.0) < CHECK_INTERVAL:
+            return
+        cr.execute(f"SELECT last_value FROM {SEQUENCE}")
+        generation = cr.fetchone()[0]
+        with self._lock:
+            if self._generations.get(cr.dbname) != generation:
+                self._clear(cr.dbname)
+                self._generations[cr.dbname] = generation
+            self._checked[cr.dbname] = now
+
+    def _clear(self, dbname):
+        for key in [key for key in self._entries if key[0] == dbname]:
+            del self._entries[key]
+
+    def get_many(self, env, partner_ids):
+        """Return {partner_id: stub}, loading every missing stub with one batch of reads."""
+        self._sync(env.cr)
+        dbname = env.cr.dbname
+        stubs, missing = {}, []
+        with self._lock:
+            for partner_id in dict.fromkeys(partner_ids):
+                stub = self._entries.get((dbname, partner_id))
+                if stub is None:
+                    missing.append(partner_id)
+                else:
+                    self._entries.move_to_end((dbname, partner_id))
+                    stubs[partner_id] = stub
+        if missing:
+            loaded = self._load(env, missing)
+            with self._lock:
+                for partner_id, stub in loaded.items():
+                    self._entries[(dbname, partner_id)] = stub
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            stubs.update(loaded)
+        return stubs
+
+    def get(self, env, partner_id):
+        return self.get_many(env, [partner_id]).get(partner_id)
+
+    def _load(self, env, partner_ids):
+        # user_ids is prefetched for the whole batch on first access.
+        partners = env['res.partner'].sudo().browse(partner_ids)
+        stubs = {}
+        for partner in partners.exists():
+            user = partner.user_ids[:1]
+            stubs[partner.id] = {
+                'id': user.id if user else partner.id,
+                'user_id': user.id if user else None,
+                'name': partner.name,
+                'partner_id': partner.id,
+            }
+        return stubs
+
+    def invalidate(self, dbname, partner_ids):
+        with self._lock:
+            for partner_id in partner_ids:
+                self._entries.pop((dbname, partner_id), None)
+
+    def signal(self, env):
+        """Bump the generation for other workers once the current transaction commits."""
+        cr = env.cr
+        if cr.postcommit.data.get('messaging_partner_stubs'):
+            return
+        cr.postcommit.data['messaging_partner_stubs'] = True
+        db_registry = env.registry
+
+        @cr.postcommit.add
+        def bump():
+            with db_registry.cursor() as bump_cr:
+                bump_cr.execute(f"SELECT nextval('{SEQUENCE}')")
+
+
+partner_stubs = PartnerStubCache()
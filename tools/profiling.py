@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""Per-request Python and SQL profiling for the API.
+
+A :class:`RequestProfiler` runs cProfile and registers a cursor query hook on
+the current thread, so every SQL statement executed while handling the request
+is recorded with its duration. Query parameters carry message bodies, phone
+numbers and tokens, so they are left out unless ``include_params`` is set.
+Reports are plain text files written under ``<data_dir>/messaging_api_profiles``;
+only the newest ``MAX_REPORTS`` are kept.
+
+Only one request per process runs cProfile at a time: on Python 3.12 it is
+process-wide and a second ``enable()`` raises. Requests profiled meanwhile,
+or when cProfile cannot start, get an SQL-only report.
+"""
+
+import cProfile
+import io
+import logging
+import os
+import pstats
+import re
+import threading
+import time
+from datetime import datetime
+
+from odoo.tools import config
+
+_logger = logging.getLogger(__name__)
+
+MAX_REPORTS = 200
+TOP_FUNCTIONS = 60
+
+_python_profile_lock = threading.Lock()
+
+
+def report_directory():
+    return os.path.join(config['data_dir'], 'messaging_api_profiles')
+
+
+class RequestProfiler:
+
+    def __init__(self, route, reason, include_params=False):
+        self.route = route
+        self.reason = reason
+        self.include_params = include_params
+        self.queries = []
+        self.elapsed = 0.0
+        self._profile = None
+        self._thread = None
+        self._start = None
+
+    def _query_hook(self, cr, query, params, query_start, query_time):
+        self.queries.append((query_time, query, params if self.include_params else None))
+
+    def start(self):
+        self._thread = threading.current_thread()
+        if not hasattr(self._thread, 'query_hooks'):
+            self._thread.query_hooks = []
+        self._thread.query_hooks.append(self._query_hook)
+        self._start = time.perf_counter()
+        if not _python_profile_lock.acquire(blocking=False):
+            return
+        try:
+            profile = cProfile.Profile()
+            profile.enable()
+        except Exception as e:
+            # Another profiler (a debugger, coverage) owns the interpreter hook.
+            _python_profile_lock.release()
+            _logger.warning(f"Python profiling unavailable, SQL only: {str(e)}")
+            return
+        self._profile = profile
+
+    def stop(self):
+        if self._start is None:
+            return
+        if self._profile:
+            self._profile.disable()
+            _python_profile_lock.release()
+        self.elapsed = time.perf_counter() - self._start
+        self._start = None
+        hooks = getattr(self._thread, 'query_hooks', [])
+        if self._query_hook in hooks:
+            hooks.remove(self._query_hook)
+
+    def write_report(self, login):
+        """Write the report to disk and return its file name."""
+        directory = report_directory()
+        os.makedirs(directory, exist_ok=True)
+        slug = re.sub(r'[^a-z0-9]+', '_', self.route.lower()).strip('_')
+        filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{slug}_{self.reason}.txt"
+
+        stats_buffer = io.StringIO()
+        if self._profile:
+            stats = pstats.Stats(self._profile, stream=stats_buffer)
+            stats.sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+        else:
+            stats_buffer.write('not captured: cProfile was busy with another request or unavailable\n')
+
+        sql_time = sum(q[0] for q in self.queries)
+        lines = [
+            f"route: {self.route}",
+            f"user: {login}",
+            f"reason: {self.reason}",
+            f"elapsed_ms: {self.elapsed * 1000:.1f}",
+            f"sql_queries: {len(self.queries)}",
+            f"sql_ms: {sql_time * 1000:.1f}",
+            '',
+            '== Python profile (cumulative) ==',
+            stats_buffer.getvalue(),
+            '== SQL statements (execution order) ==',
+        ]
+        for index, (query_time, query, params) in enumerate(self.queries, 1):
+            if isinstance(query, bytes):
+                query = query.decode(errors='replace')
+            line = f"#{index} {query_time * 1000:.2f}ms {query}"
+            if self.include_params:
+                line += f" -- params: {params!r}"
+            lines.append(line)
+
+        with open(os.path.join(directory, filename), 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        self._prune(directory)
+        return filename
+
+    @staticmethod
+    def _prune(directory):
+        reports = sorted(f for f in os.listdir(directory) if f.endswith('.txt'))
+        for filename in reports[:-MAX_REPORTS]:
+            try:
+                os.unlink(os.path.join(directory, filename))
+            except OSError:
+                pass
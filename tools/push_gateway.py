@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""Pluggable push notification providers used by the push queue.
+
+A provider receives a batch of ``{'id', 'token', 'platform', 'title', 'body',
+'data'}`` dicts, one per device (``id`` is the device id), and returns one
+:class:`PushResult` per device. ``state`` is ``sent``, ``invalid`` (the device
+token is no longer valid and is dropped) or ``retry`` (transient, the queue
+backs off and retries). Register additional providers with
+:func:`register_provider` and select one with the
+``messaging_api.push_provider`` system parameter.
+"""
+
+import random
+from collections import deque, namedtuple
+
+FAKE_OUTBOX_SIZE = 10000
+
+PushResult = namedtuple('PushResult', ['id', 'state', 'error'])
+
+_providers = {}
+
+
+def register_provider(provider_class):
+    _providers[provider_class.name] = provider_class
+    return provider_class
+
+
+def get_provider(env, name):
+    if name not in _providers:
+        raise ValueError(f"Unknown push provider '{name}'")
+    return _providers[name](env)
+
+
+class PushProvider:
+    """Base class for push notification providers."""
+
+    name = None
+    # Notifications per provider call, and sustained notifications per second.
+    batch_size = 500
+    rate_per_second = 500.0
+
+    def __init__(self, env):
+        self.env = env
+
+    def send_batch(self, notifications):
+        raise NotImplementedError
+
+
+@register_provider
+class FakePushProvider(PushProvider):
+    """Local provider that records pushes in memory, for development and load tests."""
+
+    name = 'fake'
+    batch_size = 1000
+    rate_per_second = 10000.0
+    # Latest sends only, so long load tests do not grow the worker's memory.
+    outbox = deque(maxlen=FAKE_OUTBOX_SIZE)
+
+    def send_batch(self, notifications):
+        failure_rate = float(self.env['ir.config_parameter'].sudo().get_param(
+            'messaging_api.push_fake_failure_rate', 0
+        ))
+        results = []
+        for notification in notifications:
+            if failure_rate and random.random() < failure_rate:
+                results.append(PushResult(notification['id'], 'retry', 'Simulated provider failure'))
+                continue
+            self.outbox.append(notification)
+            results.append(PushResult(notification['id'], 'sent', None))
+        return results
@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""Lean SQL read path for the read-only endpoints.
+
+Enabled with the ``messaging_api.read_path`` system parameter set to ``sql``;
+``/api/messaging/bootstrap`` always uses it, since batching is its purpose.
+Queries bypass the ORM and select exactly the columns the serializers
+need; thread membership, which is the API's access rule, is part of every
+query. They run on the replica configured with ``messaging_api_read_replica``
+in the server configuration file (a PostgreSQL URI or DSN; ``{db}`` is
+replaced by the database name) inside a READ ONLY transaction, or on the
+request cursor when no replica is configured.
+
+A replica lags behind the primary: a message may show up a little later on
+the read endpoints than on the write endpoints.
+"""
+
+from contextlib import contextmanager
+
+from odoo import sql_db
+from odoo.tools import config
+
+MEMBER_JOIN = """
+    JOIN messaging_thread_res_partner_rel member
+      ON member.messaging_thread_id = t.id AND member.res_partner_id = %(partner_id)s
+"""
+# A read watermark buffered by ``/message/read`` that the flush cron has not applied yet.
+PENDING_READ = """EXISTS (
+    SELECT 1 FROM messaging_read_receipt rr
+     WHERE rr.partner_id = %(partner_id)s AND rr.thread_id = m.thread_id AND rr.message_id >= m.id
+)"""
+UNREAD = f"m.is_read IS NOT TRUE AND m.author_id != %(partner_id)s AND NOT {PENDING_READ}"
+IS_READ = f"(m.is_read OR (m.author_id != %(partner_id)s AND {PENDING_READ})) AS is_read"
+
+
+@contextmanager
+def read_cursor(env):
+    """Yield a cursor for read-only queries: the replica's, else the request's."""
+    replica = config.get('messaging_api_read_replica')
+    if not replica:
+        yield env.cr
+        return
+
+    cr = sql_db.db_connect(replica.format(db=env.cr.dbname), allow_uri=True).cursor()
+    try:
+        cr.execute("SET TRANSACTION READ ONLY")
+        yield cr
+    finally:
+        cr.rollback()
+        cr.close()
+
+
+def fetch_dicts(cr):
+    columns = [description[0] for description in cr.description]
+    return [dict(zip(columns, row)) for row in cr.fetchall()]
+
+
+def thread_rows(cr, partner_id, fields, thread_type=None, search=None, unread_only=False, limit=None, after=None):
+    """Return the member's active threads, latest activity first, with only the requested summary columns.
+
+    ``after`` is the (last_message_date, id) key of the previous page's last
+    thread, the date as a string or None for threads without messages.
+    """
+    columns = [
+        't.id', 't.name', 't.thread_type', 't.participant_count', 't.large_group',
+        'member.last_message_date AS cursor_date',
+    ]
+    joins = []
+    conditions = ['t.active', '(%(thread_type)s::varchar IS NULL OR t.thread_type = %(thread_type)s)']
+    if 'last_message' in fields or 'last_message_date' in fields:
+        columns += [
+            'COALESCE(hot.body, cold.body) AS last_message',
+            'COALESCE(hot.create_date, cold.create_date) AS last_message_date',
+        ]
+        joins.append("""
+            LEFT JOIN LATERAL (
+                SELECT body, create_date FROM messaging_message
+                 WHERE thread_id = t.id ORDER BY create_date DESC LIMIT 1
+            ) hot ON true
+            LEFT JOIN LATERAL (
+                SELECT body, create_date FROM messaging_message_archive
+                 WHERE thread_id = t.id AND hot.create_date IS NULL AND t.last_message_date IS NOT NULL
+              ORDER BY create_date DESC LIMIT 1
+            ) cold ON true
+        """)
+    if 'unread_count' in fields:
+        columns.append(f"""
+            (SELECT count(*) FROM messaging_message m WHERE m.thread_id = t.id AND {UNREAD}) AS unread_count
+        """)
+    if search:
+        conditions.append('t.name ILIKE %(search)s')
+    if unread_only:
+        conditions.append(f'EXISTS (SELECT 1 FROM messaging_message m WHERE m.thread_id = t.id AND {UNREAD})')
+    after_date, after_id = after or (None, None)
+    # The member's copy of last_message_date is the sort key, so a page is a
+    # range of the (res_partner_id, last_message_date, thread) index.
+    if after and after_date is None:
+        conditions.append('member.last_message_date IS NULL AND member.messaging_thread_id < %(after_id)s')
+    elif after:
+        conditions.append("""(
+            member.last_message_date < %(after_date)s
+            OR (member.last_message_date = %(after_date)s AND member.messaging_thread_id < %(after_id)s)
+            OR member.last_message_date IS NULL
+        )""")
+
+    cr.execute(f"""
+        SELECT {', '.join(columns)}
+          FROM messaging_thread_res_partner_rel member
+          JOIN messaging_thread t ON t.id = member.messaging_thread_id
+          {' '.join(joins)}
+         WHERE member.res_partner_id = %(partner_id)s AND {' AND '.join(conditions)}
+      ORDER BY member.last_message_date DESC NULLS LAST, member.messaging_thread_id DESC
+         LIMIT %(limit)s
+    """, {
+        'partner_id': partner_id,
+        'thread_type': thread_type or None,
+        'search': f'%{search}%' if search else None,
+        'after_date': after_date,
+        'after_id': after_id,
+        'limit': limit,
+    })
+    return fetch_dicts(cr)
+
+
+def thread_participants(cr, thread_ids):
+    """Return {thread_id: [partner_id]} in the ORM's partner order."""
+    cr.execute("""
+        SELECT rel.messaging_thread_id, rel.res_partner_id
+          FROM messaging_thread_res_partner_rel rel
+          JOIN res_partner p ON p.id = rel.res_partner_id
+         WHERE rel.messaging_thread_id = ANY(%s)
+      ORDER BY p.complete_name, p.id DESC
+    """, (list(thread_ids),))
+    participants = {}
+    for thread_id, partner_id in cr.fetchall():
+        participants.setdefault(thread_id, []).append(partner_id)
+    return participants
+
+
+def participant_page(cr, thread_id, limit, offset):
+    """Return a page of a thread's partner ids in the ORM's partner order."""
+    cr.execute("""
+        SELECT rel.res_partner_id
+          FROM messaging_thread_res_partner_rel rel
+          JOIN res_partner p ON p.id = rel.res_partner_id
+         WHERE rel.messaging_thread_id = %s
+      ORDER BY p.complete_name, p.id DESC
+         LIMIT %s OFFSET %s
+    """, (thread_id, limit, offset))
+    return [row[0] for row in cr.fetchall()]
+
+
+def member_thread(cr, thread_id, partner_id):
+    """Return (exists, name) where name is None unless the partner is a member."""
+    cr.execute(f"""
+        SELECT t.name, member.res_partner_id IS NOT NULL
+          FROM messaging_thread t
+     LEFT {MEMBER_JOIN}
+         WHERE t.id = %(thread_id)s
+    """, {'thread_id': thread_id, 'partner_id': partner_id})
+    row = cr.fetchone()
+    if not row:
+        return False, None
+    return True, row[0] if row[1] else None
+
+
+def message_rows(cr, thread_id, partner_id, limit, offset):
+    """Return a newest-first page of a thread's messages, continuing into the archive."""
+    cr.execute(f"""
+        SELECT id, author_id, body, message_type, is_read, create_date, mail_message_id
+          FROM (
+                SELECT id, author_id, body, message_type, {IS_READ}, create_date, mail_message_id
+                  FROM messaging_message m WHERE thread_id = %(thread_id)s
+             UNION ALL
+                SELECT id, author_id, body, message_type, is_read, create_date, mail_message_id
+                  FROM messaging_message_archive WHERE thread_id = %(thread_id)s
+          ) m
+         WHERE EXISTS (
+                SELECT 1 FROM messaging_thread_res_partner_rel member
+                 WHERE member.messaging_thread_id = %(thread_id)s AND member.res_partner_id = %(partner_id)s
+          )
+      ORDER BY create_date DESC, id DESC
+         LIMIT %(limit)s OFFSET %(offset)s
+    """, {'thread_id': thread_id, 'partner_id': partner_id, 'limit': limit, 'offset': offset})
+    return fetch_dicts(cr)
+
+
+def latest_message_rows(cr, thread_ids, partner_id, limit):
+    """Return each member thread's ``limit`` newest messages, newest first, continuing into the archive."""
+    cr.execute(f"""
+        SELECT t.id AS thread_id, m.*
+          FROM messaging_thread t
+          {MEMBER_JOIN}
+          CROSS JOIN LATERAL (
+                SELECT id, author_id, body, message_type, is_read, create_date, mail_message_id
+                  FROM (
+                        (SELECT id, author_id, body, message_type, {IS_READ}, create_date, mail_message_id
+                           FROM messaging_message m WHERE thread_id = t.id
+                       ORDER BY create_date DESC, id DESC LIMIT %(limit)s)
+                     UNION ALL
+                        (SELECT id, author_id, body, message_type, is_read, create_date, mail_message_id
+                           FROM messaging_message_archive WHERE thread_id = t.id
+                       ORDER BY create_date DESC, id DESC LIMIT %(limit)s)
+                  ) latest
+              ORDER BY create_date DESC, id DESC
+                 LIMIT %(limit)s
+          ) m
+         WHERE t.id = ANY(%(thread_ids)s)
+      ORDER BY t.id, m.create_date DESC, m.id DESC
+    """, {'thread_ids': list(thread_ids), 'partner_id': partner_id, 'limit': limit})
+    return fetch_dicts(cr)
+
+
+def new_message_rows(cr, cursors, partner_id):
+    """Return messages newer than each thread's cursor ({thread_id: last_message_id}), oldest first."""
+    thread_ids = list(cursors)
+    cr.execute(f"""
+        SELECT m.id, m.thread_id, m.author_id, m.body, m.message_type, {IS_READ}, m.create_date,
+               m.mail_message_id
+          FROM messaging_message m
+          JOIN unnest(%(thread_ids)s::int[], %(last_ids)s::int[]) AS c(thread_id, last_id)
+            ON m.thread_id = c.thread_id AND m.id > c.last_id
+          JOIN messaging_thread t ON t.id = m.thread_id
+          {MEMBER_JOIN}
+      ORDER BY m.create_date, m.id
+    """, {
+        'thread_ids': thread_ids,
+        'last_ids': [cursors[thread_id] for thread_id in thread_ids],
+        'partner_id': partner_id,
+    })
+    return fetch_dicts(cr)
+
+
+def message_attachments(cr, message_ids, hot_relation):
+    """Return {message_id: [attachment row]} for hot and archived messages."""
+    relation, message_column, attachment_column = hot_relation
+    cr.execute(f"""
+        SELECT rel.message_id, a.id, a.name, a.mimetype, a.file_size, a.access_token
+          FROM (
+                SELECT "{message_column}" AS message_id, "{attachment_column}" AS attachment_id
+                  FROM "{relation}" WHERE "{message_column}" = ANY(%(ids)s)
+             UNION ALL
+                SELECT message_id, attachment_id
+                  FROM messaging_message_archive_attachment_rel WHERE message_id = ANY(%(ids)s)
+          ) rel
+          JOIN ir_attachment a ON a.id = rel.attachment_id
+      ORDER BY a.id DESC
+    """, {'ids': list(message_ids)})
+    attachments = {}
+    for row in fetch_dicts(cr):
+        attachments.setdefault(row.pop('message_id'), []).append(row)
+    return attachments
+
+
+def message_reactions(cr, mail_message_ids):
+    """Return {mail_message_id: [(content, partner_id)]} in reaction order."""
+    cr.execute("""
+        SELECT message_id, content, partner_id
+          FROM mail_message_reaction
+         WHERE message_id = ANY(%s)
+      ORDER BY id
+    """, (list(mail_message_ids),))
+    reactions = {}
+    for mail_message_id, content, partner_id in cr.fetchall():
+        reactions.setdefault(mail_message_id, []).append((content, partner_id))
+    return reactions
+
+
+def unread_counts(cr, partner_id, thread_ids):
+    """Return {thread_id: unread count} of the given threads, leaving out those with none."""
+    cr.execute(f"""
+        SELECT m.thread_id, count(*)
+          FROM messaging_message m
+         WHERE m.thread_id = ANY(%(thread_ids)s) AND {UNREAD}
+      GROUP BY m.thread_id
+    """, {'thread_ids': list(thread_ids), 'partner_id': partner_id})
+    return dict(cr.fetchall())
+
+
+def unread_by_thread(cr, partner_id):
+    """Return the member's active threads with unread messages and their counts."""
+    cr.execute(f"""
+        SELECT t.id, t.name, t.thread_type, count(*) AS unread_count
+          FROM messaging_thread t
+          {MEMBER_JOIN}
+          JOIN messaging_message m ON m.thread_id = t.id AND {UNREAD}
+         WHERE t.active
+      GROUP BY t.id
+      ORDER BY t.create_date DESC, t.id DESC
+    """, {'partner_id': partner_id})
+    return fetch_dicts(cr)
+
+
+def partner_last_seen(cr, partner_ids):
+    """Return {partner_id: last activity date} of the partners, as presence/update records it."""
+    cr.execute("SELECT id, write_date FROM res_partner WHERE id = ANY(%s)", (list(partner_ids),))
+    return dict(cr.fetchall())
+
+
+def change_head(cr):
+    """Return the sync horizon: the oldest transaction still running, below which the change log is final."""
+    cr.execute("SELECT txid_snapshot_xmin(txid_current_snapshot())")
+    return cr.fetchone()[0]
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""Pluggable outbound SMS providers used by the dispatcher.
+
+A gateway receives a batch of ``{'id', 'number', 'body'}`` dicts and returns
+one :class:`SmsResult` per message. ``state`` is ``sent``, ``failed``
+(permanent) or ``retry`` (transient, the dispatcher backs off and retries).
+Register additional providers with :func:`register_gateway` and select one
+with the ``messaging_api.sms_gateway`` system parameter.
+"""
+
+import logging
+import random
+import uuid
+from collections import deque, namedtuple
+
+_logger = logging.getLogger(__name__)
+
+FAKE_OUTBOX_SIZE = 10000
+
+SmsResult = namedtuple('SmsResult', ['message_id', 'state', 'provider_message_id', 'error'])
+
+_gateways = {}
+
+
+def register_gateway(gateway_class):
+    _gateways[gateway_class.name] = gateway_class
+    return gateway_class
+
+
+def get_gateway(env, name):
+    if name not in _gateways:
+        raise ValueError(f"Unknown SMS gateway '{name}'")
+    return _gateways[name](env)
+
+
+class SmsGateway:
+    """Base class for outbound SMS providers."""
+
+    name = None
+    # Messages per provider call, and sustained messages per second.
+    batch_size = 100
+    rate_per_second = 10.0
+
+    def __init__(self, env):
+        self.env = env
+
+    def send_batch(self, messages):
+        raise NotImplementedError
+
+
+@register_gateway
+class FakeSmsGateway(SmsGateway):
+    """Local provider that records sends in memory, for development and load tests."""
+
+    name = 'fake'
+    batch_size = 500
+    rate_per_second = 1000.0
+    # Latest sends only, so long load tests do not grow the worker's memory.
+    outbox = deque(maxlen=FAKE_OUTBOX_SIZE)
+
+    def send_batch(self, messages):
+        failure_rate = float(self.env['ir.config_parameter'].sudo().get_param(
+            'messaging_api.sms_fake_failure_rate', 0
+        ))
+        results = []
+        for message in messages:
+            if failure_rate and random.random() < failure_rate:
+                results.append(SmsResult(message['id'], 'retry', None, 'Simulated provider failure'))
+                continue
+            provider_message_id = f'fake-{uuid.uuid4().hex}'
+            self.outbox.append(dict(message, provider_message_id=provider_message_id))
+            results.append(SmsResult(message['id'], 'sent', provider_message_id, None))
+        return results
+
+
+@register_gateway
+class OdooSmsGateway(SmsGateway):
+    """Odoo IAP SMS, as used by the ``sms`` module."""
+
+    name = 'odoo'
+    batch_size = 100
+    rate_per_second = 20.0
+
+    RETRY_STATES = {'server_error'}
+
+    def send_batch(self, messages):
+        from odoo.addons.sms.tools.sms_api import SmsApi
+
+        uuids = {}
+        by_body = {}
+        for message in messages:
+            message_uuid = uuid.uuid4().hex
+            uuids[message_uuid] = message['id']
+            by_body.setdefault(message['body'], []).append({'uuid': message_uuid, 'number': message['number']})
+
+        # Messages sharing a body go out as one multi-recipient entry.
+        payload = [{'content': body, 'numbers': numbers} for body, numbers in by_body.items()]
+        response = SmsApi(self.env)._send_sms_batch(payload)
+
+        results = []
+        for item in response:
+            message_id = uuids.pop(item['uuid'], None)
+            if message_id is None:
+                continue
+            state = item.get('state')
+            if state == 'success':
+                results.append(SmsResult(message_id, 'sent', item['uuid'], None))
+            elif state in self.RETRY_STATES:
+                results.append(SmsResult(message_id, 'retry', None, state))
+            else:
+                results.append(SmsResult(message_id, 'failed', None, state))
+        for message_id in uuids.values():
+            results.append(SmsResult(message_id, 'retry', None, 'No provider response'))
+        return results